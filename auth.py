@@ -1,14 +1,15 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 from dotenv import load_dotenv
 
-from models import User, get_db
+from models import User, get_db, get_async_db
 
 load_dotenv()
 
@@ -16,19 +17,28 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+# Beheerders (komma-gescheiden gebruikersnamen), o.a. voor /admin/profiles
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 
+@lru_cache(maxsize=None)
+def _pwd_context():
+    # passlib pas laden bij de eerste login/registratie, niet bij het starten
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verificeer wachtwoord"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash een wachtwoord"""
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -39,6 +49,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -53,19 +65,40 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
-def get_current_user_from_cookie(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
-    """Haal de huidige gebruiker op uit de cookie"""
+def get_username_from_cookie(request: Request) -> Optional[str]:
+    """Lees de gebruikersnaam uit het JWT in de cookie"""
     token = request.cookies.get("access_token")
     if not token:
         return None
 
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
     except JWTError:
         return None
+    return payload.get("sub")
+
+
+def is_admin(username: Optional[str]) -> bool:
+    return username is not None and username in ADMIN_USERNAMES
+
+
+def require_admin(request: Request) -> str:
+    """Vereis een ingelogde beheerder; alleen de cookie, geen database lookup"""
+    username = get_username_from_cookie(request)
+    if username is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    if not is_admin(username):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return username
+
+
+def get_current_user_from_cookie(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
+    """Haal de huidige gebruiker op uit de cookie"""
+    username = get_username_from_cookie(request)
+    if username is None:
+        return None
 
     user = db.query(User).filter(User.username == username).first()
     return user
@@ -80,3 +113,24 @@ def get_current_user_required(request: Request, db: Session = Depends(get_db)) -
             detail="Not authenticated",
         )
     return user
+
+
+async def get_current_user_async(request: Request, db: AsyncSession = Depends(get_async_db)) -> Optional[User]:
+    """Haal de huidige gebruiker op uit de cookie (async sessie)"""
+    username = get_username_from_cookie(request)
+    if username is None:
+        return None
+
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def get_current_user_required_async(request: Request, db: AsyncSession = Depends(get_async_db)) -> User:
+    """Vereis dat een gebruiker is ingelogd (async sessie)"""
+    user = await get_current_user_async(request, db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+    return user
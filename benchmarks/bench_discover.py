@@ -0,0 +1,64 @@
+"""Meet de lokale discover engine op een catalogus van 100k films
+
+Gebruik: python benchmarks/bench_discover.py [aantal]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discover  # noqa: E402
+from models import MovieItem, SessionLocal, init_db  # noqa: E402
+
+GENRES = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37]
+LANGUAGES = ["en", "fr", "nl", "ja", "ko", "es", "de", "it", "hi", "zh"]
+
+
+def seed(count: int):
+    init_db()
+    rng = random.Random(42)
+    db = SessionLocal()
+    db.bulk_insert_mappings(MovieItem, [
+        {
+            "tmdb_id": i,
+            "title": f"Film {i}",
+            "release_date": f"{rng.randint(1920, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "original_language": rng.choice(LANGUAGES),
+            "genre_ids": ",".join(str(g) for g in rng.sample(GENRES, rng.randint(1, 3))),
+            "vote_average": round(rng.uniform(1, 9), 1),
+            "popularity": rng.expovariate(0.05),
+        }
+        for i in range(1, count + 1)
+    ])
+    db.commit()
+    db.close()
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<40} {(time.perf_counter() - started) * 1000:8.2f} ms")
+    return result
+
+
+async def main():
+    started = time.perf_counter()
+    index = await discover.get_index()
+    print(f"{'index opbouwen (' + str(index.size) + ' films)':<40} {(time.perf_counter() - started) * 1000:8.2f} ms")
+
+    timed("geen filters, populariteit", lambda: index.search())
+    timed("genre", lambda: index.search(genre=28))
+    timed("genre + jaar + taal, rating", lambda: index.search(genre=28, year=2020, language="en", sort_by="vote_average.desc"))
+    timed("taal, release datum oplopend, pagina 50", lambda: index.search(language="fr", sort_by="release_date.asc", offset=2000))
+
+
+if __name__ == "__main__":
+    seed(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
+    asyncio.run(main())
+    os.remove(DB_PATH)
@@ -0,0 +1,131 @@
+"""Vergelijkt de feed uit feed_entries met de feed via joins over reviews en user_movies
+
+Elke gebruiker volgt FOLLOWS anderen en heeft ACTIVITIES reviews/gekeken films.
+
+Gebruik: python benchmarks/bench_feed.py [gebruikers]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["CACHE_URL"] = "memory://"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, literal, union_all  # noqa: E402
+
+import feed  # noqa: E402
+from models import (  # noqa: E402
+    User, MovieItem, UserMovie, Review, Follow, Activity, FeedEntry, SessionLocal, async_read_session, init_db
+)
+
+FOLLOWS = 50
+ACTIVITIES = 20
+MOVIES = 5000
+READS = 200
+
+
+def seed(users: int):
+    init_db()
+    rng = random.Random(42)
+    db = SessionLocal()
+    db.bulk_insert_mappings(User, [
+        {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "hashed_password": "x", "follower_count": 0}
+        for i in range(1, users + 1)
+    ])
+    db.bulk_insert_mappings(MovieItem, [
+        {"id": i, "tmdb_id": i, "title": f"Film {i}", "poster_path": f"/{i}.jpg"} for i in range(1, MOVIES + 1)
+    ])
+
+    followers = {i: [] for i in range(1, users + 1)}
+    follows = []
+    for follower in range(1, users + 1):
+        for followee in rng.sample([i for i in range(1, users + 1) if i != follower], FOLLOWS):
+            follows.append({"follower_id": follower, "followee_id": followee})
+            followers[followee].append(follower)
+    db.bulk_insert_mappings(Follow, follows)
+
+    # Activiteit in volgorde van tijd, zoals in productie
+    start = datetime.utcnow() - timedelta(days=365)
+    events = sorted(
+        (rng.random(), user, rng.randint(1, MOVIES), rng.random() < 0.5)
+        for user in range(1, users + 1) for _ in range(ACTIVITIES)
+    )
+    reviews, watched, activities, entries = [], [], [], []
+    for activity_id, (offset, user, movie, is_review) in enumerate(events, start=1):
+        created_at = start + timedelta(days=365 * offset)
+        if is_review:
+            reviews.append({"user_id": user, "tmdb_id": movie, "rating": 7.0, "review_text": "review", "created_at": created_at})
+        else:
+            watched.append({"user_id": user, "movie_id": movie, "status": "watched", "added_at": created_at})
+        activities.append({
+            "id": activity_id, "user_id": user, "kind": "review" if is_review else "watched", "tmdb_id": movie,
+            "title": f"Film {movie}", "poster_path": f"/{movie}.jpg", "rating": 7.0 if is_review else None,
+            "review_text": "review" if is_review else None, "created_at": created_at,
+        })
+        entries.extend({"user_id": follower, "activity_id": activity_id} for follower in followers[user])
+    db.bulk_insert_mappings(Review, reviews)
+    db.bulk_insert_mappings(UserMovie, watched)
+    db.bulk_insert_mappings(Activity, activities)
+    db.bulk_insert_mappings(FeedEntry, entries)
+    db.commit()
+    db.close()
+    return len(activities), len(entries)
+
+
+async def join_feed(db, user_id: int):
+    """Zonder tijdlijnen: reviews en gekeken films van alle gevolgde gebruikers samenvoegen"""
+    followed = select(Follow.followee_id).where(Follow.follower_id == user_id)
+    reviews = select(
+        Review.user_id, literal("review").label("kind"), Review.tmdb_id, MovieItem.title, Review.created_at
+    ).join(MovieItem, MovieItem.tmdb_id == Review.tmdb_id).where(Review.user_id.in_(followed))
+    watched = select(
+        UserMovie.user_id, literal("watched").label("kind"), MovieItem.tmdb_id, MovieItem.title, UserMovie.added_at
+    ).join(MovieItem, MovieItem.id == UserMovie.movie_id).where(UserMovie.user_id.in_(followed), UserMovie.status == "watched")
+    combined = union_all(reviews, watched).subquery()
+    return (await db.execute(
+        select(combined, User.username).join(User, User.id == combined.c.user_id).order_by(combined.c.created_at.desc()).limit(feed.FEED_PAGE_SIZE)
+    )).all()
+
+
+async def measure(label: str, func, users: int):
+    rng = random.Random(7)
+    timings = []
+    async with async_read_session() as db:
+        for _ in range(READS):
+            user_id = rng.randint(1, users)
+            started = time.perf_counter()
+            await func(db, user_id)
+            timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<40} mediaan {statistics.median(timings):7.2f} ms   p95 {sorted(timings)[int(READS * 0.95)]:7.2f} ms")
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    started = time.perf_counter()
+    activities, entries = seed(users)
+    print(f"{users} gebruikers, {activities} activiteiten, {entries} tijdlijn regels ({time.perf_counter() - started:.1f}s)")
+
+    await measure("joins over reviews + user_movies", join_feed, users)
+    await measure("feed_entries (read_feed)", lambda db, user_id: feed.read_feed(db, user_id), users)
+
+    db = SessionLocal()
+    author = db.get(User, 1)
+    db.query(User).filter(User.id == 1).update({"follower_count": FOLLOWS})
+    db.refresh(author)
+    started = time.perf_counter()
+    for _ in range(100):
+        feed.record_activity(db, author, "watched", tmdb_id=1, title="Film 1")
+    db.commit()
+    print(f"{'fan-out naar ' + str(FOLLOWS) + ' volgers':<40} {(time.perf_counter() - started) * 10:7.2f} ms per activiteit")
+    db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Vergelijk ORM objecten met de read-only query laag op een lijst van 10k films
+
+Gebruik: python benchmarks/bench_read_path.py [aantal]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+import queries  # noqa: E402
+from models import (  # noqa: E402
+    AsyncSessionLocal, Base, CustomList, MovieItem, SessionLocal, User, UserMovie, engine
+)
+
+
+def seed(count: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    custom_list = CustomList(user_id=user.id, name="Bench")
+    db.add(custom_list)
+    db.flush()
+    list_id = custom_list.id
+    db.bulk_insert_mappings(MovieItem, [
+        {"id": i, "tmdb_id": i, "title": f"Film {i}", "poster_path": f"/poster{i}.jpg"}
+        for i in range(1, count + 1)
+    ])
+    db.bulk_insert_mappings(UserMovie, [
+        {"user_id": user.id, "movie_id": i, "status": "custom", "custom_list_id": custom_list.id}
+        for i in range(1, count + 1)
+    ])
+    db.commit()
+    db.close()
+    return list_id
+
+
+async def load_orm(list_id: int, count: int):
+    async with AsyncSessionLocal() as db:
+        user_movies = (await db.execute(
+            select(UserMovie).options(joinedload(UserMovie.movie))
+            .where(UserMovie.custom_list_id == list_id).limit(count)
+        )).scalars().all()
+        return [
+            {"id": um.movie.tmdb_id, "title": um.movie.title, "poster_path": um.movie.poster_path}
+            for um in user_movies
+        ]
+
+
+async def load_rows(list_id: int, count: int):
+    async with AsyncSessionLocal() as db:
+        return await queries.list_movies(db, list_id, 0, count)
+
+
+def measure(label: str, coro_factory):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = asyncio.run(coro_factory())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<6} {len(result):>7} rijen  {elapsed * 1000:8.1f} ms  piekgeheugen {peak / 1024 / 1024:6.2f} MiB")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    list_id = seed(count)
+    measure("orm", lambda: load_orm(list_id, count))
+    measure("rows", lambda: load_rows(list_id, count))
+    os.remove(DB_PATH)
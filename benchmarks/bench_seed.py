@@ -0,0 +1,72 @@
+"""Meet het vullen van de catalogus vanuit een TMDB ID export
+
+Maakt een fixture in het formaat van movie_ids_MM_DD_YYYY.json.gz, laadt
+die, breekt een tweede run halverwege af en hervat hem vanaf het checkpoint.
+
+Gebruik: python benchmarks/bench_seed.py [aantal regels]
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR, 'bench.db')}"
+os.environ["CACHE_URL"] = "memory://"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seed  # noqa: E402
+from models import MovieItem, SessionLocal, init_db  # noqa: E402
+
+
+def write_fixture(path: str, count: int):
+    rng = random.Random(42)
+    with gzip.open(path, "wt", encoding="utf-8") as fixture:
+        for tmdb_id in range(1, count + 1):
+            fixture.write(json.dumps({
+                "adult": rng.random() < 0.02,
+                "id": tmdb_id,
+                "original_title": f"Film {tmdb_id}",
+                # Zoals in de echte export: de meeste films hebben een lage populariteit
+                "popularity": round(rng.paretovariate(1.5) - 0.4, 3),
+                "video": rng.random() < 0.01,
+            }) + "\n")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(TMP_DIR, "movie_ids.json.gz")
+    write_fixture(path, count)
+    print(f"fixture: {count} regels, {os.path.getsize(path) / 1e6:.1f} MB gzip")
+    init_db()
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    counts = seed.seed_catalog(db, path, min_popularity=1.0)
+    print(f"{'eerste run':<20} {time.perf_counter() - started:8.1f} s  {counts}")
+
+    # Tweede run met een crash halverwege: hervatten vanaf het laatste checkpoint
+    saved = {}
+
+    def checkpoint(seed_db, lines, progress):
+        if lines >= count // 2:
+            raise KeyboardInterrupt  # deze batch wordt niet gecommit
+        saved.update(lines=lines, counts=dict(progress))
+
+    try:
+        seed.seed_catalog(db, path, min_popularity=1.0, checkpoint=checkpoint)
+    except KeyboardInterrupt:
+        db.rollback()
+    started = time.perf_counter()
+    counts = seed.seed_catalog(db, path, min_popularity=1.0, start=saved["lines"],
+                               counts=saved["counts"])
+    print(f"{'hervat':<20} {time.perf_counter() - started:8.1f} s  {counts}")
+    print(f"movie_items: {db.query(MovieItem).count()}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Meet de cold start van een worker
+
+- migratie: python migrate.py op een lege database
+- import:   python -c "import main" (mediaan van een paar runs)
+- live/ready: uvicorn starten tot /health/live en /health/ready 200 geven
+
+Gebruik: python benchmarks/bench_startup.py [runs]
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp()
+ENV = dict(
+    os.environ,
+    DATABASE_URL=f"sqlite:///{os.path.join(TMP_DIR, 'bench.db')}",
+    CACHE_URL="memory://",
+    TEMPLATE_CACHE_DIR=os.path.join(TMP_DIR, "jinja"),
+)
+
+
+def run(args) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, env=ENV, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=0.5).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def serve() -> tuple:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=ENV, stdout=subprocess.DEVNULL
+    )
+    try:
+        live = wait_for(f"http://127.0.0.1:{port}/health/live", started + 30)
+        ready = wait_for(f"http://127.0.0.1:{port}/health/ready", started + 30)
+    finally:
+        server.terminate()
+        server.wait()
+    return (live - started) * 1000, (ready - started) * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'migratie (lege database)':<32} {run(['migrate.py']):8.1f} ms")
+    print(f"{'migratie (al bijgewerkt)':<32} {run(['migrate.py']):8.1f} ms")
+
+    imports = [run(["-c", "import main"]) for _ in range(runs)]
+    print(f"{'import main':<32} {statistics.median(imports):8.1f} ms")
+
+    timings = [serve() for _ in range(runs)]
+    print(f"{'uvicorn tot /health/live':<32} {statistics.median(t[0] for t in timings):8.1f} ms")
+    print(f"{'uvicorn tot /health/ready':<32} {statistics.median(t[1] for t in timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Meet /profile/stats voor een gebruiker met veel gelogde films
+
+Gebruik: python benchmarks/bench_stats.py [aantal]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["CACHE_URL"] = "memory://"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stats  # noqa: E402
+from cache import invalidate_stats  # noqa: E402
+from models import AsyncSessionLocal, MovieItem, Review, SessionLocal, User, UserMovie, init_db  # noqa: E402
+
+LANGUAGES = ["en", "fr", "nl", "ja", "ko", "es", "de", "it"]
+
+
+def seed(count: int) -> int:
+    init_db()
+    rng = random.Random(42)
+    db = SessionLocal()
+    users = [User(username=f"bench{i}", email=f"bench{i}@example.com", hashed_password="x") for i in range(2)]
+    db.add_all(users)
+    db.flush()
+    user_id, other_id = users[0].id, users[1].id
+    start = datetime(2015, 1, 1)
+    db.bulk_insert_mappings(MovieItem, [
+        {
+            "id": i, "tmdb_id": i, "title": f"Film {i}",
+            "runtime": rng.randint(80, 180),
+            "original_language": rng.choice(LANGUAGES),
+            "genre_ids": ",".join(str(g) for g in rng.sample([18, 28, 35, 53, 27, 878, 10749, 99], 2)),
+            "vote_average": round(rng.uniform(4, 9), 1),
+        }
+        for i in range(1, count + 1)
+    ])
+    db.bulk_insert_mappings(UserMovie, [
+        {"user_id": user_id, "movie_id": i, "status": "watched",
+         "added_at": start + timedelta(days=rng.randint(0, 3650))}
+        for i in range(1, count + 1)
+    ])
+    db.bulk_insert_mappings(Review, [
+        {"user_id": uid, "tmdb_id": i, "rating": rng.randint(1, 10)}
+        for uid in (user_id, other_id) for i in range(1, count + 1, 2)
+    ])
+    db.commit()
+    db.close()
+    return user_id
+
+
+async def measure(user_id: int):
+    async with AsyncSessionLocal() as db:
+        for label in ("koud", "warm", "na wijziging"):
+            if label == "na wijziging":
+                invalidate_stats(user_id)
+            started = time.perf_counter()
+            result = await stats.get_user_stats(db, user_id)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<12} {result['total_watched']:>7} films  {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    user_id = seed(count)
+    asyncio.run(measure(user_id))
+    os.remove(DB_PATH)
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from fastapi import Request
+
+
+# Configuration
+FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", "600"))
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "2000"))
+PAGE_CACHE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", "60"))
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+CACHE_PURGE_CHANCE = float(os.getenv("CACHE_PURGE_CHANCE", "0.001"))  # kans per set() op opruimen (SQLite)
+TEMPLATE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "moviespace-jinja")
+)
+
+
+class MemoryCache:
+    """Thread-safe in-process cache met TTL en LRU-limiet"""
+
+    def __init__(self, max_entries: int = 1000, default_ttl: int = 300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                ttl = self.default_ttl if ttl is None else ttl
+                entry = (time.monotonic() + ttl, 0)
+            value = entry[1] + amount
+            self._data[key] = (entry[0], value)
+            self._data.move_to_end(key)
+            return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """Gedeelde cache in een SQLite bestand, bruikbaar over meerdere workers heen
+
+    Waarden worden als JSON opgeslagen. Elke thread (en elk geforkt proces)
+    krijgt een eigen connectie. Verlopen rijen worden overgeslagen bij het
+    lezen en af en toe (CACHE_PURGE_CHANCE per set) in één keer verwijderd.
+    """
+
+    def __init__(self, path: str, default_ttl: int = 300):
+        self.path = path
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl),
+        )
+        if random.random() < CACHE_PURGE_CHANCE:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        ttl = self.default_ttl if ttl is None else ttl
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or row[1] < now:
+                value, expires_at = amount, now + ttl
+            else:
+                value, expires_at = json.loads(row[0]) + amount, row[1]
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+
+class RedisCache:
+    """Gedeelde cache in Redis (of een Redis-compatibele store)"""
+
+    def __init__(self, url: str, default_ttl: int = 300):
+        import redis
+
+        self.default_ttl = default_ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self._client.set(key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        ttl = self.default_ttl if ttl is None else ttl
+        value = self._client.incrby(key, amount)
+        if value == amount:
+            self._client.expire(key, max(int(ttl), 1))
+        return value
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def clear(self):
+        self._client.flushdb()
+
+
+def create_cache(url: str = CACHE_URL, default_ttl: int = 300):
+    """Maak een cache backend op basis van een URL
+
+    memory://               in-process (standaard, alleen voor één worker)
+    sqlite:///pad/naar.db   gedeeld SQLite bestand
+    redis://host:6379/0     Redis-compatibele store
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):], default_ttl=default_ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, default_ttl=default_ttl)
+    if url.startswith("memory://"):
+        return MemoryCache(default_ttl=default_ttl)
+    raise ValueError(f"Onbekende CACHE_URL: {url}")
+
+
+# Gedeelde cache voor TMDB responses en rate limits
+shared_cache = create_cache()
+
+fragment_cache = MemoryCache(max_entries=FRAGMENT_CACHE_MAX_ENTRIES, default_ttl=FRAGMENT_CACHE_TTL)
+
+
+def data_version(*parts) -> str:
+    """Korte, stabiele hash van de data waarop een fragment of pagina gebaseerd is"""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def stats_cache_key(user_id: int) -> str:
+    return f"stats:{user_id}"
+
+
+def invalidate_stats(user_id: int):
+    """Aanroepen na elke wijziging van watched films of reviews van een gebruiker
+
+    Staat hier en niet in stats.py, zodat invalideren NumPy niet laadt.
+    """
+    shared_cache.delete(stats_cache_key(user_id))
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja tag voor fragment caching: {% cache "naam", versie, ... %}...{% endcache %}
+
+    Het fragment wordt bewaard onder de naam plus een hash van de overige
+    argumenten, zodat een nieuwe dataversie automatisch een nieuwe render geeft.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cache_support", [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, args, caller):
+        name, keys = args[0], args[1:]
+        key = f"fragment:{name}:{data_version(*keys)}"
+        rendered = fragment_cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            fragment_cache.set(key, rendered)
+        return rendered
+
+
+def configure_templates(templates):
+    """Zet bytecode caching en fragment caching aan op een Jinja2Templates instantie"""
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    templates.env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    templates.env.add_extension(FragmentCacheExtension)
+    return templates
+
+
+def etag_for(body: bytes) -> str:
+    """Sterke ETag op basis van de gerenderde inhoud"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Controleer of de If-None-Match header van de client de ETag bevat"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
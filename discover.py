@@ -0,0 +1,233 @@
+"""Lokale discover engine over de opgeslagen film metadata
+
+De catalogus staat per worker in het geheugen als kolommen (NumPy arrays):
+één bitmask per film voor de genres, een categorie-index voor de taal en
+het jaar als integer. Filters zijn AND-operaties op die kolommen en de
+facet tellingen zijn bincounts, dus een combinatie van filters kost een
+paar milliseconden en geen TMDB call. TMDB wordt alleen gebruikt om de
+catalogus te laten groeien (zie grow_catalog).
+"""
+import asyncio
+import os
+import time
+from typing import List, NamedTuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cache import shared_cache
+from models import MovieItem, async_read_session
+from queries import MovieRow
+from tmdb import tmdb_request, movie_fields, BACKGROUND
+
+
+# Configuration
+DISCOVER_REFRESH_INTERVAL = int(os.getenv("DISCOVER_REFRESH_INTERVAL", "300"))
+DISCOVER_MIN_CATALOG = int(os.getenv("DISCOVER_MIN_CATALOG", "500"))  # daaronder: TMDB discover
+DISCOVER_PAGE_SIZE = 40
+CATALOG_GROW_PAGES = int(os.getenv("CATALOG_GROW_PAGES", "5"))
+
+SORT_COLUMNS = {"popularity": "popularity", "vote_average": "vote_average", "release_date": "release"}
+
+
+class DiscoverResult(NamedTuple):
+    movies: List[MovieRow]
+    total: int
+    genre_counts: dict
+    language_counts: dict
+    year_counts: dict
+
+
+class CatalogIndex:
+    """Kolommen van de catalogus; wordt in zijn geheel vervangen bij een refresh"""
+
+    def __init__(self, rows):
+        count = len(rows)
+        self.size = count
+        self.tmdb_id = np.empty(count, dtype=np.int64)
+        self.popularity = np.zeros(count, dtype=np.float32)
+        self.vote_average = np.zeros(count, dtype=np.float32)
+        self.release = np.zeros(count, dtype=np.int32)  # YYYYMMDD, 0 = onbekend
+        self.year = np.zeros(count, dtype=np.int16)
+        self.genre_mask = np.zeros(count, dtype=np.uint64)
+        self.language = np.zeros(count, dtype=np.int16)
+        self.titles = []
+        self.posters = []
+        self.release_dates = []
+
+        self.genre_bits = {}  # TMDB genre id -> bit positie
+        self.languages = [""]  # index 0 = onbekend
+        language_index = {"": 0}
+
+        for i, (tmdb_id, title, poster_path, release_date, language, genre_ids, vote_average, popularity) in enumerate(rows):
+            self.tmdb_id[i] = tmdb_id
+            self.titles.append(title)
+            self.posters.append(poster_path)
+            self.release_dates.append(release_date)
+            self.popularity[i] = popularity or 0
+            self.vote_average[i] = vote_average or 0
+            if release_date and len(release_date) >= 10:
+                self.release[i] = int(release_date[:4] + release_date[5:7] + release_date[8:10])
+                self.year[i] = int(release_date[:4])
+
+            language = language or ""
+            if language not in language_index:
+                language_index[language] = len(self.languages)
+                self.languages.append(language)
+            self.language[i] = language_index[language]
+
+            mask = 0
+            for genre_id in (genre_ids or "").split(","):
+                if not genre_id:
+                    continue
+                bit = self.genre_bits.setdefault(int(genre_id), len(self.genre_bits))
+                if bit < 64:
+                    mask |= 1 << bit
+            self.genre_mask[i] = mask
+
+    def _filter(self, genre: int = None, year: int = None, language: str = None):
+        """Maskers per filter, zodat elke facet zonder zijn eigen filter geteld kan worden"""
+        everything = np.ones(self.size, dtype=bool)
+        masks = {"genre": everything, "year": everything, "language": everything}
+        if genre is not None:
+            bit = self.genre_bits.get(genre)
+            masks["genre"] = (
+                (self.genre_mask & np.uint64(1 << bit)) != 0 if bit is not None and bit < 64
+                else np.zeros(self.size, dtype=bool)
+            )
+        if year is not None:
+            masks["year"] = self.year == year
+        if language is not None:
+            index = self.languages.index(language) if language in self.languages else -1
+            masks["language"] = self.language == index
+        return masks
+
+    def search(self, genre: int = None, year: int = None, language: str = None,
+               sort_by: str = "popularity.desc", offset: int = 0, limit: int = DISCOVER_PAGE_SIZE) -> DiscoverResult:
+        masks = self._filter(genre, year, language)
+        selected = masks["genre"] & masks["year"] & masks["language"]
+
+        # Facet tellingen: elke facet met de andere twee filters toegepast
+        without_genre = np.flatnonzero(masks["year"] & masks["language"])
+        genre_masks = self.genre_mask[without_genre]
+        genre_counts = {
+            genre_id: int(np.count_nonzero(genre_masks & np.uint64(1 << bit)))
+            for genre_id, bit in self.genre_bits.items() if bit < 64
+        }
+        language_counts = np.bincount(self.language[masks["genre"] & masks["year"]], minlength=len(self.languages))
+        year_values, year_counts = np.unique(self.year[masks["genre"] & masks["language"]], return_counts=True)
+
+        # Sorteren: alleen de gevraagde pagina volledig ordenen
+        field, _, direction = sort_by.partition(".")
+        column = getattr(self, SORT_COLUMNS.get(field, "popularity"))
+        indices = np.flatnonzero(selected)
+        keys = column[indices] if direction == "asc" else -column[indices].astype(np.float64)
+        if field == "release_date" and direction == "asc":
+            # Onbekende datums achteraan, net als bij TMDB
+            keys = np.where(column[indices] == 0, np.iinfo(np.int32).max, keys)
+        end = min(offset + limit, len(indices))
+        if end <= offset:
+            page = indices[:0]
+        elif end < len(indices):
+            partitioned = np.argpartition(keys, end - 1)[:end]
+            page = indices[partitioned[np.argsort(keys[partitioned], kind="stable")]][offset:end]
+        else:
+            page = indices[np.argsort(keys, kind="stable")][offset:end]
+
+        movies = [
+            MovieRow(
+                int(self.tmdb_id[i]), self.titles[i], self.posters[i],
+                float(self.vote_average[i]), self.release_dates[i]
+            )
+            for i in page
+        ]
+        return DiscoverResult(
+            movies=movies,
+            total=len(indices),
+            genre_counts=genre_counts,
+            language_counts={
+                self.languages[i]: int(count) for i, count in enumerate(language_counts) if count and self.languages[i]
+            },
+            year_counts={int(y): int(c) for y, c in zip(year_values, year_counts) if y},
+        )
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = asyncio.Lock()
+_refresh_tasks = set()  # referentie houden, anders kan de GC een lopende rebuild opruimen
+
+
+async def _rebuild_index():
+    """Laad de catalogus en bouw de kolommen in een thread, zodat de event loop vrij blijft"""
+    global _index, _index_built_at
+    async with _index_lock:
+        if _index is not None and time.time() - _index_built_at < DISCOVER_REFRESH_INTERVAL:
+            return
+        async with async_read_session() as db:
+            rows = (await db.execute(
+                select(
+                    MovieItem.tmdb_id, MovieItem.title, MovieItem.poster_path, MovieItem.release_date,
+                    MovieItem.original_language, MovieItem.genre_ids, MovieItem.vote_average, MovieItem.popularity
+                ).where(MovieItem.genre_ids.isnot(None))
+            )).all()
+        _index = await asyncio.to_thread(CatalogIndex, rows)
+        _index_built_at = time.time()
+
+
+def _refresh_done(task: asyncio.Task):
+    _refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Discover index niet vernieuwd: {task.exception()}")
+
+
+async def get_index() -> CatalogIndex:
+    """Index van deze worker
+
+    Alleen de allereerste request wacht op het opbouwen. Daarna wordt een
+    verouderde index (ouder dan DISCOVER_REFRESH_INTERVAL) op de achtergrond
+    vervangen en blijft de oude tot dan bruikbaar.
+    """
+    if _index is None:
+        await _rebuild_index()
+    elif time.time() - _index_built_at >= DISCOVER_REFRESH_INTERVAL and not _index_lock.locked() and not _refresh_tasks:
+        task = asyncio.get_running_loop().create_task(_rebuild_index())
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_done)
+    return _index
+
+
+def grow_catalog(db: Session, pages: int = CATALOG_GROW_PAGES) -> dict:
+    """Voeg de volgende pagina's van TMDB discover toe aan de catalogus (job worker)"""
+    start_page = shared_cache.get("discover:next_page") or 1
+    next_page = start_page
+    added = updated = 0
+    for page in range(start_page, start_page + pages):
+        data = tmdb_request("/discover/movie", {"sort_by": "popularity.desc", "page": page}, priority=BACKGROUND)
+        if data is None:
+            break  # TMDB niet bereikbaar: volgende keer vanaf deze pagina
+        results = {movie["id"]: movie for movie in data.get("results", [])}
+        existing = {
+            movie_item.tmdb_id: movie_item
+            for movie_item in db.query(MovieItem).filter(MovieItem.tmdb_id.in_(list(results)))
+        }
+        for tmdb_id, movie in results.items():
+            fields = movie_fields(movie)
+            if tmdb_id in existing:
+                # Populariteit en rating veranderen; runtime komt alleen uit de details
+                movie_item = existing[tmdb_id]
+                for field in ("popularity", "vote_average", "poster_path", "release_date", "original_language", "genre_ids"):
+                    setattr(movie_item, field, fields[field])
+                updated += 1
+            else:
+                db.add(MovieItem(tmdb_id=tmdb_id, **fields))
+                added += 1
+        db.commit()
+
+        # TMDB geeft hooguit 500 pagina's; daarna opnieuw bij de populairste beginnen
+        next_page = page + 1 if page < min(data.get("total_pages") or 0, 500) else 1
+        if next_page == 1:
+            break
+    shared_cache.set("discover:next_page", next_page, ttl=60 * 60 * 24 * 30)
+    return {"added": added, "updated": updated, "next_page": next_page}
@@ -0,0 +1,111 @@
+"""Streaming export van watchlist, gekeken films, reviews en custom lists
+
+Rijen komen via een server-side cursor binnen in partities van
+EXPORT_CHUNK_SIZE en gaan per partitie naar de client, zodat het
+geheugengebruik niet meegroeit met de grootte van de collectie.
+"""
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator
+
+from sqlalchemy import select
+
+from models import AsyncSessionLocal, MovieItem, UserMovie, Review
+
+
+# Configuration
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# Zelfde kolommen als een Letterboxd export (zie watchlist.csv)
+LIST_COLUMNS = ["Date", "Name", "Year", "Letterboxd URI"]
+REVIEW_COLUMNS = ["Date", "Name", "Year", "Letterboxd URI", "Rating", "Review"]
+
+
+def letterboxd_uri(tmdb_id: int) -> str:
+    """Letterboxd stuurt /tmdb/<id> door naar de juiste filmpagina"""
+    return f"https://letterboxd.com/tmdb/{tmdb_id}/"
+
+
+def _movies_query(user_id: int, status: str = None, custom_list_id: int = None):
+    query = select(
+        UserMovie.added_at, MovieItem.title, MovieItem.release_date, MovieItem.tmdb_id
+    ).join(MovieItem, MovieItem.id == UserMovie.movie_id).where(UserMovie.user_id == user_id)
+    if custom_list_id is not None:
+        query = query.where(UserMovie.custom_list_id == custom_list_id)
+    else:
+        query = query.where(UserMovie.status == status)
+    return query.order_by(UserMovie.id)
+
+
+def _reviews_query(user_id: int):
+    return select(
+        Review.updated_at, MovieItem.title, MovieItem.release_date, Review.tmdb_id,
+        Review.rating, Review.review_text
+    ).outerjoin(MovieItem, MovieItem.tmdb_id == Review.tmdb_id).where(
+        Review.user_id == user_id
+    ).order_by(Review.id)
+
+
+def _movie_record(row) -> dict:
+    added_at, title, release_date, tmdb_id = row[:4]
+    return {
+        "date": added_at.date().isoformat() if added_at else "",
+        "name": title or "",
+        "year": (release_date or "")[:4],
+        "tmdb_id": tmdb_id,
+        "letterboxd_uri": letterboxd_uri(tmdb_id),
+    }
+
+
+def _review_record(row) -> dict:
+    record = _movie_record(row)
+    record["rating"] = row[4]  # 1-10
+    record["review"] = row[5] or ""
+    return record
+
+
+def _csv_row(record: dict, with_review: bool) -> list:
+    values = [record["date"], record["name"], record["year"], record["letterboxd_uri"]]
+    if with_review:
+        # Letterboxd gebruikt 0.5-5 sterren
+        values += [record["rating"] / 2, record["review"]]
+    return values
+
+
+async def stream_export(query, to_record, fmt: str, with_review: bool = False) -> AsyncIterator[str]:
+    """Genereer de export per partitie; opent een eigen sessie die tot het einde van de stream leeft"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(REVIEW_COLUMNS if with_review else LIST_COLUMNS)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for partition in result.partitions():
+            for row in partition:
+                record = to_record(row)
+                if fmt == "csv":
+                    writer.writerow(_csv_row(record, with_review))
+                else:
+                    buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_movies(user_id: int, fmt: str, status: str = None, custom_list_id: int = None):
+    return stream_export(_movies_query(user_id, status, custom_list_id), _movie_record, fmt)
+
+
+def export_reviews(user_id: int, fmt: str):
+    return stream_export(_reviews_query(user_id), _review_record, fmt, with_review=True)
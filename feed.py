@@ -0,0 +1,255 @@
+"""Activiteit van gevolgde gebruikers (reviews en gekeken films)
+
+Fan-out-on-write: een nieuwe activiteit komt met één INSERT ... SELECT in de
+tijdlijn (feed_entries) van elke volger. Een feed lezen is daarna één range
+scan over de primary key (user_id, activity_id), nieuwste eerst, met een
+lookup per activiteit op zijn primary key.
+
+Accounts met meer dan FEED_FANOUT_LIMIT volgers worden niet uitgeschreven;
+hun activiteit haalt read_feed bij het lezen op via de index op
+activities (user_id, id). De periodieke trim_feeds job begrenst elke
+tijdlijn op FEED_MAX_ENTRIES regels.
+"""
+import os
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, insert, func, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import User, MovieItem, Follow, Activity, FeedEntry
+
+
+# Configuration
+FEED_MAX_ENTRIES = int(os.getenv("FEED_MAX_ENTRIES", "500"))
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", "1000"))  # meer volgers: fan-out-on-read
+FEED_BACKFILL = 50  # recente activiteiten in je tijdlijn zodra je iemand volgt
+FEED_IMPORT_MAX = 20  # per import, anders verdringt één CSV de hele tijdlijn van je volgers
+FEED_PAGE_SIZE = 30
+
+
+class FeedRow(NamedTuple):
+    id: int
+    username: str
+    kind: str
+    tmdb_id: Optional[int]
+    title: Optional[str]
+    poster_path: Optional[str]
+    rating: Optional[float]
+    review_text: Optional[str]
+    count: Optional[int]
+    created_at: datetime
+
+
+FEED_COLUMNS = (
+    Activity.id, User.username, Activity.kind, Activity.tmdb_id, Activity.title, Activity.poster_path,
+    Activity.rating, Activity.review_text, Activity.count, Activity.created_at,
+)
+
+
+def _fans_out(user: User) -> bool:
+    return (user.follower_count or 0) <= FEED_FANOUT_LIMIT
+
+
+def _fan_out(db: Session, user: User, activity: Activity):
+    """Activiteit in de tijdlijn van alle volgers, in één statement"""
+    if not _fans_out(user):
+        return  # populair account: read_feed haalt het op
+    db.execute(insert(FeedEntry).from_select(
+        ["user_id", "activity_id"],
+        select(Follow.follower_id, literal(activity.id)).where(Follow.followee_id == user.id)
+    ))
+
+
+def record_activity(db: Session, user: User, kind: str, movie_item: MovieItem = None, **fields) -> Activity:
+    """Sla een activiteit op en schrijf die uit naar de volgers; commit doet de aanroeper"""
+    activity = Activity(user_id=user.id, kind=kind, **fields)
+    if movie_item is not None:
+        activity.tmdb_id = movie_item.tmdb_id
+        activity.title = movie_item.title
+        activity.poster_path = movie_item.poster_path
+    db.add(activity)
+    db.flush()
+    _fan_out(db, user, activity)
+    return activity
+
+
+def record_review(db: Session, user: User, tmdb_id: int, rating: float, review_text: str):
+    """Een aangepaste review werkt de bestaande activiteit bij in plaats van de feeds opnieuw te vullen
+
+    Titel en poster komen alleen van een bestaand MovieItem: een review mag
+    nooit op TMDB wachten. Loopt de feed mis, dan blijft de review staan;
+    alles gebeurt in een savepoint.
+    """
+    try:
+        with db.begin_nested():
+            updated = db.query(Activity).filter(
+                Activity.user_id == user.id,
+                Activity.kind == "review",
+                Activity.tmdb_id == tmdb_id
+            ).update({"rating": rating, "review_text": review_text or None}, synchronize_session=False)
+            if not updated:
+                movie_item = db.query(MovieItem).filter(MovieItem.tmdb_id == tmdb_id).first()
+                record_activity(
+                    db, user, "review", movie_item, tmdb_id=tmdb_id, rating=rating, review_text=review_text or None
+                )
+    except Exception as e:
+        print(f"Feed activiteit voor review van {user.id} op {tmdb_id} mislukt: {e}")
+
+
+def remove_activities(db: Session, user_id: int, kind: str, tmdb_ids: list) -> int:
+    """Activiteit van films die niet meer klopt (niet meer gekeken, review weg), ook uit de tijdlijnen"""
+    activity_ids = select(Activity.id).where(
+        Activity.user_id == user_id,
+        Activity.kind == kind,
+        Activity.tmdb_id.in_(tmdb_ids)
+    )
+    db.query(FeedEntry).filter(FeedEntry.activity_id.in_(activity_ids)).delete(synchronize_session=False)
+    return db.query(Activity).filter(Activity.id.in_(activity_ids)).delete(synchronize_session=False)
+
+
+def record_import(db: Session, user_id: int, movies: list, counts: dict):
+    """Activiteiten voor een batch geïmporteerde films: (TMDB film, rating, review) tuples
+
+    Per import komen er hoogstens FEED_IMPORT_MAX in de feeds (bijgehouden in
+    counts["feed"], zodat het ook over een hervatte import klopt); de rest
+    wordt samengevat in één 'import' activiteit aan het einde (record_import_summary).
+    """
+    budget = FEED_IMPORT_MAX - counts.get("feed", 0)
+    if budget <= 0 or not movies:
+        return
+    user = db.get(User, user_id)
+    for movie, rating, review_text in movies[:budget]:
+        record_activity(
+            db, user, "review" if rating is not None else "watched",
+            tmdb_id=movie["id"],
+            title=movie.get("title"),
+            poster_path=movie.get("poster_path"),
+            rating=rating,
+            review_text=review_text,
+        )
+    counts["feed"] = counts.get("feed", 0) + min(budget, len(movies))
+
+
+def record_import_summary(db: Session, user_id: int, counts: dict):
+    """Eén regel voor wat er niet los in de feed kwam"""
+    rest = counts.get("imported", 0) - counts.get("feed", 0)
+    if rest > 0:
+        record_activity(db, db.get(User, user_id), "import", count=rest)
+
+
+def follow(db: Session, follower_id: int, followee: User) -> bool:
+    """Volg een gebruiker en zet diens recente activiteit in de eigen tijdlijn"""
+    if follower_id == followee.id or is_following(db, follower_id, followee.id):
+        return False
+    try:
+        with db.begin_nested():
+            db.add(Follow(follower_id=follower_id, followee_id=followee.id))
+    except IntegrityError:
+        # Dubbele submit: een gelijktijdig request volgde al
+        return False
+    db.query(User).filter(User.id == followee.id).update(
+        {"follower_count": func.coalesce(User.follower_count, 0) + 1}, synchronize_session=False
+    )
+    db.flush()
+    db.refresh(followee, ["follower_count"])
+    if _fans_out(followee):
+        recent = select(Activity.id).where(Activity.user_id == followee.id).order_by(Activity.id.desc()).limit(FEED_BACKFILL).subquery()
+        db.execute(insert(FeedEntry).from_select(
+            ["user_id", "activity_id"],
+            select(literal(follower_id), recent.c.id)
+        ))
+    return True
+
+
+def unfollow(db: Session, follower_id: int, followee: User) -> bool:
+    removed = db.query(Follow).filter(
+        Follow.follower_id == follower_id,
+        Follow.followee_id == followee.id
+    ).delete(synchronize_session=False)
+    if not removed:
+        return False
+    db.query(User).filter(User.id == followee.id).update(
+        {"follower_count": func.coalesce(User.follower_count, 0) - 1}, synchronize_session=False
+    )
+    db.query(FeedEntry).filter(
+        FeedEntry.user_id == follower_id,
+        FeedEntry.activity_id.in_(select(Activity.id).where(Activity.user_id == followee.id))
+    ).delete(synchronize_session=False)
+    return True
+
+
+def is_following(db: Session, follower_id: int, followee_id: int) -> bool:
+    return db.query(Follow.id).filter(
+        Follow.follower_id == follower_id,
+        Follow.followee_id == followee_id
+    ).first() is not None
+
+
+async def read_feed(db: AsyncSession, user_id: int, before: int = None, limit: int = FEED_PAGE_SIZE) -> List[FeedRow]:
+    """Nieuwste activiteit van wie de gebruiker volgt; `before` is het laatste id van de vorige pagina"""
+    # Fan-out-on-write: range scan over (user_id, activity_id)
+    query = select(*FEED_COLUMNS).select_from(FeedEntry).join(
+        Activity, Activity.id == FeedEntry.activity_id
+    ).join(User, User.id == Activity.user_id).where(FeedEntry.user_id == user_id)
+    if before:
+        query = query.where(FeedEntry.activity_id < before)
+    rows = (await db.execute(query.order_by(FeedEntry.activity_id.desc()).limit(limit))).all()
+
+    # Fan-out-on-read: populaire accounts die de gebruiker volgt
+    popular = (await db.execute(
+        select(Follow.followee_id).join(User, User.id == Follow.followee_id).where(
+            Follow.follower_id == user_id,
+            User.follower_count > FEED_FANOUT_LIMIT
+        )
+    )).scalars().all()
+    if popular:
+        query = select(*FEED_COLUMNS).join(User, User.id == Activity.user_id).where(Activity.user_id.in_(popular))
+        if before:
+            query = query.where(Activity.id < before)
+        rows += (await db.execute(query.order_by(Activity.id.desc()).limit(limit))).all()
+        # Van voor een account populair werd kan het ook al in de tijdlijn staan
+        rows = sorted({row.id: row for row in rows}.values(), key=lambda row: row.id, reverse=True)[:limit]
+
+    return [FeedRow(*row) for row in rows]
+
+
+async def following(db: AsyncSession, user_id: int) -> List[str]:
+    """Gebruikersnamen die de gebruiker volgt, alfabetisch"""
+    return (await db.execute(
+        select(User.username).join(Follow, Follow.followee_id == User.id).where(
+            Follow.follower_id == user_id
+        ).order_by(User.username)
+    )).scalars().all()
+
+
+async def followed_ids(db: AsyncSession, user_id: int, candidate_ids: list) -> set:
+    """Welke van `candidate_ids` de gebruiker volgt (voor de volg-knoppen bij reviews)"""
+    if not candidate_ids:
+        return set()
+    return set((await db.execute(
+        select(Follow.followee_id).where(
+            Follow.follower_id == user_id,
+            Follow.followee_id.in_(candidate_ids)
+        )
+    )).scalars().all())
+
+
+def trim_feeds(db: Session) -> dict:
+    """Begrens elke tijdlijn op FEED_MAX_ENTRIES; draait als periodieke job"""
+    owners = db.query(FeedEntry.user_id).group_by(FeedEntry.user_id).having(
+        func.count(FeedEntry.activity_id) > FEED_MAX_ENTRIES
+    ).all()
+    trimmed = 0
+    for (owner_id,) in owners:
+        cutoff = db.query(FeedEntry.activity_id).filter(FeedEntry.user_id == owner_id).order_by(
+            FeedEntry.activity_id.desc()
+        ).offset(FEED_MAX_ENTRIES).limit(1).scalar()
+        trimmed += db.query(FeedEntry).filter(
+            FeedEntry.user_id == owner_id,
+            FeedEntry.activity_id <= cutoff
+        ).delete(synchronize_session=False)
+    db.commit()
+    return {"feeds": len(owners), "trimmed": trimmed}
@@ -0,0 +1,32 @@
+# Gunicorn configuratie voor productie
+# Start met: gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# App één keer laden in de master, workers erven de geïmporteerde code
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+# Graceful restarts (kill -HUP) en periodiek recyclen van workers
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+
+forwarded_allow_ips = "*"
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Database connecties uit de master mogen niet gedeeld worden met de workers
+    from models import engine, async_engine, replica_engines, async_replica_engines
+
+    for sync_engine in [engine, *replica_engines]:
+        sync_engine.dispose(close=False)
+    for async_engine_ in [async_engine, *async_replica_engines]:
+        async_engine_.sync_engine.dispose(close=False)
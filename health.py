@@ -0,0 +1,92 @@
+"""Liveness en readiness van een worker
+
+Na het starten warmt warm_up() op de achtergrond de database pools, de
+gedeelde cache, de templates en de discover index op. Tot dat klaar is
+antwoordt /health/ready met 503, zodat een load balancer nog geen verkeer
+stuurt; /health/live antwoordt meteen.
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import select
+
+from models import User, SessionLocal, AsyncSessionLocal, replica_engines, async_replica_engines
+
+
+# Configuration
+WARM_UP_RETRY_INTERVAL = float(os.getenv("WARM_UP_RETRY_INTERVAL", "2"))
+
+WARM_TEMPLATES = ["base.html", "index.html", "search.html", "movie_detail.html", "profile.html", "lists.html"]
+
+started_at = time.time()
+checks = {"database": None, "cache": None, "templates": None, "discover": None}  # None = nog niet klaar
+ready_at = None
+
+
+def _warm_database():
+    # Eén connectie per pool openen en meteen controleren dat het schema er is (python migrate.py)
+    with SessionLocal() as db:
+        db.execute(select(User.id).limit(1))
+    for replica in replica_engines:
+        with SessionLocal(bind=replica) as db:
+            db.execute(select(User.id).limit(1))
+
+
+async def _warm_async_database():
+    async with AsyncSessionLocal() as db:
+        await db.execute(select(User.id).limit(1))
+    for replica in async_replica_engines:
+        async with AsyncSessionLocal(bind=replica) as db:
+            await db.execute(select(User.id).limit(1))
+
+
+def _warm_cache():
+    from cache import shared_cache
+
+    shared_cache.get("health:ping")
+    # Modules die lazy geladen worden alvast importeren
+    import numpy  # noqa: F401
+    import requests  # noqa: F401
+    from jose import jwt  # noqa: F401
+    import stats  # noqa: F401
+
+
+async def warm_up(templates):
+    """Herhaal de checks tot alles gelukt is; fouten komen in de readiness response"""
+    global ready_at
+
+    async def discover():
+        from discover import get_index
+
+        await get_index()
+
+    steps = {
+        "database": lambda: asyncio.gather(asyncio.to_thread(_warm_database), _warm_async_database()),
+        "cache": lambda: asyncio.to_thread(_warm_cache),
+        "templates": lambda: asyncio.to_thread(lambda: [templates.get_template(name) for name in WARM_TEMPLATES]),
+        "discover": discover,
+    }
+    while ready_at is None:
+        for name, step in steps.items():
+            if checks[name] is True:
+                continue
+            try:
+                await step()
+                checks[name] = True
+            except Exception as e:
+                checks[name] = f"{type(e).__name__}: {e}"[:200]
+        if all(value is True for value in checks.values()):
+            ready_at = time.time()
+            print(f"Worker {os.getpid()} klaar in {ready_at - started_at:.2f}s")
+        else:
+            await asyncio.sleep(WARM_UP_RETRY_INTERVAL)
+
+
+def readiness() -> dict:
+    return {
+        "ready": ready_at is not None,
+        "checks": {name: ("ok" if value is True else value or "bezig") for name, value in checks.items()},
+        "uptime": round(time.time() - started_at, 2),
+        "warm_up_seconds": round(ready_at - started_at, 2) if ready_at else None,
+    }
@@ -0,0 +1,388 @@
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import or_
+
+from cache import invalidate_stats
+from feed import record_import, record_import_summary, remove_activities
+from models import MovieItem, UserMovie, Review, ImportedRow, ImportSync, get_db
+from tmdb import tmdb_request, movie_fields, BACKGROUND
+
+
+IMPORT_BATCH_SIZE = 20
+
+
+def file_fingerprint(contents: bytes) -> str:
+    return hashlib.sha1(contents).hexdigest()
+
+
+def row_fingerprint(import_type: str, row: dict) -> str:
+    """Vingerafdruk van de film plus rating, kijkdatum en review; de logdatum telt niet mee"""
+    if import_type == 'letterboxd':
+        key = row.get('Letterboxd URI') or f"{row.get('Name')}|{row.get('Year')}"
+    else:
+        key = row.get('Const') or f"{row.get('Title') or row.get('title')}|{row.get('Year') or row.get('year')}"
+    # 'Your Rating' is de rating in een IMDb export
+    for column in ('Rating', 'Your Rating', 'Watched Date', 'Review'):
+        if row.get(column):
+            key += f"|{row[column]}"
+    return hashlib.sha1(key.strip().encode("utf-8")).hexdigest()
+
+
+def export_kind(import_type: str, columns) -> str:
+    """Soort export, herkend aan de kolommen
+
+    Letterboxd watched.csv, ratings.csv, diary.csv en reviews.csv landen
+    allemaal in 'watched'. Elke soort houdt zijn eigen vingerafdrukken bij;
+    anders lijkt bij een sync van ratings.csv alles wat alleen in watched.csv
+    staat verdwenen.
+    """
+    columns = set(columns or [])
+    if import_type == 'letterboxd':
+        if 'Review' in columns:
+            return 'reviews'
+        if 'Watched Date' in columns:
+            return 'diary'
+        if 'Rating' in columns:
+            return 'ratings'
+        return 'films'  # watched.csv, watchlist.csv en lijsten
+    return 'ratings' if 'Your Rating' in columns else 'list'
+
+
+def parse_rating(import_type: str, row: dict):
+    """Rating naar onze 1-10 schaal; Letterboxd gebruikt 0.5-5 sterren, IMDb al 1-10"""
+    value = row.get('Rating') if import_type == 'letterboxd' else row.get('Your Rating')
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    if import_type == 'letterboxd':
+        rating *= 2
+    return min(max(round(rating), 1), 10)
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+def _imported_rows(db, user_id: int, target: str, import_type: str):
+    """Vingerafdrukken van alle exports die in dit doel geïmporteerd zijn"""
+    return db.query(ImportedRow).filter(
+        ImportedRow.user_id == user_id,
+        ImportedRow.target == str(target),
+        ImportedRow.source == import_type
+    )
+
+
+def _imported_hashes(db, user_id: int, target: str, import_type: str, kind: str) -> set:
+    return {
+        row_hash for (row_hash,) in _imported_rows(db, user_id, target, import_type).filter(
+            ImportedRow.export_kind == kind
+        ).with_entities(ImportedRow.row_hash)
+    }
+
+
+def last_synced_file(db, user_id: int, target: str, import_type: str, kind: str):
+    """Vingerafdruk van het laatst volledig gesynchroniseerde bestand van deze soort, of None"""
+    sync = db.query(ImportSync).filter(
+        ImportSync.user_id == user_id,
+        ImportSync.target == str(target),
+        ImportSync.source == import_type,
+        ImportSync.export_kind == kind
+    ).first()
+    return sync.file_hash if sync else None
+
+
+def plan_sync(db, user_id: int, target: str, import_type: str, kind: str, csv_data: list):
+    """Set-diff van de upload tegen wat eerder uit dezelfde soort export is geïmporteerd
+
+    Geeft (nieuwe rijen, vingerafdrukken van rijen die uit de export verdwenen zijn).
+    """
+    uploaded = {}
+    for row in csv_data:
+        uploaded.setdefault(row_fingerprint(import_type, row), row)
+    previous = _imported_hashes(db, user_id, target, import_type, kind)
+    new_rows = [row for row_hash, row in uploaded.items() if row_hash not in previous]
+    return new_rows, sorted(previous - uploaded.keys())
+
+
+def _remove_dropped(db, user_id: int, target: str, import_type: str, kind: str, status: str, custom_list_id: int,
+                    hashes: list) -> int:
+    """Verwijder films waarvan de rij niet meer in de export staat
+
+    Een film blijft staan als een andere rij er nog naar verwijst: uit
+    dezelfde export (bijvoorbeeld na een gewijzigde rating) of uit een
+    andere soort export in hetzelfde doel.
+    """
+    removed = 0
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        dropped = _imported_rows(db, user_id, target, import_type).filter(
+            ImportedRow.export_kind == kind,
+            ImportedRow.row_hash.in_(chunk)
+        )
+        movie_ids = {row.movie_id for row in dropped if row.movie_id is not None}
+        movie_ids -= {
+            movie_id for (movie_id,) in _imported_rows(db, user_id, target, import_type).filter(
+                ImportedRow.movie_id.in_(movie_ids),
+                or_(ImportedRow.export_kind != kind, ImportedRow.row_hash.notin_(chunk))
+            ).with_entities(ImportedRow.movie_id)
+        }
+        if movie_ids and status == "watched":
+            remove_activities(db, user_id, "watched", [
+                tmdb_id for (tmdb_id,) in db.query(MovieItem.tmdb_id).filter(MovieItem.id.in_(movie_ids))
+            ])
+        if movie_ids:
+            removed += db.query(UserMovie).filter(
+                UserMovie.user_id == user_id,
+                UserMovie.movie_id.in_(movie_ids),
+                UserMovie.status == status,
+                UserMovie.custom_list_id == custom_list_id
+            ).delete(synchronize_session=False)
+        dropped.delete(synchronize_session=False)
+    return removed
+
+
+def _record_sync(db, user_id: int, target: str, import_type: str, kind: str, file_hash: str, row_count: int):
+    sync = db.query(ImportSync).filter(
+        ImportSync.user_id == user_id,
+        ImportSync.target == str(target),
+        ImportSync.source == import_type,
+        ImportSync.export_kind == kind
+    ).first()
+    if not sync:
+        sync = ImportSync(user_id=user_id, target=str(target), source=import_type, export_kind=kind)
+        db.add(sync)
+    sync.file_hash = file_hash
+    sync.row_count = row_count
+    sync.synced_at = datetime.utcnow()
+
+
+def _write_batch(db, batch: list, not_found: list, known_hashes: set, user_id: int, target: str,
+                 import_type: str, kind: str, status: str, custom_list_id: int, counts: dict):
+    """Schrijf een batch opgeloste rijen met een handvol set-based queries
+
+    `batch` bevat (row_hash, csv rij, TMDB film) tuples. Bestaande films,
+    lijstregels en reviews worden per batch in één query opgehaald; de rest
+    gaat er met bulk inserts/updates in.
+    """
+    now = datetime.utcnow()
+    if not batch and not not_found:
+        return
+
+    # Films: ontbrekende MovieItems in één keer aanmaken
+    tmdb_ids = {movie['id'] for _, _, movie in batch}
+    movie_ids = dict(db.query(MovieItem.tmdb_id, MovieItem.id).filter(MovieItem.tmdb_id.in_(list(tmdb_ids))))
+    new_movies = {movie['id']: movie for _, _, movie in batch if movie['id'] not in movie_ids}
+    if new_movies:
+        db.bulk_insert_mappings(MovieItem, [
+            dict(movie_fields(movie), tmdb_id=tmdb_id, added_at=now) for tmdb_id, movie in new_movies.items()
+        ])
+        movie_ids.update(db.query(MovieItem.tmdb_id, MovieItem.id).filter(MovieItem.tmdb_id.in_(list(new_movies))))
+
+    # Lijstregels: alleen films die nog niet in de lijst staan, met de kijkdatum als die er is
+    existing = {
+        movie_id for (movie_id,) in db.query(UserMovie.movie_id).filter(
+            UserMovie.user_id == user_id,
+            UserMovie.movie_id.in_(list(movie_ids.values())),
+            UserMovie.status == status,
+            UserMovie.custom_list_id == custom_list_id
+        )
+    }
+    new_entries = {}
+    feed_movies = []
+    for _, row, movie in batch:
+        movie_id = movie_ids[movie['id']]
+        if movie_id in existing:
+            counts["skipped"] += 1
+            continue
+        watched_at = parse_date(row.get('Watched Date')) or parse_date(row.get('Date')) or now
+        if movie_id in new_entries:
+            # Herhaalde kijkbeurt in de diary: één regel, laatste datum
+            counts["skipped"] += 1
+            new_entries[movie_id]["added_at"] = max(new_entries[movie_id]["added_at"], watched_at)
+            continue
+        new_entries[movie_id] = {
+            "user_id": user_id,
+            "movie_id": movie_id,
+            "status": status,
+            "custom_list_id": custom_list_id,
+            "added_at": watched_at,
+        }
+        counts["imported"] += 1
+        if status == "watched":
+            feed_movies.append((movie, parse_rating(import_type, row), row.get('Review') or None))
+    if new_entries:
+        db.bulk_insert_mappings(UserMovie, list(new_entries.values()))
+        record_import(db, user_id, feed_movies, counts)
+
+    # Reviews: ratings.csv / diary.csv / reviews.csv; de laatste rij per film wint
+    ratings = {}
+    for _, row, movie in batch:
+        rating = parse_rating(import_type, row)
+        if rating is not None:
+            ratings[movie['id']] = (rating, row.get('Review') or None, parse_date(row.get('Watched Date')) or parse_date(row.get('Date')) or now)
+    if ratings:
+        reviews = dict(db.query(Review.tmdb_id, Review.id).filter(
+            Review.user_id == user_id,
+            Review.tmdb_id.in_(list(ratings))
+        ))
+        updates, inserts = [], []
+        for tmdb_id, (rating, review_text, created_at) in ratings.items():
+            if tmdb_id in reviews:
+                update = {"id": reviews[tmdb_id], "rating": rating, "updated_at": now}
+                if review_text:
+                    update["review_text"] = review_text
+                updates.append(update)
+            else:
+                inserts.append({
+                    "user_id": user_id,
+                    "tmdb_id": tmdb_id,
+                    "rating": rating,
+                    "review_text": review_text,
+                    "created_at": created_at,
+                    "updated_at": now,
+                })
+        db.bulk_update_mappings(Review, updates)
+        db.bulk_insert_mappings(Review, inserts)
+        counts["reviews"] = counts.get("reviews", 0) + len(ratings)
+
+    # Vingerafdrukken voor de volgende sync
+    fingerprints = {}
+    for row_hash, _, movie in batch:
+        fingerprints.setdefault(row_hash, movie_ids[movie['id']])
+    for row_hash in not_found:
+        fingerprints.setdefault(row_hash, None)
+    db.bulk_insert_mappings(ImportedRow, [
+        {"user_id": user_id, "target": str(target), "source": import_type, "export_kind": kind, "row_hash": row_hash,
+         "movie_id": movie_id}
+        for row_hash, movie_id in fingerprints.items() if row_hash not in known_hashes
+    ])
+    known_hashes.update(fingerprints)
+
+
+def process_import_background(
+    csv_data: list,
+    import_type: str,
+    target: str,
+    user_id: int,
+    custom_list_id: int = None,
+    start: int = 0,
+    counts: dict = None,
+    checkpoint=None,
+    sync: bool = False,
+    removed_hashes: list = None,
+    file_hash: str = None,
+    file_rows: int = 0,
+    kind: str = None,
+):
+    """Achtergrond taak voor het importeren van films, ratings en reviews
+
+    Begint bij rij `start` zodat een onderbroken import verder kan. Per batch
+    van IMPORT_BATCH_SIZE rijen worden de films bij TMDB opgezocht en daarna
+    in één keer weggeschreven (zie _write_batch). Vóór elke batch commit wordt
+    `checkpoint(db, verwerkt, tellers)` aangeroepen, zodat de voortgang in
+    dezelfde transactie als de geïmporteerde films wordt opgeslagen.
+
+    Bij `sync` bevat `csv_data` alleen de nieuwe rijen (zie plan_sync); rijen
+    in `removed_hashes` worden aan het einde verwijderd. `kind` is de soort
+    export (zie export_kind); zonder wordt hij uit de rijen afgeleid.
+    """
+    db = next(get_db())
+    kind = kind or export_kind(import_type, csv_data[0].keys() if csv_data else [])
+
+    counts = dict(counts or {"imported": 0, "skipped": 0, "errors": 0})
+    status = target if target in ['watchlist', 'watched'] else 'custom'
+    batch, not_found = [], []
+    title = None
+    complete = True  # False als TMDB rijen niet kon beantwoorden
+
+    # Eerder geïmporteerde rijen voor deze gebruiker/lijst, in één query
+    known_hashes = _imported_hashes(db, user_id, target, import_type, kind)
+
+    def flush(processed: int):
+        nonlocal batch, not_found
+        _write_batch(db, batch, not_found, known_hashes, user_id, target, import_type, kind, status, custom_list_id, counts)
+        if checkpoint:
+            checkpoint(db, processed, counts)
+        db.commit()
+        invalidate_stats(user_id)
+        batch, not_found = [], []
+
+    try:
+        for idx in range(start, len(csv_data)):
+            row = csv_data[idx]
+            try:
+                title = None
+                year = None
+                row_hash = row_fingerprint(import_type, row)
+
+                if sync and row_hash in known_hashes:
+                    # Al verwerkt door een eerdere sync
+                    counts["skipped"] += 1
+                    continue
+
+                if import_type == 'letterboxd':
+                    title = row.get('Name')
+                    year = row.get('Year')
+                elif import_type == 'imdb':
+                    title = row.get('Title') or row.get('title')
+                    year = row.get('Year') or row.get('year')
+
+                if not title:
+                    counts["skipped"] += 1
+                    continue
+
+                # Search movie on TMDB
+                search_query = f"{title} {year}" if year else title
+                search_results = tmdb_request("/search/movie", {"query": search_query}, priority=BACKGROUND)
+
+                if search_results is None:
+                    complete = False
+                    counts["skipped"] += 1
+                    continue
+                if not search_results.get('results'):
+                    # Niet gevonden: onthouden zodat een volgende sync de rij niet opnieuw zoekt
+                    not_found.append(row_hash)
+                    counts["skipped"] += 1
+                    continue
+
+                # Take first result
+                batch.append((row_hash, row, search_results['results'][0]))
+
+            except Exception as e:
+                counts["errors"] += 1
+                print(f"Error importing '{title}': {str(e)}")
+                continue
+
+            finally:
+                # Batch wegschrijven elke IMPORT_BATCH_SIZE rijen, samen met het checkpoint
+                if (idx + 1 - start) % IMPORT_BATCH_SIZE == 0:
+                    flush(idx + 1)
+
+        # Laatste batch, daarna pas verwijderen: nieuwe rijen kunnen naar dezelfde film wijzen
+        flush(len(csv_data))
+
+        if removed_hashes:
+            counts["removed"] = _remove_dropped(
+                db, user_id, target, import_type, kind, status, custom_list_id, removed_hashes
+            )
+        if status == "watched":
+            record_import_summary(db, user_id, counts)
+        if sync and file_hash and complete and not counts["errors"]:
+            _record_sync(db, user_id, target, import_type, kind, file_hash, file_rows)
+        db.commit()
+        invalidate_stats(user_id)
+
+        print(f"Import voltooid: {counts['imported']} geïmporteerd, {counts['skipped']} overgeslagen, {counts['errors']} errors")
+        return counts
+
+    except Exception as e:
+        print(f"Fatal error in background import: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
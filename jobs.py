@@ -0,0 +1,416 @@
+"""Duurzame job queue in de database, met een aparte worker
+
+Start de worker met: python jobs.py
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, or_, select, union
+from sqlalchemy.orm import Session
+
+from models import Job, SessionLocal
+
+
+# Configuration
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "1"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "300"))  # seconden zonder heartbeat
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", str(max(JOB_LOCK_TIMEOUT // 5, 1))))
+JOB_RETRY_BASE_DELAY = int(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+CACHE_WARM_INTERVAL = int(os.getenv("CACHE_WARM_INTERVAL", "900"))
+RECO_INTERVAL = int(os.getenv("RECO_INTERVAL", "600"))
+METADATA_INTERVAL = int(os.getenv("METADATA_INTERVAL", "600"))
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", "50"))
+METADATA_CATALOG_BATCH_SIZE = int(os.getenv("METADATA_CATALOG_BATCH_SIZE", "20"))  # per run, voor discover
+CATALOG_GROW_INTERVAL = int(os.getenv("CATALOG_GROW_INTERVAL", "3600"))
+FEED_TRIM_INTERVAL = int(os.getenv("FEED_TRIM_INTERVAL", "3600"))
+
+
+def enqueue_job(db: Session, kind: str, payload: dict, user_id: int = None, total: int = 0) -> Job:
+    """Zet een job in de wachtrij"""
+    job = Job(
+        kind=kind,
+        user_id=user_id,
+        payload=json.dumps(payload),
+        total=total,
+        status="queued",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def job_status(job: Job) -> dict:
+    """Status van een job voor de /import pagina en JSON endpoint"""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "total": job.total or 0,
+        "attempts": job.attempts or 0,
+        "result": json.loads(job.result) if job.result else None,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+def _release_stale_jobs(db: Session):
+    """Jobs van een gecrashte worker (geen heartbeat meer) gaan terug in de wachtrij"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    released = db.query(Job).filter(
+        Job.status == "running",
+        Job.heartbeat_at < cutoff
+    ).update({"status": "queued", "locked_by": None}, synchronize_session=False)
+    db.commit()
+    if released:
+        print(f"{released} vastgelopen job(s) opnieuw in de wachtrij gezet")
+
+
+class JobLost(Exception):
+    """Een andere worker heeft de job overgenomen (de heartbeat was verlopen)"""
+
+
+def _owned(db: Session, job_id: int, worker_id: str):
+    # Updates van een job alleen zolang deze worker hem nog heeft
+    return db.query(Job).filter(Job.id == job_id, Job.locked_by == worker_id)
+
+
+def _checkpoint(db: Session, job: Job, worker_id: str, **values):
+    """Voortgang opslaan in de transactie van de batch; stopt de job als hij overgenomen is"""
+    values["heartbeat_at"] = datetime.utcnow()
+    if not _owned(db, job.id, worker_id).update(values, synchronize_session=False):
+        raise JobLost(f"Job {job.id} is overgenomen door een andere worker")
+
+
+class _Heartbeat:
+    """Schrijft heartbeat_at vanuit een eigen thread, ook als de job lang op TMDB wacht"""
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(JOB_HEARTBEAT_INTERVAL):
+            db = SessionLocal()
+            try:
+                beat = _owned(db, self.job_id, self.worker_id).filter(Job.status == "running").update(
+                    {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+                if not beat:
+                    return
+            except Exception as e:
+                # Bijv. een database lock tijdens een grote batch; volgende keer opnieuw
+                print(f"Heartbeat van job {self.job_id} mislukt: {e}")
+            finally:
+                db.close()
+
+
+def _running_for_user(db: Session, user_id: int) -> int:
+    return db.query(func.count(Job.id)).filter(
+        Job.user_id == user_id,
+        Job.status == "running"
+    ).scalar()
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[Job]:
+    """Claim de eerstvolgende job, rekening houdend met de limiet per gebruiker"""
+    _release_stale_jobs(db)
+    now = datetime.utcnow()
+
+    busy_users = db.query(Job.user_id).filter(
+        Job.status == "running",
+        Job.user_id.isnot(None)
+    ).group_by(Job.user_id).having(func.count(Job.id) >= JOB_MAX_PER_USER)
+
+    candidates = db.query(Job.id, Job.user_id).filter(
+        Job.status == "queued",
+        Job.run_after <= now,
+        or_(Job.user_id.is_(None), Job.user_id.notin_(busy_users))
+    ).order_by(Job.run_after, Job.id).limit(10).all()
+
+    for job_id, user_id in candidates:
+        # Optimistische claim: alleen de worker die de status omzet krijgt de job
+        claimed = db.query(Job).filter(
+            Job.id == job_id,
+            Job.status == "queued"
+        ).update({
+            "status": "running",
+            "locked_by": worker_id,
+            "heartbeat_at": now,
+            "attempts": Job.attempts + 1,
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            continue
+
+        # Een andere worker kan tegelijk een job van dezelfde gebruiker geclaimd hebben
+        if user_id is not None and _running_for_user(db, user_id) > JOB_MAX_PER_USER:
+            db.query(Job).filter(Job.id == job_id).update(
+                {"status": "queued", "locked_by": None, "attempts": Job.attempts - 1},
+                synchronize_session=False
+            )
+            db.commit()
+            continue
+
+        return db.query(Job).filter(Job.id == job_id).first()
+
+    return None
+
+
+def _run_import(db: Session, job: Job) -> dict:
+    from importer import process_import_background
+
+    payload = json.loads(job.payload)
+
+    worker_id = job.locked_by
+
+    def checkpoint(import_db, processed, counts):
+        _checkpoint(import_db, job, worker_id, progress=processed, result=json.dumps(counts))
+
+    return process_import_background(
+        payload["rows"],
+        payload["import_type"],
+        payload["target"],
+        job.user_id,
+        payload.get("custom_list_id"),
+        start=job.progress or 0,
+        counts=json.loads(job.result) if job.result else None,
+        checkpoint=checkpoint,
+        sync=payload.get("sync", False),
+        removed_hashes=payload.get("removed_hashes"),
+        file_hash=payload.get("file_hash"),
+        file_rows=payload.get("file_rows", 0),
+        kind=payload.get("export_kind"),
+    )
+
+
+def _run_warm_cache(db: Session, job: Job) -> dict:
+    """Houd de TMDB data van de home- en zoekpagina warm in de gedeelde cache
+
+    Ververst alles wat vóór de volgende run (met marge voor een late run)
+    zou verlopen; een verse cache hit zou anders nooit iets verversen.
+    """
+    from tmdb import tmdb_request, BACKGROUND
+
+    endpoints = json.loads(job.payload).get("endpoints", [])
+    warmed = sum(
+        1 for endpoint in endpoints
+        if tmdb_request(endpoint, priority=BACKGROUND, refresh_within=2 * CACHE_WARM_INTERVAL) is not None
+    )
+    return {"warmed": warmed, "total": len(endpoints)}
+
+
+def _run_recommendations(db: Session, job: Job) -> dict:
+    from recommendations import update_similarities
+
+    return update_similarities(db, full=json.loads(job.payload).get("full", False))
+
+
+def _run_movie_metadata(db: Session, job: Job) -> dict:
+    """Vul runtime, genres en taal aan voor films die nog geen details hebben
+
+    Eerst films in iemands lijsten of reviews. Daarna, met wat er van de
+    batch over is, hoogstens METADATA_CATALOG_BATCH_SIZE films uit de rest
+    van de catalogus, populairste eerst: geseede films hebben nog geen
+    genres en komen pas daarna in discover. Zo kost de hele seed geen
+    TMDB call per film in één keer.
+    """
+    from models import MovieItem, UserMovie, Review
+    from tmdb import tmdb_request, movie_fields, BACKGROUND, NOT_FOUND
+
+    used = union(
+        select(UserMovie.movie_id),
+        select(MovieItem.id).join(Review, Review.tmdb_id == MovieItem.tmdb_id),
+    )
+    pending = db.query(MovieItem).filter(MovieItem.metadata_fetched_at.is_(None)).order_by(
+        MovieItem.popularity.desc().nulls_last()
+    )
+    movie_items = pending.filter(MovieItem.id.in_(used)).limit(METADATA_BATCH_SIZE).all()
+    room = min(METADATA_BATCH_SIZE - len(movie_items), METADATA_CATALOG_BATCH_SIZE)
+    if room > 0:
+        movie_items += pending.filter(MovieItem.id.notin_(used)).limit(room).all()
+    updated = missing = 0
+    for movie_item in movie_items:
+        movie = tmdb_request(f"/movie/{movie_item.tmdb_id}", priority=BACKGROUND, missing=NOT_FOUND)
+        if movie is None:
+            # Tijdelijke fout (circuit open, rate limit, timeout): de rest van de batch later opnieuw
+            break
+        movie_item.metadata_fetched_at = datetime.utcnow()
+        if movie is NOT_FOUND:
+            missing += 1
+            continue
+        for field, value in movie_fields(movie).items():
+            setattr(movie_item, field, value)
+        updated += 1
+    db.commit()
+    return {"updated": updated, "missing": missing, "checked": len(movie_items)}
+
+
+def _run_grow_catalog(db: Session, job: Job) -> dict:
+    from discover import grow_catalog
+
+    return grow_catalog(db)
+
+
+def _run_seed_catalog(db: Session, job: Job) -> dict:
+    from seed import seed_catalog
+
+    payload = json.loads(job.payload)
+
+    worker_id = job.locked_by
+
+    def checkpoint(seed_db, lines, counts):
+        _checkpoint(seed_db, job, worker_id, progress=lines, result=json.dumps(counts))
+
+    return seed_catalog(
+        db,
+        payload["path"],
+        payload["min_popularity"],
+        start=job.progress or 0,
+        counts=json.loads(job.result) if job.result else None,
+        checkpoint=checkpoint,
+    )
+
+
+def _run_trim_feeds(db: Session, job: Job) -> dict:
+    from feed import trim_feeds
+
+    return trim_feeds(db)
+
+
+JOB_HANDLERS = {
+    "import": _run_import,
+    "warm_cache": _run_warm_cache,
+    "recommendations": _run_recommendations,
+    "movie_metadata": _run_movie_metadata,
+    "grow_catalog": _run_grow_catalog,
+    "seed_catalog": _run_seed_catalog,
+    "trim_feeds": _run_trim_feeds,
+}
+
+WARM_ENDPOINTS = ["/movie/popular", "/movie/now_playing", "/genre/movie/list"]
+
+# Periodieke jobs: kind -> (interval in seconden, payload)
+PERIODIC_JOBS = {
+    "warm_cache": (CACHE_WARM_INTERVAL, {"endpoints": WARM_ENDPOINTS}),
+    "recommendations": (RECO_INTERVAL, {}),
+    "movie_metadata": (METADATA_INTERVAL, {}),
+    "grow_catalog": (CATALOG_GROW_INTERVAL, {}),
+    "trim_feeds": (FEED_TRIM_INTERVAL, {}),
+}
+
+
+def run_job(db: Session, job: Job):
+    """Voer een geclaimde job uit; bij een fout volgt een retry met exponentiële backoff
+
+    Alle statuswijzigingen gelden alleen zolang `locked_by` nog deze worker
+    is: een job die na een verlopen heartbeat door een andere worker is
+    overgenomen, wordt door deze worker niet meer afgerond of teruggezet.
+    """
+    worker_id = job.locked_by
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Onbekend job type: {job.kind}")
+        with _Heartbeat(job.id, worker_id):
+            result = handler(db, job)
+        finished = _owned(db, job.id, worker_id).update({
+            "status": "done",
+            "result": json.dumps(result),
+            "last_error": None,
+            "locked_by": None,
+        }, synchronize_session=False)
+        db.commit()
+        if not finished:
+            print(f"Job {job.id} is overgenomen door een andere worker; resultaat niet opgeslagen")
+    except JobLost as e:
+        db.rollback()
+        print(f"{e}; deze worker stopt ermee")
+    except Exception as e:
+        db.rollback()
+        db.refresh(job)
+        values = {
+            "last_error": f"{e}\n{traceback.format_exc()}"[-4000:],
+            "locked_by": None,
+        }
+        if job.attempts >= job.max_attempts:
+            values["status"] = "failed"
+            print(f"Job {job.id} definitief mislukt na {job.attempts} pogingen: {e}")
+        else:
+            delay = JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+            values["status"] = "queued"
+            values["run_after"] = datetime.utcnow() + timedelta(seconds=delay)
+            print(f"Job {job.id} mislukt ({e}), nieuwe poging over {delay}s")
+        _owned(db, job.id, worker_id).update(values, synchronize_session=False)
+        db.commit()
+
+
+def _schedule_periodic(db: Session, last_run: dict):
+    """Zet periodieke jobs in de wachtrij als hun interval verstreken is"""
+    for kind, (interval, payload) in PERIODIC_JOBS.items():
+        if interval <= 0 or time.time() - last_run.get(kind, 0.0) < interval:
+            continue
+        pending = db.query(Job).filter(
+            Job.kind == kind,
+            Job.status.in_(["queued", "running"])
+        ).first()
+        if not pending:
+            enqueue_job(db, kind, payload)
+        last_run[kind] = time.time()
+
+
+def run_worker():
+    """Worker loop: claim jobs tot een SIGTERM/SIGINT binnenkomt (schema: python migrate.py)"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        print("Worker stopt na de huidige job...")
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Job worker {worker_id} gestart")
+    last_run = {}
+    while not stopping:
+        db = SessionLocal()
+        try:
+            _schedule_periodic(db, last_run)
+
+            job = claim_next_job(db, worker_id)
+            if job is None:
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            run_job(db, job)
+        except Exception as e:
+            print(f"Worker error: {e}")
+            time.sleep(JOB_POLL_INTERVAL)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    run_worker()
@@ -1,111 +1,143 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, status, Form, UploadFile, File, BackgroundTasks, Response
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Depends, HTTPException, status, Form, UploadFile, File, Response
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from datetime import timedelta
-import requests
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import csv
 import io
 from dotenv import load_dotenv
 
-from models import User, MovieItem, UserMovie, Review, CustomList, get_db, init_db
+from models import User, MovieItem, UserMovie, Review, CustomList, Job, ImportedRow, ImportSync, get_db, get_async_db, get_read_db, get_async_read_db, AsyncSessionLocal, init_db
+from cache import configure_templates, data_version, invalidate_stats
+from middleware import HTTPCacheMiddleware, CompressionMiddleware, PrimaryStickinessMiddleware
+from tmdb import tmdb_request_async, movie_fields, TMDB_IMAGE_BASE_URL
+from jobs import enqueue_job, job_status
+from importer import export_kind, file_fingerprint, last_synced_file, plan_sync
+import queries
+import feed
+import health
+import profiling
+from export import EXPORT_FORMATS, export_movies, export_reviews
 from auth import (
     get_password_hash,
     authenticate_user,
     create_access_token,
     get_current_user_from_cookie,
     get_current_user_required,
+    get_current_user_async,
+    get_current_user_required_async,
+    require_admin,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
 load_dotenv()
 
-# Initialize FastAPI app
-app = FastAPI(title="MovieSpace")
-templates = Jinja2Templates(directory="templates")
-
-# TMDB API Configuration
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
-TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
-
-# Initialize database
-init_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Opwarmen op de achtergrond: de worker neemt meteen requests aan, /health/ready volgt
+    warm_up_task = asyncio.create_task(health.warm_up(templates))
+    yield
+    warm_up_task.cancel()
 
-# Helper function to call TMDB API
-def tmdb_request(endpoint: str, params: dict = None):
-    """Helper functie voor TMDB API calls"""
-    if params is None:
-        params = {}
-    params["api_key"] = TMDB_API_KEY
 
-    try:
-        response = requests.get(f"{TMDB_BASE_URL}{endpoint}", params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"TMDB API Error: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        print(f"TMDB API Exception: {e}")
-        return None
+# Initialize FastAPI app
+app = FastAPI(title="MovieSpace", lifespan=lifespan)
+app.add_middleware(HTTPCacheMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(PrimaryStickinessMiddleware)
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+templates = configure_templates(Jinja2Templates(directory="templates"))
 
 
 # Home Page - Popular & Now Playing
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request, db: Session = Depends(get_db)):
+async def home(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Home pagina met populaire en nu draaiende films"""
-    user = get_current_user_from_cookie(request, db)
+    user = await get_current_user_async(request, db)
 
-    popular_movies = tmdb_request("/movie/popular")
-    now_playing_movies = tmdb_request("/movie/now_playing")
+    popular_movies = await tmdb_request_async("/movie/popular")
+    now_playing_movies = await tmdb_request_async("/movie/now_playing")
+    popular_movies = popular_movies.get("results", []) if popular_movies else []
+    now_playing_movies = now_playing_movies.get("results", []) if now_playing_movies else []
 
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
-        "popular_movies": popular_movies.get("results", []) if popular_movies else [],
-        "now_playing_movies": now_playing_movies.get("results", []) if now_playing_movies else [],
+        "popular_movies": popular_movies,
+        "now_playing_movies": now_playing_movies,
+        "popular_version": data_version(popular_movies[:10]),
+        "now_playing_version": data_version(now_playing_movies[:10]),
         "image_base_url": TMDB_IMAGE_BASE_URL
     })
 
 @app.get("/sitemap.xml")
-async def sitemap(db: Session = Depends(get_db)):
+async def sitemap(db: AsyncSession = Depends(get_async_read_db)):
     base_url = "https://movie.drissi.store"
     
     # 1. Statische pagina's
     static_pages = ["/", "/search", "/login", "/register"]
     
-    # 2. Dynamische pagina's (alle films uit je database)
-    movies = db.query(MovieItem).all()
+    # 2. Dynamische pagina's (films met details, zie queries.sitemap_entries)
+    tmdb_ids, last_added = await queries.sitemap_entries(db)
     
-    xml_content = '<?xml version="1.0" encoding="UTF-8"?>'
-    xml_content += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>']
+    parts.append('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
     
     # Statische URLs toevoegen
     for page in static_pages:
-        xml_content += f"""
+        parts.append(f"""
         <url>
             <loc>{base_url}{page}</loc>
             <changefreq>daily</changefreq>
             <priority>0.8</priority>
-        </url>"""
+        </url>""")
     
     # Film detail pagina's toevoegen
-    for movie in movies:
-        xml_content += f"""
+    for tmdb_id in tmdb_ids:
+        parts.append(f"""
         <url>
-            <loc>{base_url}/movie/{movie.tmdb_id}</loc>
+            <loc>{base_url}/movie/{tmdb_id}</loc>
             <changefreq>weekly</changefreq>
             <priority>0.6</priority>
-        </url>"""
+        </url>""")
         
-    xml_content += "</urlset>"
-    
-    return Response(content=xml_content, media_type="application/xml")
-    
+    parts.append("</urlset>")
+    xml_content = "".join(parts)
+
+    headers = {}
+    if last_added:
+        headers["Last-Modified"] = format_datetime(last_added.replace(tzinfo=timezone.utc), usegmt=True)
+
+    return Response(content=xml_content, media_type="application/xml", headers=headers)
+
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: het proces draait en de event loop reageert"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: database pools, cache, templates en discover index zijn warm"""
+    state = health.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/robots.txt")
+async def robots():
+    return FileResponse("robots.txt", media_type="text/plain")
+
+
 # Search & Filter Page
 @app.get("/search", response_class=HTMLResponse)
 async def search_page(
@@ -115,16 +147,22 @@ async def search_page(
     year: str = "",
     language: str = "",
     sort_by: str = "popularity.desc",
-    db: Session = Depends(get_db)
+    page: int = 1,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Zoek- en filterpagina"""
-    user = get_current_user_from_cookie(request, db)
+    from discover import get_index, DISCOVER_MIN_CATALOG, DISCOVER_PAGE_SIZE
+
+    user = await get_current_user_async(request, db)
 
     # Get genres list
-    genres_data = tmdb_request("/genre/movie/list")
+    genres_data = await tmdb_request_async("/genre/movie/list")
     genres = genres_data.get("genres", []) if genres_data else []
 
     movies = []
+    facets = None
+    total_results = 0
+    page = max(page, 1)
 
     # Determine if we have any search criteria
     has_criteria = query or genre or year or language
@@ -135,12 +173,12 @@ async def search_page(
         if year:
             search_params["year"] = year
 
-        search_results = tmdb_request("/search/movie", search_params)
+        search_results = await tmdb_request_async("/search/movie", search_params)
         all_movies = search_results.get(
             "results", []) if search_results else []
 
         # Handmatig filteren op genre en taal als die zijn ingesteld
-        movies = all_movies
+        movies = list(all_movies)
         if genre:
             movies = [m for m in movies if genre in [
                 str(g) for g in m.get("genre_ids", [])]]
@@ -162,6 +200,20 @@ async def search_page(
         elif sort_by == "release_date.asc":
             movies.sort(key=lambda x: x.get("release_date", ""))
     else:
+        index = await get_index()
+        if index.size >= DISCOVER_MIN_CATALOG:
+            # Lokale discover over de catalogus, met facet tellingen
+            facets = index.search(
+                genre=int(genre) if genre.isdigit() else None,
+                year=int(year) if year.isdigit() else None,
+                language=language or None,
+                sort_by=sort_by,
+                offset=(page - 1) * DISCOVER_PAGE_SIZE,
+            )
+            movies = facets.movies
+            total_results = facets.total
+
+    if not query and facets is None:
         # Discover with filters - altijd tonen zelfs zonder criteria
         params = {"sort_by": sort_by}
         if genre:
@@ -171,7 +223,7 @@ async def search_page(
         if language:
             params["with_original_language"] = language
 
-        discover_results = tmdb_request("/discover/movie", params)
+        discover_results = await tmdb_request_async("/discover/movie", params)
         movies = discover_results.get(
             "results", []) if discover_results else []
 
@@ -180,6 +232,12 @@ async def search_page(
         "user": user,
         "movies": movies,
         "genres": genres,
+        "genres_version": data_version(genres),
+        "facets": facets,
+        "facets_version": data_version(facets.genre_counts if facets else None),
+        "total_results": total_results or len(movies),
+        "current_page": page,
+        "total_pages": (total_results + DISCOVER_PAGE_SIZE - 1) // DISCOVER_PAGE_SIZE if facets else 1,
         "image_base_url": TMDB_IMAGE_BASE_URL,
         "query": query,
         "selected_genre": genre,
@@ -192,17 +250,17 @@ async def search_page(
 
 # Movie Detail Page
 @app.get("/movie/{movie_id}", response_class=HTMLResponse)
-async def movie_detail(request: Request, movie_id: int, db: Session = Depends(get_db)):
+async def movie_detail(request: Request, movie_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """Film detailpagina"""
-    user = get_current_user_from_cookie(request, db)
+    user = await get_current_user_async(request, db)
 
     # Get movie details
-    movie = tmdb_request(f"/movie/{movie_id}")
+    movie = await tmdb_request_async(f"/movie/{movie_id}")
     if not movie:
         raise HTTPException(status_code=404, detail="Movie not found")
 
     # Get videos (trailers)
-    videos = tmdb_request(f"/movie/{movie_id}/videos")
+    videos = await tmdb_request_async(f"/movie/{movie_id}/videos")
     trailer = None
     if videos and videos.get("results"):
         # Find YouTube trailer
@@ -212,71 +270,91 @@ async def movie_detail(request: Request, movie_id: int, db: Session = Depends(ge
                 break
 
     # Get local reviews
-    reviews = db.query(Review).filter(Review.tmdb_id == movie_id).all()
+    reviews = (await db.execute(
+        select(Review).options(selectinload(Review.user)).where(Review.tmdb_id == movie_id)
+    )).scalars().all()
+
+    # Precomputed "similar among our users" neighbours
+    similar_movies = await queries.similar_movies(db, movie_id)
 
     # Check user's list status and get custom lists
     user_status = None
     custom_lists = []
+    followed = set()
     if user:
-        movie_item = db.query(MovieItem).filter(
-            MovieItem.tmdb_id == movie_id).first()
-        if movie_item:
-            user_movie = db.query(UserMovie).filter(
+        followed = await feed.followed_ids(db, user.id, [review.user_id for review in reviews if review.user_id != user.id])
+        user_status = (await db.execute(
+            select(UserMovie.status).join(MovieItem).where(
                 UserMovie.user_id == user.id,
-                UserMovie.movie_id == movie_item.id
-            ).first()
-            if user_movie:
-                user_status = user_movie.status
+                MovieItem.tmdb_id == movie_id,
+                UserMovie.custom_list_id.is_(None)
+            ).limit(1)
+        )).scalar()
 
         # Get user's custom lists
-        custom_lists = db.query(CustomList).filter(
-            CustomList.user_id == user.id).all()
+        custom_lists = (await db.execute(
+            select(CustomList).where(CustomList.user_id == user.id)
+        )).scalars().all()
 
     return templates.TemplateResponse("movie_detail.html", {
         "request": request,
         "user": user,
         "movie": movie,
+        "movie_version": data_version(movie),
         "trailer": trailer,
         "reviews": reviews,
         "user_status": user_status,
         "custom_lists": custom_lists,
+        "followed": followed,
+        "similar_movies": similar_movies,
         "image_base_url": TMDB_IMAGE_BASE_URL
     })
 
 
+def wants_json(request: Request) -> bool:
+    """Fetch vanuit de templates vraagt om JSON; een gewoon formulier krijgt de redirect"""
+    return "application/json" in request.headers.get("accept", "")
+
+
+async def get_or_create_movie_item(db: Session, movie_id: int) -> MovieItem:
+    """Bestaand MovieItem, of een nieuw item met de details van TMDB
+
+    Alleen een onbekende film kost een TMDB call; ontbrekende details van
+    bestaande items vult de movie_metadata job aan.
+    """
+    movie_item = db.query(MovieItem).filter(MovieItem.tmdb_id == movie_id).first()
+    if movie_item:
+        return movie_item
+
+    movie = await tmdb_request_async(f"/movie/{movie_id}")
+    if not movie:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    movie_item = MovieItem(tmdb_id=movie_id, metadata_fetched_at=datetime.utcnow(), **movie_fields(movie))
+    db.add(movie_item)
+    db.flush()
+    return movie_item
+
+
 # Add movie to list
 @app.post("/movie/{movie_id}/add-to-list")
 async def add_to_list(
+    request: Request,
     movie_id: int,
     status: str = Form(...),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user_required)
 ):
     """Voeg film toe aan lijst"""
-    # Get movie details from TMDB
-    movie = tmdb_request(f"/movie/{movie_id}")
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
+    movie_item = await get_or_create_movie_item(db, movie_id)
 
-    # Find or create movie item
-    movie_item = db.query(MovieItem).filter(
-        MovieItem.tmdb_id == movie_id).first()
-    if not movie_item:
-        movie_item = MovieItem(
-            tmdb_id=movie_id,
-            title=movie["title"],
-            poster_path=movie.get("poster_path")
-        )
-        db.add(movie_item)
-        db.commit()
-        db.refresh(movie_item)
-
-    # Check if already in list
+    # Check if already in list (custom lists staan er los van)
     user_movie = db.query(UserMovie).filter(
         UserMovie.user_id == user.id,
-        UserMovie.movie_id == movie_item.id
+        UserMovie.movie_id == movie_item.id,
+        UserMovie.custom_list_id.is_(None)
     ).first()
 
+    previous_status = user_movie.status if user_movie else None
     if user_movie:
         # Update status
         user_movie.status = status
@@ -286,35 +364,45 @@ async def add_to_list(
             user_id=user.id, movie_id=movie_item.id, status=status)
         db.add(user_movie)
 
+    if status == "watched" and previous_status != "watched":
+        feed.record_activity(db, user, "watched", movie_item)
+    elif previous_status == "watched" and status != "watched":
+        feed.remove_activities(db, user.id, "watched", [movie_id])
     db.commit()
+    invalidate_stats(user.id)
+    if wants_json(request):
+        return {"movie_id": movie_id, "status": status}
     return RedirectResponse(url=f"/movie/{movie_id}", status_code=303)
 
 
 # Remove movie from list
 @app.post("/movie/{movie_id}/remove-from-list")
 async def remove_from_list(
+    request: Request,
     movie_id: int,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user_required)
 ):
     """Verwijder film van lijst"""
-    movie_item = db.query(MovieItem).filter(
-        MovieItem.tmdb_id == movie_id).first()
-    if movie_item:
-        user_movie = db.query(UserMovie).filter(
-            UserMovie.user_id == user.id,
-            UserMovie.movie_id == movie_item.id
-        ).first()
-        if user_movie:
-            db.delete(user_movie)
-            db.commit()
+    removed = db.query(UserMovie).filter(
+        UserMovie.user_id == user.id,
+        UserMovie.movie_id == select(MovieItem.id).where(MovieItem.tmdb_id == movie_id).scalar_subquery(),
+        UserMovie.custom_list_id.is_(None)
+    ).delete(synchronize_session=False)
+    if removed:
+        feed.remove_activities(db, user.id, "watched", [movie_id])
+        db.commit()
+        invalidate_stats(user.id)
 
+    if wants_json(request):
+        return {"movie_id": movie_id, "status": None}
     return RedirectResponse(url=f"/movie/{movie_id}", status_code=303)
 
 
 # Add review
 @app.post("/movie/{movie_id}/review")
 async def add_review(
+    request: Request,
     movie_id: int,
     rating: float = Form(...),
     review_text: str = Form(""),
@@ -323,15 +411,17 @@ async def add_review(
 ):
     """Voeg review toe"""
     # Check if user already reviewed this movie
-    existing_review = db.query(Review).filter(
+    review = db.query(Review).filter(
         Review.user_id == user.id,
         Review.tmdb_id == movie_id
     ).first()
 
-    if existing_review:
+    created = review is None
+    created_at = review.created_at if review else datetime.utcnow()
+    if review:
         # Update existing review
-        existing_review.rating = rating
-        existing_review.review_text = review_text
+        review.rating = rating
+        review.review_text = review_text
     else:
         # Create new review
         review = Review(
@@ -342,67 +432,39 @@ async def add_review(
         )
         db.add(review)
 
+    db.flush()
+    feed.record_review(db, user, movie_id, rating, review_text)
     db.commit()
+    invalidate_stats(user.id)
+    if wants_json(request):
+        return {
+            "movie_id": movie_id,
+            "created": created,
+            "review": {
+                "username": user.username,
+                "rating": rating,
+                "review_text": review_text,
+                "created_at": created_at.strftime('%d-%m-%Y'),
+            },
+        }
     return RedirectResponse(url=f"/movie/{movie_id}", status_code=303)
 
 
 # Profile Page
 @app.get("/profile", response_class=HTMLResponse)
-async def profile(request: Request, db: Session = Depends(get_db)):
+async def profile(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Profiel pagina"""
-    user = get_current_user_required(request, db)
+    user = await get_current_user_required_async(request, db)
 
     # Get user's lists (limit to first 20 for performance)
-    watchlist_items = db.query(UserMovie).filter(
-        UserMovie.user_id == user.id,
-        UserMovie.status == "watchlist"
-    ).limit(20).all()
-
-    watched_items = db.query(UserMovie).filter(
-        UserMovie.user_id == user.id,
-        UserMovie.status == "watched"
-    ).limit(20).all()
-
-    # Use cached data from MovieItem table
-    watchlist = []
-    for um in watchlist_items:
-        watchlist.append({
-            "id": um.movie.tmdb_id,
-            "title": um.movie.title,
-            "poster_path": um.movie.poster_path,
-            "vote_average": 0  # Default value
-        })
-
-    watched = []
-    for um in watched_items:
-        watched.append({
-            "id": um.movie.tmdb_id,
-            "title": um.movie.title,
-            "poster_path": um.movie.poster_path,
-            "vote_average": 0  # Default value
-        })
+    watchlist = await queries.user_movies_by_status(db, user.id, "watchlist", 20)
+    watched = await queries.user_movies_by_status(db, user.id, "watched", 20)
 
     # Get user's reviews (limit to 10 most recent)
-    reviews = db.query(Review).filter(
-        Review.user_id == user.id
-    ).order_by(Review.created_at.desc()).limit(10).all()
-
-    reviews_with_movies = []
-    for review in reviews:
-        # Find movie in database
-        movie_item = db.query(MovieItem).filter(
-            MovieItem.tmdb_id == review.tmdb_id
-        ).first()
-
-        if movie_item:
-            reviews_with_movies.append({
-                "movie": {
-                    "id": movie_item.tmdb_id,
-                    "title": movie_item.title,
-                    "poster_path": movie_item.poster_path
-                },
-                "review": review
-            })
+    reviews_with_movies = await queries.recent_reviews_with_movies(db, user.id, 10)
+
+    # Recommendations based on recently watched movies
+    recommendations = await queries.recommended_for_user(db, user.id)
 
     return templates.TemplateResponse("profile.html", {
         "request": request,
@@ -410,10 +472,97 @@ async def profile(request: Request, db: Session = Depends(get_db)):
         "watchlist": watchlist,
         "watched": watched,
         "reviews": reviews_with_movies,
+        "recommendations": recommendations,
         "image_base_url": TMDB_IMAGE_BASE_URL
     })
 
 
+@app.get("/profile/stats", response_class=HTMLResponse)
+async def profile_stats(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    """Statistieken pagina"""
+    user = await get_current_user_required_async(request, db)
+    from stats import get_user_stats
+
+    # Opnieuw berekenen gebeurt op de primary: de invalidatie na een import
+    # komt van de worker, dus de sticky cookie beschermt hier niet tegen een
+    # achterlopende replica, en het resultaat blijft STATS_CACHE_TTL staan.
+    # Een sessie zonder queries (cache hit) opent geen connectie.
+    async with AsyncSessionLocal() as primary:
+        stats = await get_user_stats(primary, user.id)
+
+    genres_data = await tmdb_request_async("/genre/movie/list")
+    genre_names = {genre["id"]: genre["name"] for genre in (genres_data or {}).get("genres", [])}
+
+    return templates.TemplateResponse("profile_stats.html", {
+        "request": request,
+        "user": user,
+        "stats": stats,
+        "genre_names": genre_names,
+    })
+
+
+# Activity feed
+@app.get("/feed", response_class=HTMLResponse)
+async def feed_page(request: Request, before: int = None, db: AsyncSession = Depends(get_async_read_db)):
+    """Activiteit van gebruikers die je volgt"""
+    user = await get_current_user_required_async(request, db)
+    entries = await feed.read_feed(db, user.id, before)
+
+    return templates.TemplateResponse("feed.html", {
+        "request": request,
+        "user": user,
+        "entries": entries,
+        "following": await feed.following(db, user.id),
+        "next_before": entries[-1].id if len(entries) == feed.FEED_PAGE_SIZE else None,
+        "image_base_url": TMDB_IMAGE_BASE_URL
+    })
+
+
+def _follow_redirect(next_url: str) -> str:
+    # Alleen paden binnen de site
+    return next_url if next_url.startswith("/") and not next_url.startswith("//") else "/feed"
+
+
+@app.post("/follow")
+async def follow_user(
+    request: Request,
+    username: str = Form(...),
+    next: str = Form("/feed"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user_required)
+):
+    """Volg een gebruiker"""
+    followee = db.query(User).filter(User.username == username.strip()).first()
+    if not followee:
+        raise HTTPException(status_code=404, detail="User not found")
+    feed.follow(db, user.id, followee)
+    db.commit()
+
+    if wants_json(request):
+        return {"username": followee.username, "following": followee.id != user.id}
+    return RedirectResponse(url=_follow_redirect(next), status_code=303)
+
+
+@app.post("/unfollow")
+async def unfollow_user(
+    request: Request,
+    username: str = Form(...),
+    next: str = Form("/feed"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user_required)
+):
+    """Ontvolg een gebruiker"""
+    followee = db.query(User).filter(User.username == username.strip()).first()
+    if not followee:
+        raise HTTPException(status_code=404, detail="User not found")
+    feed.unfollow(db, user.id, followee)
+    db.commit()
+
+    if wants_json(request):
+        return {"username": followee.username, "following": False}
+    return RedirectResponse(url=_follow_redirect(next), status_code=303)
+
+
 # Login Page
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request, db: Session = Depends(get_db)):
@@ -539,7 +688,7 @@ async def logout():
 
 # Custom Lists Management
 @app.get("/lists", response_class=HTMLResponse)
-async def lists_page(request: Request, db: Session = Depends(get_db)):
+async def lists_page(request: Request, db: Session = Depends(get_read_db)):
     """Pagina met alle custom lists van de gebruiker"""
     user = get_current_user_required(request, db)
 
@@ -562,7 +711,7 @@ async def lists_page(request: Request, db: Session = Depends(get_db)):
 
         movies = []
         for um in user_movies:
-            movie_data = tmdb_request(f"/movie/{um.movie.tmdb_id}")
+            movie_data = await tmdb_request_async(f"/movie/{um.movie.tmdb_id}")
             if movie_data:
                 movies.append(movie_data)
 
@@ -599,14 +748,11 @@ async def create_list(
 
 
 @app.get("/lists/{list_id}", response_class=HTMLResponse)
-async def view_list(request: Request, list_id: int, page: int = 1, db: Session = Depends(get_db)):
+async def view_list(request: Request, list_id: int, page: int = 1, db: AsyncSession = Depends(get_async_read_db)):
     """Bekijk een specifieke custom list met pagination"""
-    user = get_current_user_required(request, db)
+    user = await get_current_user_required_async(request, db)
 
-    custom_list = db.query(CustomList).filter(
-        CustomList.id == list_id,
-        CustomList.user_id == user.id
-    ).first()
+    custom_list = await queries.get_list(db, list_id, user.id)
 
     if not custom_list:
         raise HTTPException(status_code=404, detail="List not found")
@@ -616,33 +762,12 @@ async def view_list(request: Request, list_id: int, page: int = 1, db: Session =
     offset = (page - 1) * per_page
 
     # Get total count
-    total_movies = db.query(UserMovie).filter(
-        UserMovie.custom_list_id == list_id
-    ).count()
+    total_movies = await queries.count_list_movies(db, list_id)
 
     total_pages = (total_movies + per_page - 1) // per_page  # Ceiling division
 
-    # Get only movies for current page
-    user_movies = db.query(UserMovie).filter(
-        UserMovie.custom_list_id == list_id
-    ).offset(offset).limit(per_page).all()
-
-    # Batch load movies efficiently
-    movies = []
-    tmdb_ids = [um.movie.tmdb_id for um in user_movies]
-
-    # Use cached data from MovieItem table when possible
-    for um in user_movies:
-        # First try to use cached data
-        movie_data = {
-            "id": um.movie.tmdb_id,
-            "title": um.movie.title,
-            "poster_path": um.movie.poster_path
-        }
-
-        # Only fetch full details if needed (you can make this optional)
-        # For performance, we'll just use the cached data
-        movies.append(movie_data)
+    # Get only movies for current page, using cached data from MovieItem table
+    movies = await queries.list_movies(db, list_id, offset, per_page)
 
     return templates.TemplateResponse("list_detail.html", {
         "request": request,
@@ -658,6 +783,7 @@ async def view_list(request: Request, list_id: int, page: int = 1, db: Session =
 
 @app.post("/lists/{list_id}/add-movie/{movie_id}")
 async def add_movie_to_list(
+    request: Request,
     list_id: int,
     movie_id: int,
     db: Session = Depends(get_db),
@@ -665,7 +791,7 @@ async def add_movie_to_list(
 ):
     """Voeg film toe aan custom list"""
     # Verify list ownership
-    custom_list = db.query(CustomList).filter(
+    custom_list = db.query(CustomList.id).filter(
         CustomList.id == list_id,
         CustomList.user_id == user.id
     ).first()
@@ -673,26 +799,10 @@ async def add_movie_to_list(
     if not custom_list:
         raise HTTPException(status_code=404, detail="List not found")
 
-    # Get movie details from TMDB
-    movie = tmdb_request(f"/movie/{movie_id}")
-    if not movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
-
-    # Find or create movie item
-    movie_item = db.query(MovieItem).filter(
-        MovieItem.tmdb_id == movie_id).first()
-    if not movie_item:
-        movie_item = MovieItem(
-            tmdb_id=movie_id,
-            title=movie["title"],
-            poster_path=movie.get("poster_path")
-        )
-        db.add(movie_item)
-        db.commit()
-        db.refresh(movie_item)
+    movie_item = await get_or_create_movie_item(db, movie_id)
 
     # Check if already in list
-    existing = db.query(UserMovie).filter(
+    existing = db.query(UserMovie.id).filter(
         UserMovie.user_id == user.id,
         UserMovie.movie_id == movie_item.id,
         UserMovie.custom_list_id == list_id
@@ -706,8 +816,10 @@ async def add_movie_to_list(
             custom_list_id=list_id
         )
         db.add(user_movie)
-        db.commit()
+    db.commit()
 
+    if wants_json(request):
+        return {"movie_id": movie_id, "list_id": list_id, "added": not existing}
     return RedirectResponse(url=f"/lists/{list_id}", status_code=303)
 
 
@@ -725,6 +837,14 @@ async def delete_list(
 
     if custom_list:
         db.delete(custom_list)
+        db.query(ImportedRow).filter(
+            ImportedRow.user_id == user.id,
+            ImportedRow.target == str(list_id)
+        ).delete(synchronize_session=False)
+        db.query(ImportSync).filter(
+            ImportSync.user_id == user.id,
+            ImportSync.target == str(list_id)
+        ).delete(synchronize_session=False)
         db.commit()
 
     return RedirectResponse(url="/lists", status_code=303)
@@ -740,123 +860,48 @@ async def import_page(request: Request, db: Session = Depends(get_db)):
     custom_lists = db.query(CustomList).filter(
         CustomList.user_id == user.id).all()
 
+    # Recent import jobs with their progress
+    jobs = db.query(Job).filter(
+        Job.user_id == user.id,
+        Job.kind == "import"
+    ).order_by(Job.created_at.desc()).limit(10).all()
+
     return templates.TemplateResponse("import.html", {
         "request": request,
         "user": user,
-        "custom_lists": custom_lists
+        "custom_lists": custom_lists,
+        "jobs": [job_status(job) for job in jobs]
     })
 
 
-def process_import_background(csv_data: list, import_type: str, target: str, user_id: int, custom_list_id: int = None):
-    """Achtergrond taak voor het importeren van films"""
-    from models import get_db
-
-    db = next(get_db())
-
-    imported_count = 0
-    skipped_count = 0
-    error_count = 0
-    batch_size = 20
-    batch_count = 0
-
-    try:
-        for idx, row in enumerate(csv_data):
-            try:
-                title = None
-                year = None
-
-                if import_type == 'letterboxd':
-                    title = row.get('Name')
-                    year = row.get('Year')
-                elif import_type == 'imdb':
-                    title = row.get('Title') or row.get('title')
-                    year = row.get('Year') or row.get('year')
-
-                if not title:
-                    skipped_count += 1
-                    continue
-
-                # Search movie on TMDB
-                search_query = f"{title} {year}" if year else title
-                search_results = tmdb_request("/search/movie", {"query": search_query})
-
-                if not search_results or not search_results.get('results'):
-                    skipped_count += 1
-                    continue
-
-                # Take first result
-                movie = search_results['results'][0]
-                movie_id = movie['id']
-
-                # Find or create movie item
-                movie_item = db.query(MovieItem).filter(MovieItem.tmdb_id == movie_id).first()
-                if not movie_item:
-                    movie_item = MovieItem(
-                        tmdb_id=movie_id,
-                        title=movie['title'],
-                        poster_path=movie.get('poster_path')
-                    )
-                    db.add(movie_item)
-                    db.flush()
-
-                # Check if already exists
-                existing = db.query(UserMovie).filter(
-                    UserMovie.user_id == user_id,
-                    UserMovie.movie_id == movie_item.id,
-                    UserMovie.status == target if target in ['watchlist', 'watched'] else 'custom',
-                    UserMovie.custom_list_id == custom_list_id
-                ).first()
-
-                if not existing:
-                    user_movie = UserMovie(
-                        user_id=user_id,
-                        movie_id=movie_item.id,
-                        status=target if target in ['watchlist', 'watched'] else 'custom',
-                        custom_list_id=custom_list_id
-                    )
-                    db.add(user_movie)
-                    imported_count += 1
-                else:
-                    skipped_count += 1
-
-                # Batch commit elke 20 items
-                batch_count += 1
-                if batch_count >= batch_size:
-                    db.commit()
-                    batch_count = 0
-
-            except Exception as e:
-                error_count += 1
-                print(f"Error importing '{title}': {str(e)}")
-                continue
-
-        # Final commit voor resterende items
-        db.commit()
-
-        print(f"Import voltooid: {imported_count} geïmporteerd, {skipped_count} overgeslagen, {error_count} errors")
-
-    except Exception as e:
-        print(f"Fatal error in background import: {str(e)}")
-        db.rollback()
-    finally:
-        db.close()
+@app.get("/import/jobs/{job_id}")
+async def import_job_status(job_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user_required)):
+    """Status van een import job als JSON"""
+    job = db.query(Job).filter(Job.id == job_id, Job.user_id == user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
 
 
 @app.post("/import/csv")
 async def import_csv(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     import_type: str = Form(...),
     target: str = Form(...),
+    sync: bool = Form(False),
+    remove_missing: bool = Form(False),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user_required)
 ):
-    """Import CSV bestand (Letterboxd of IMDb) - Asynchroon via background task"""
+    """Import CSV bestand (Letterboxd of IMDb) - Asynchroon via de job queue"""
 
     # Read CSV file
     contents = await file.read()
     text = contents.decode('utf-8')
-    csv_reader = list(csv.DictReader(io.StringIO(text)))
+    reader = csv.DictReader(io.StringIO(text))
+    csv_reader = list(reader)
+    # watched.csv, ratings.csv, ... kunnen in hetzelfde doel landen; elk met eigen sync
+    kind = export_kind(import_type, reader.fieldnames)
 
     total_rows = len(csv_reader)
 
@@ -873,18 +918,42 @@ async def import_csv(
     if target not in ['watchlist', 'watched']:
         custom_list_id = int(target)
 
-    # Start background task
-    background_tasks.add_task(
-        process_import_background,
-        csv_reader,
-        import_type,
-        target,
-        user.id,
-        custom_list_id
-    )
+    payload = {
+        "import_type": import_type,
+        "export_kind": kind,
+        "target": target,
+        "custom_list_id": custom_list_id
+    }
+
+    if sync:
+        # Alleen de verschillen met de vorige import verwerken
+        file_hash = file_fingerprint(contents)
+        if file_hash == last_synced_file(db, user.id, target, import_type, kind):
+            message = "Dit bestand is al gesynchroniseerd, er zijn geen wijzigingen."
+            if custom_list_id:
+                return RedirectResponse(url=f"/lists/{custom_list_id}?msg={message}", status_code=303)
+            return RedirectResponse(url=f"/profile?msg={message}", status_code=303)
+
+        new_rows, removed_hashes = plan_sync(db, user.id, target, import_type, kind, csv_reader)
+        payload.update({
+            "rows": new_rows,
+            "sync": True,
+            "removed_hashes": removed_hashes if remove_missing else [],
+            "file_hash": file_hash,
+            "file_rows": total_rows,
+        })
+        message = f"Sync gestart: {len(new_rows)} nieuwe films"
+        if remove_missing:
+            message += f", {len(removed_hashes)} verwijderd"
+        message += ". Bekijk de voortgang op de import pagina."
+    else:
+        payload["rows"] = csv_reader
+        message = f"Import gestart voor {total_rows} films. Dit kan enkele minuten duren. Bekijk de voortgang op de import pagina."
+
+    # Queue the import for the job worker
+    enqueue_job(db, "import", payload, user_id=user.id, total=len(payload["rows"]))
 
     # Redirect immediately with processing message
-    message = f"Import gestart voor {total_rows} films. Dit kan enkele minuten duren. Ververs de pagina om resultaten te zien."
 
     if custom_list_id:
         return RedirectResponse(url=f"/lists/{custom_list_id}?msg={message}", status_code=303)
@@ -892,6 +961,107 @@ async def import_csv(
         return RedirectResponse(url=f"/profile?msg={message}", status_code=303)
 
 
+# Export functionality
+def _export_response(body, filename: str, fmt: str) -> StreamingResponse:
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+
+@app.get("/export/lists/{list_id}")
+async def export_list(request: Request, list_id: int, format: str = "csv", db: AsyncSession = Depends(get_async_db)):
+    """Exporteer een custom list als CSV of JSONL"""
+    user = await get_current_user_required_async(request, db)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Onbekend formaat")
+
+    custom_list = await queries.get_list(db, list_id, user.id)
+    if not custom_list:
+        raise HTTPException(status_code=404, detail="List not found")
+
+    return _export_response(
+        export_movies(user.id, format, custom_list_id=list_id), f"moviespace-list-{list_id}", format
+    )
+
+
+@app.get("/export/{collection}")
+async def export_collection(request: Request, collection: str, format: str = "csv", db: AsyncSession = Depends(get_async_db)):
+    """Exporteer watchlist, gekeken films of reviews als CSV of JSONL"""
+    user = await get_current_user_required_async(request, db)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Onbekend formaat")
+
+    if collection in ["watchlist", "watched"]:
+        body = export_movies(user.id, format, status=collection)
+    elif collection == "reviews":
+        body = export_reviews(user.id, format)
+    else:
+        raise HTTPException(status_code=404, detail="Onbekende export")
+
+    return _export_response(body, f"moviespace-{collection}", format)
+
+
+# Profiling (alleen voor beheerders, zie profiling.py)
+@app.get("/admin/profiles", response_class=HTMLResponse)
+async def admin_profiles(request: Request):
+    """Recente request profielen"""
+    username = require_admin(request)
+    return templates.TemplateResponse("admin_profiles.html", {
+        "request": request,
+        "user": {"username": username},
+        "enabled": profiling.PROFILING_ENABLED,
+        "sample_rate": profiling.PROFILE_SAMPLE_RATE,
+        "profiles": profiling.recent_profiles(),
+        "profile": None,
+    })
+
+
+@app.get("/admin/profiles/{profile_id}", response_class=HTMLResponse)
+async def admin_profile_detail(request: Request, profile_id: str):
+    """Duurste functies van één profiel"""
+    username = require_admin(request)
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return templates.TemplateResponse("admin_profiles.html", {
+        "request": request,
+        "user": {"username": username},
+        "enabled": profiling.PROFILING_ENABLED,
+        "sample_rate": profiling.PROFILE_SAMPLE_RATE,
+        "profiles": [],
+        "profile": profile,
+    })
+
+
+@app.get("/admin/profiles/{profile_id}/flamegraph.txt")
+async def admin_profile_flamegraph(request: Request, profile_id: str):
+    """Collapsed stacks voor flamegraph.pl, speedscope of inferno"""
+    require_admin(request)
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=profiling.to_collapsed(profile),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed.txt"'},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+
+    # Lokaal starten migreert eerst; in Docker doet python migrate.py dat
+    init_db()
+    if os.getenv("APP_ENV") == "production":
+        # Productie: meerdere workers, geen reload (zie gunicorn.conf.py voor de Docker setup)
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=int(os.getenv("PORT", "8080")),
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            proxy_headers=True,
+        )
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
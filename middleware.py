@@ -0,0 +1,314 @@
+import gzip
+import os
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+
+from cache import PAGE_CACHE_MAX_AGE, etag_for, etag_matches
+from models import PRIMARY_COOKIE, REPLICA_STICKY_SECONDS, replica_engines
+
+try:
+    import brotli
+except ImportError:  # brotli is optioneel, zonder valt de app terug op gzip
+    brotli = None
+
+
+# Configuration
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+
+# Cache-Control per soort route
+CACHE_POLICIES = {
+    "robots": "public, max-age=86400",
+    "sitemap": "public, max-age=3600",
+    "anonymous": f"public, max-age={PAGE_CACHE_MAX_AGE}",
+    "authenticated": "private, no-cache",
+    "default": "no-cache",
+}
+
+PUBLIC_PAGE_PREFIXES = ("/search", "/movie/")
+
+
+def route_class(path: str, authenticated: bool) -> str:
+    """Bepaal de cache-klasse van een request"""
+    if path == "/robots.txt":
+        return "robots"
+    if path == "/sitemap.xml":
+        return "sitemap"
+    if authenticated:
+        return "authenticated"
+    if path == "/" or path.startswith(PUBLIC_PAGE_PREFIXES):
+        return "anonymous"
+    return "default"
+
+
+def _append_vary(headers: MutableHeaders, value: str):
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = value
+    elif value.lower() not in [v.strip().lower() for v in vary.split(",")]:
+        headers["Vary"] = f"{vary}, {value}"
+
+
+def _not_modified(request: Request, headers: MutableHeaders) -> bool:
+    """Conditional GET: eerst If-None-Match, anders If-Modified-Since"""
+    etag = headers.get("etag")
+    if request.headers.get("if-none-match"):
+        return bool(etag) and etag_matches(request, etag.removeprefix("W/"))
+
+    last_modified = headers.get("last-modified")
+    if_modified_since = request.headers.get("if-modified-since")
+    if not last_modified or not if_modified_since:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def _client_etag(request: Request, etag: str) -> str:
+    """De ETag zoals de client hem kent: na compressie is dat de zwakke W/ variant"""
+    candidates = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    strong = etag.removeprefix("W/")
+    if strong not in candidates and f"W/{strong}" in candidates:
+        return f"W/{strong}"
+    return etag
+
+
+class HTTPCacheMiddleware:
+    """Zet Cache-Control per route-klasse, voegt ETags toe en beantwoordt conditional GETs met 304"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        authenticated = "access_token" in request.cookies
+        policy_class = route_class(request.url.path, authenticated)
+        policy = CACHE_POLICIES[policy_class]
+        start_message = None
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, streaming
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = MutableHeaders(scope=message)
+                if message["status"] == 200 and "cache-control" not in headers:
+                    headers["Cache-Control"] = policy
+                if policy_class == "anonymous":
+                    _append_vary(headers, "Cookie")
+                return
+
+            if streaming or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if message.get("more_body", False):
+                # Streaming responses worden niet gebufferd
+                streaming = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start_message)
+            if start_message["status"] == 200:
+                if "etag" not in headers:
+                    headers["ETag"] = etag_for(body)
+                if _not_modified(request, headers):
+                    # CompressionMiddleware laat een 304 ongemoeid, dus hier de representatie van de client
+                    headers["ETag"] = _client_etag(request, headers["etag"])
+                    kept = [
+                        (key, value) for key, value in start_message["headers"]
+                        if key.lower() not in (b"content-length", b"content-type")
+                    ]
+                    await send({"type": "http.response.start", "status": 304, "headers": kept})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+            await send(start_message)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+    @staticmethod
+    def compress_all(data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+    @staticmethod
+    def compress_all(data: bytes) -> bytes:
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def _quality(params: list) -> float:
+    """q-waarde van een Accept-Encoding item; zonder q is dat 1"""
+    for param in params:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def choose_encoder(accept_encoding: str):
+    """Kies brotli als de client en server het ondersteunen, anders gzip"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        if _quality(params) > 0:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return _BrotliEncoder
+    if "gzip" in accepted:
+        return _GzipEncoder
+    return None
+
+
+class CompressionMiddleware:
+    """Comprimeer tekstuele responses met brotli of gzip boven een minimale grootte"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoder_class = choose_encoder(Headers(scope=scope).get("accept-encoding", ""))
+        if encoder_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(scope=message)
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    message["status"] in (204, 304)
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(scope=start_message)
+
+            if encoder is None:
+                _append_vary(headers, "Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                headers["Content-Encoding"] = encoder_class.name
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+
+                if not more_body:
+                    compressed = encoder_class.compress_all(body)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    passthrough = True
+                    return
+
+                del headers["Content-Length"]
+                encoder = encoder_class()
+                await send(start_message)
+
+            chunk = encoder.compress(body)
+            if not more_body:
+                chunk += encoder.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrimaryStickinessMiddleware:
+    """Markeer na een schrijvend request dat deze client even van de primary moet lezen
+
+    De cookie bevat het tijdstip tot wanneer; get_read_db en get_async_read_db
+    kijken ernaar. Zonder replicas doet deze middleware niets.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS") or not replica_engines:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + REPLICA_STICKY_SECONDS
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{PRIMARY_COOKIE}={until:.0f}; Max-Age={REPLICA_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
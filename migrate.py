@@ -0,0 +1,16 @@
+"""Database schema aanmaken en migreren
+
+Eenmalig uitvoeren voor het starten van de app en de worker:
+    python migrate.py
+
+Meerdere gelijktijdige runs wachten op elkaar (zie models._migration_lock).
+"""
+import time
+
+from models import init_db, engine
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    init_db()
+    print(f"Database {engine.url.render_as_string(hide_password=True)} gemigreerd in {time.perf_counter() - started:.2f}s")
@@ -1,7 +1,22 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import create_engine, text, Column, Integer, String, Float, ForeignKey, DateTime, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.requests import Request
+from contextlib import contextmanager
 from datetime import datetime
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+load_dotenv()
 
 Base = declarative_base()
 
@@ -13,6 +28,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    follower_count = Column(Integer, default=0)  # bepaalt fan-out-on-write of -on-read (zie feed.py)
 
     # Relationships
     user_movies = relationship("UserMovie", back_populates="user", cascade="all, delete-orphan")
@@ -29,6 +45,15 @@ class MovieItem(Base):
     poster_path = Column(String)
     added_at = Column(DateTime, default=datetime.utcnow)
 
+    # Metadata voor statistieken; leeg tot de film bij TMDB is opgehaald
+    release_date = Column(String)  # 'YYYY-MM-DD'
+    runtime = Column(Integer)  # minuten
+    original_language = Column(String)
+    genre_ids = Column(String)  # TMDB genre ids, komma gescheiden
+    vote_average = Column(Float)
+    popularity = Column(Float)
+    metadata_fetched_at = Column(DateTime)  # details opgehaald (of definitief niet gevonden)
+
     # Relationships
     user_movies = relationship("UserMovie", back_populates="movie", cascade="all, delete-orphan")
 
@@ -41,13 +66,18 @@ class UserMovie(Base):
     movie_id = Column(Integer, ForeignKey("movie_items.id"), nullable=False)
     status = Column(String, nullable=False)  # 'watchlist', 'watched'
     custom_list_id = Column(Integer, ForeignKey("custom_lists.id"), nullable=True)
-    added_at = Column(DateTime, default=datetime.utcnow)
+    added_at = Column(DateTime, default=datetime.utcnow)  # kijkdatum; bij import uit de export
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # wanneer wij de rij schreven
 
     # Relationships
     user = relationship("User", back_populates="user_movies")
     movie = relationship("MovieItem", back_populates="user_movies")
     custom_list = relationship("CustomList", back_populates="movies")
 
+    __table_args__ = (
+        Index("ix_user_movies_user_id_status", "user_id", "status"),
+    )
+
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -62,6 +92,12 @@ class Review(Base):
 
     # Relationships
     user = relationship("User", back_populates="reviews")
+
+    __table_args__ = (
+        Index("ix_reviews_user_id", "user_id"),
+    )
+
+
 class CustomList(Base):
     __tablename__ = "custom_lists"
 
@@ -76,12 +112,158 @@ class CustomList(Base):
     movies = relationship("UserMovie", back_populates="custom_list", cascade="all, delete-orphan")
 
 
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    kind = Column(String, nullable=False)  # 'import', 'warm_cache', 'seed_catalog', ...
+    status = Column(String, nullable=False, default="queued", index=True)  # 'queued', 'running', 'done', 'failed'
+    payload = Column(Text)  # JSON
+    result = Column(Text)  # JSON met tellers
+    progress = Column(Integer, default=0)  # checkpoint: aantal verwerkte rijen
+    total = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    last_error = Column(Text)
+    run_after = Column(DateTime, default=datetime.utcnow, index=True)
+    locked_by = Column(String)
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ImportedRow(Base):
+    __tablename__ = "imported_rows"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    target = Column(String, nullable=False)  # 'watchlist', 'watched' of custom list id
+    source = Column(String, nullable=False)  # 'letterboxd', 'imdb'
+    export_kind = Column(String, nullable=False, default="")  # 'films', 'ratings', 'diary', ... (zie importer.export_kind)
+    row_hash = Column(String, nullable=False)  # vingerafdruk van de CSV rij
+    movie_id = Column(Integer, ForeignKey("movie_items.id"), nullable=True)  # None: niet gevonden op TMDB
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_imported_rows_user_target_kind_hash", "user_id", "target", "source", "export_kind", "row_hash", unique=True),
+    )
+
+
+class ImportSync(Base):
+    __tablename__ = "import_syncs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    target = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    export_kind = Column(String, nullable=False, default="")
+    file_hash = Column(String, nullable=False)  # vingerafdruk van het laatst gesynchroniseerde bestand
+    row_count = Column(Integer, default=0)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_import_syncs_user_target_kind", "user_id", "target", "source", "export_kind", unique=True),
+    )
+
+
+class MovieSimilarity(Base):
+    __tablename__ = "movie_similarities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tmdb_id = Column(Integer, nullable=False)
+    similar_tmdb_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    rank = Column(Integer, nullable=False)  # 1 = meest vergelijkbaar
+
+    __table_args__ = (
+        Index("ix_movie_similarities_tmdb_id_rank", "tmdb_id", "rank"),
+    )
+
+
+class Follow(Base):
+    __tablename__ = "follows"
+
+    id = Column(Integer, primary_key=True, index=True)
+    follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    followee_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_follows_follower_followee", "follower_id", "followee_id", unique=True),
+        Index("ix_follows_followee_id", "followee_id"),
+    )
+
+
+class Activity(Base):
+    __tablename__ = "activities"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # 'review', 'watched', 'import'
+    tmdb_id = Column(Integer)
+    # Kopie van de film, zodat de feed niet met movie_items hoeft te joinen
+    title = Column(String)
+    poster_path = Column(String)
+    rating = Column(Float)
+    review_text = Column(Text)
+    count = Column(Integer)  # 'import': aantal films
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_activities_user_id_id", "user_id", "id"),
+    )
+
+
+class FeedEntry(Base):
+    __tablename__ = "feed_entries"
+
+    # Tijdlijn per gebruiker; de primary key (user_id, activity_id) is de index voor de feed
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
+
+
+class RecommenderState(Base):
+    __tablename__ = "recommender_state"
+
+    id = Column(Integer, primary_key=True)
+    last_interaction_at = Column(DateTime)  # watermark voor incrementele updates
+    full_computed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 
 # Database setup
-engine = create_engine("sqlite:///./moviespace.db", connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./moviespace.db")
+# Read replicas (komma-gescheiden); leeg = alle reads via de primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Zo lang na een eigen POST leest een gebruiker van de primary (read-your-writes)
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+PRIMARY_COOKIE = "db_primary_until"
+
+
+def _connect_args(url: str) -> dict:
+    return {"check_same_thread": False, "timeout": 30} if url.startswith("sqlite") else {}
+
+
+def _async_database_url(url: str) -> str:
+    """Zelfde database, maar via een asyncio driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith(("postgresql://", "postgres://")):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+engine = create_engine(DATABASE_URL, connect_args=_connect_args(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(_async_database_url(DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+replica_engines = [create_engine(url, connect_args=_connect_args(url)) for url in DATABASE_REPLICA_URLS]
+async_replica_engines = [create_async_engine(_async_database_url(url)) for url in DATABASE_REPLICA_URLS]
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -89,11 +271,64 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Async sessie voor de async route handlers, blokkeert de event loop niet"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def reads_from_primary(request: Request = None) -> bool:
+    """Zonder replicas, of kort na een POST van deze gebruiker (zie PrimaryStickinessMiddleware)"""
+    if not replica_engines:
+        return True
+    if request is None:
+        return False
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+
+def get_read_db(request: Request):
+    """Sessie voor read-only routes: een willekeurige replica, of de primary als dat moet"""
+    bind = engine if reads_from_primary(request) else random.choice(replica_engines)
+    db = SessionLocal(bind=bind)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def async_read_session(request: Request = None):
+    """Async sessie op een replica; ook voor code buiten een request (request=None)"""
+    if reads_from_primary(request):
+        return AsyncSessionLocal()
+    return AsyncSessionLocal(bind=random.choice(async_replica_engines))
+
+
+async def get_async_read_db(request: Request):
+    async with async_read_session(request) as db:
+        yield db
+
+MOVIE_METADATA_COLUMNS = [
+    ("release_date", "VARCHAR"),
+    ("runtime", "INTEGER"),
+    ("original_language", "VARCHAR"),
+    ("genre_ids", "VARCHAR"),
+    ("vote_average", "FLOAT"),
+    ("popularity", "FLOAT"),
+]
+
+
 def migrate_database():
     """Migreer database schema voor custom lists"""
     import sqlite3
 
-    conn = sqlite3.connect('moviespace.db')
+    if engine.url.get_backend_name() != "sqlite":
+        return
+
+    conn = sqlite3.connect(engine.url.database)
     cursor = conn.cursor()
 
     try:
@@ -107,6 +342,58 @@ def migrate_database():
             conn.commit()
             print("Migration complete!")
 
+        if 'updated_at' not in columns:
+            print("Migrating database: Adding user_movies.updated_at column...")
+            cursor.execute("ALTER TABLE user_movies ADD COLUMN updated_at DATETIME")
+            # Bestaande rijen zaten al in de vorige berekening; added_at is goed genoeg
+            cursor.execute("UPDATE user_movies SET updated_at = added_at")
+            conn.commit()
+
+        # Metadata kolommen op movie_items
+        cursor.execute("PRAGMA table_info(movie_items)")
+        movie_columns = [column[1] for column in cursor.fetchall()]
+        for name, sql_type in MOVIE_METADATA_COLUMNS:
+            if movie_columns and name not in movie_columns:
+                print(f"Migrating database: Adding movie_items.{name} column...")
+                cursor.execute(f"ALTER TABLE movie_items ADD COLUMN {name} {sql_type}")
+        conn.commit()
+        if movie_columns and 'metadata_fetched_at' not in movie_columns:
+            print("Migrating database: Adding movie_items.metadata_fetched_at column...")
+            cursor.execute("ALTER TABLE movie_items ADD COLUMN metadata_fetched_at DATETIME")
+            # runtime = 0 kon ook een tijdelijke TMDB fout zijn: die films opnieuw proberen
+            cursor.execute("UPDATE movie_items SET metadata_fetched_at = added_at WHERE runtime > 0")
+            conn.commit()
+
+        cursor.execute("PRAGMA table_info(users)")
+        user_columns = [column[1] for column in cursor.fetchall()]
+        if user_columns and 'follower_count' not in user_columns:
+            print("Migrating database: Adding users.follower_count column...")
+            cursor.execute("ALTER TABLE users ADD COLUMN follower_count INTEGER DEFAULT 0")
+            conn.commit()
+
+        # Sync per soort export: eerdere vingerafdrukken krijgen soort '' en
+        # tellen bij de volgende sync niet meer mee voor verwijderen
+        for table, old_index, new_index, columns in [
+            ("imported_rows", "ix_imported_rows_user_target_hash", "ix_imported_rows_user_target_kind_hash",
+             "user_id, target, source, export_kind, row_hash"),
+            ("import_syncs", "ix_import_syncs_user_target", "ix_import_syncs_user_target_kind",
+             "user_id, target, source, export_kind"),
+        ]:
+            cursor.execute(f"PRAGMA table_info({table})")
+            table_columns = [column[1] for column in cursor.fetchall()]
+            if table_columns and 'export_kind' not in table_columns:
+                print(f"Migrating database: Adding {table}.export_kind column...")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN export_kind VARCHAR NOT NULL DEFAULT ''")
+                cursor.execute(f"DROP INDEX IF EXISTS {old_index}")
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {new_index} ON {table} ({columns})")
+                conn.commit()
+
+        # Indexen voor de per-gebruiker queries (create_all voegt die niet toe aan bestaande tabellen)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_user_movies_user_id_status ON user_movies (user_id, status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_reviews_user_id ON reviews (user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_user_movies_updated_at ON user_movies (updated_at)")
+        conn.commit()
+
         # Check if custom_lists table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='custom_lists'")
         if not cursor.fetchone():
@@ -119,6 +406,59 @@ def migrate_database():
     finally:
         conn.close()
 
+MIGRATION_LOCK_ID = 4242  # pg_advisory_lock sleutel
+
+
+@contextmanager
+def _migration_lock():
+    """Eén migratie tegelijk, ook als meerdere containers tegelijk starten"""
+    if engine.url.get_backend_name() == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+        return
+
+    database = engine.url.database
+    if not database or database == ":memory:":
+        yield
+        return
+
+    # Lock bestand naast de database, zodat het op een gedeeld volume ook werkt
+    with open(f"{database}.migrate.lock", "a") as lock_file:
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+def _lock_file(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    # msvcrt.locking geeft het na 10 seconden op; blijven wachten zoals flock
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    lock_file.seek(0)
+    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    migrate_database()
+    """Schema aanmaken en migreren; draait via python migrate.py, niet bij het importeren van de app"""
+    with _migration_lock():
+        Base.metadata.create_all(bind=engine)
+        migrate_database()
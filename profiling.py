@@ -0,0 +1,223 @@
+"""Profilen van losse requests in productie
+
+Staat alleen aan met PROFILING=1; anders wordt de middleware niet eens
+geïnstalleerd en kost het niets. Als het aan staat wordt een request
+geprofiled als:
+
+- een admin (ADMIN_USERNAMES) de header X-Profile: 1 meestuurt, of
+- het bij de steekproef van PROFILE_SAMPLE_RATE hoort.
+
+Een sampler thread neemt elke PROFILE_INTERVAL de stack van de event loop
+thread op, zoals pyinstrument. cProfile werkt hier niet goed: elke hervatting
+van een coroutine telt daar als aanroep en de caller-grafiek wordt cyclisch.
+Het resultaat is een call tree in "collapsed stacks" formaat (regel per
+stack, tijd in microseconden) voor flamegraph.pl, speedscope of inferno.
+Profielen staan een dag in de gedeelde cache en zijn te bekijken op
+/admin/profiles.
+
+Stacks beginnen bij ProfilingMiddleware._run_profiled, waar alleen het
+geprofilede request doorheen loopt. Tijd waarin de event loop iets anders
+doet (wachten op I/O of de threadpool, andere requests) staat onder
+"(event loop)".
+"""
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+
+from auth import get_username_from_cookie, is_admin
+from cache import shared_cache
+
+
+# Configuration
+PROFILING_ENABLED = os.getenv("PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0.01 = 1% van de requests
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # seconden tussen samples
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", "86400"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_MAX_DEPTH = 200
+PROFILE_TOP_N = 40
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_HEADER_VALUES = (b"1", b"true", b"yes")
+SKIPPED_PREFIXES = ("/admin/profiles", "/health/", "/static/")
+EVENT_LOOP = "(event loop)"
+
+_INDEX_KEY = "profile:index"
+_active = False  # één profiel tegelijk per worker
+_labels = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        # Laatste twee delen van het pad, zodat __call__ van verschillende middlewares uit elkaar blijven
+        path = os.path.splitext(code.co_filename)[0].replace(os.sep, "/").split("/")
+        label = f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+class StackSampler:
+    """Neemt elke `interval` seconden de stack van één thread op"""
+
+    def __init__(self, thread_id: int, root_code, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.stacks = defaultdict(float)  # "a;b;c" -> microseconden
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._switch_interval = sys.getswitchinterval()
+        # Vaker van thread wisselen, anders krijgt de sampler de GIL maar eens per 5 ms
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._last = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _sample(self, elapsed: float):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        leaf = frame
+        while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+            stack.append(_label(frame.f_code))
+            if frame.f_code is self.root_code:
+                break
+            frame = frame.f_back
+        if frame is None:
+            # Buiten het request: alleen de functie waar de loop nu in zit
+            stack = [_label(leaf.f_code), EVENT_LOOP]
+        self.stacks[";".join(reversed(stack))] += elapsed * 1e6
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - self._last)
+            self._last = now
+
+
+def top_functions(stacks: dict) -> list:
+    """[functie, eigen tijd ms, totale tijd ms], duurste eigen tijd eerst"""
+    own = defaultdict(float)
+    total = defaultdict(float)
+    for stack, microseconds in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += microseconds
+        for frame in set(frames):
+            total[frame] += microseconds
+    rows = sorted(own, key=own.get, reverse=True)[:PROFILE_TOP_N]
+    return [[frame, round(own[frame] / 1000, 2), round(total[frame] / 1000, 2)] for frame in rows]
+
+
+def save_profile(profile_id: str, sampler: StackSampler, meta: dict):
+    stacks = {stack: round(value) for stack, value in sampler.stacks.items() if value >= 1}
+    shared_cache.set(f"profile:{profile_id}", dict(
+        meta,
+        id=profile_id,
+        samples=sampler.samples,
+        stacks=stacks,
+        top=top_functions(stacks),
+    ), ttl=PROFILE_TTL)
+    index = [profile_id] + [other for other in (shared_cache.get(_INDEX_KEY) or []) if other != profile_id]
+    shared_cache.set(_INDEX_KEY, index[:PROFILE_KEEP], ttl=PROFILE_TTL)
+
+
+def get_profile(profile_id: str):
+    return shared_cache.get(f"profile:{profile_id}")
+
+
+def recent_profiles() -> list:
+    """Overzicht zonder de stacks zelf"""
+    profiles = []
+    for profile_id in shared_cache.get(_INDEX_KEY) or []:
+        profile = get_profile(profile_id)
+        if profile:
+            profiles.append({key: value for key, value in profile.items() if key not in ("stacks", "top")})
+    return profiles
+
+
+def to_collapsed(profile: dict) -> str:
+    """Tekst voor flamegraph.pl / speedscope / inferno"""
+    return "".join(f"{stack} {value}\n" for stack, value in sorted(profile["stacks"].items()))
+
+
+def _trigger(scope) -> str:
+    path = scope["path"]
+    if path.startswith(SKIPPED_PREFIXES):
+        return None
+    for key, value in scope["headers"]:
+        if key == PROFILE_HEADER and value.strip().lower() in PROFILE_HEADER_VALUES:
+            # Alleen admins mogen een profiel afdwingen
+            return "header" if is_admin(get_username_from_cookie(Request(scope))) else None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """Profileer een request als _trigger dat zegt; alleen geïnstalleerd bij PROFILING=1"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _active
+        trigger = _trigger(scope) if scope["type"] == "http" and not _active else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        _active = True
+        try:
+            await self._run_profiled(scope, receive, send, trigger)
+        finally:
+            _active = False
+
+    async def _run_profiled(self, scope, receive, send, trigger: str):
+        """Alleen het geprofilede request loopt hierdoor; de sampler stopt zijn stacks bij deze frame"""
+        profile_id = uuid.uuid4().hex[:12]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), ProfilingMiddleware._run_profiled.__code__)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - started
+            try:
+                save_profile(profile_id, sampler, {
+                    "method": scope["method"],
+                    "path": scope["path"] + (f"?{scope['query_string'].decode()}" if scope["query_string"] else ""),
+                    "status": status_code,
+                    "duration_ms": round(duration * 1000, 1),
+                    "trigger": trigger,
+                    "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+                })
+            except Exception as e:
+                print(f"Profiel {profile_id} niet opgeslagen: {e}")
@@ -0,0 +1,154 @@
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import MovieItem, UserMovie, Review, CustomList, MovieSimilarity
+
+
+# Read-only query laag: selecteert alleen de kolommen die de templates
+# gebruiken en geeft lichte tuples terug in plaats van ORM objecten.
+# Geen identity map, geen change tracking en geen lazy loads.
+
+SITEMAP_MAX_MOVIES = 49000  # een sitemap mag hoogstens 50.000 URLs hebben
+
+
+class MovieRow(NamedTuple):
+    id: int  # TMDB id, zoals de templates het verwachten
+    title: str
+    poster_path: Optional[str]
+    vote_average: float = 0
+    release_date: Optional[str] = None
+
+
+class ReviewRow(NamedTuple):
+    rating: float
+    review_text: Optional[str]
+    created_at: datetime
+
+
+class ReviewWithMovie(NamedTuple):
+    movie: MovieRow
+    review: ReviewRow
+
+
+class ListRow(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+
+
+MOVIE_COLUMNS = (MovieItem.tmdb_id, MovieItem.title, MovieItem.poster_path)
+
+
+async def get_list(db: AsyncSession, list_id: int, user_id: int) -> Optional[ListRow]:
+    """Custom list van een gebruiker, of None"""
+    row = (await db.execute(
+        select(CustomList.id, CustomList.name, CustomList.description).where(
+            CustomList.id == list_id,
+            CustomList.user_id == user_id
+        )
+    )).first()
+    return ListRow(*row) if row else None
+
+
+async def count_list_movies(db: AsyncSession, list_id: int) -> int:
+    return (await db.execute(
+        select(func.count(UserMovie.id)).where(UserMovie.custom_list_id == list_id)
+    )).scalar()
+
+
+async def list_movies(db: AsyncSession, list_id: int, offset: int, limit: int) -> List[MovieRow]:
+    """Eén pagina films uit een custom list"""
+    rows = await db.execute(
+        select(*MOVIE_COLUMNS).join(UserMovie, UserMovie.movie_id == MovieItem.id).where(
+            UserMovie.custom_list_id == list_id
+        ).order_by(UserMovie.id).offset(offset).limit(limit)
+    )
+    return [MovieRow(*row) for row in rows]
+
+
+async def user_movies_by_status(db: AsyncSession, user_id: int, status: str, limit: int) -> List[MovieRow]:
+    """Films van een gebruiker met een bepaalde status (watchlist/watched)"""
+    rows = await db.execute(
+        select(*MOVIE_COLUMNS).join(UserMovie, UserMovie.movie_id == MovieItem.id).where(
+            UserMovie.user_id == user_id,
+            UserMovie.status == status
+        ).order_by(UserMovie.id).limit(limit)
+    )
+    return [MovieRow(*row) for row in rows]
+
+
+async def recent_reviews_with_movies(db: AsyncSession, user_id: int, limit: int) -> List[ReviewWithMovie]:
+    """Meest recente reviews van een gebruiker, met de film erbij in één join"""
+    rows = await db.execute(
+        select(*MOVIE_COLUMNS, Review.rating, Review.review_text, Review.created_at)
+        .join(MovieItem, MovieItem.tmdb_id == Review.tmdb_id)
+        .where(Review.user_id == user_id)
+        .order_by(Review.created_at.desc())
+        .limit(limit)
+    )
+    return [
+        ReviewWithMovie(MovieRow(*row[:3]), ReviewRow(*row[3:]))
+        for row in rows
+    ]
+
+
+async def sitemap_entries(db: AsyncSession, limit: int = SITEMAP_MAX_MOVIES):
+    """TMDB ids voor de sitemap plus de laatste wijziging
+
+    Alleen films met details (dezelfde als in discover), populairste eerst;
+    geseede films zonder details komen erbij zodra de metadata job ze heeft.
+    """
+    tmdb_ids = (await db.execute(
+        select(MovieItem.tmdb_id).where(MovieItem.genre_ids.isnot(None)).order_by(
+            MovieItem.popularity.desc().nulls_last(), MovieItem.id
+        ).limit(limit)
+    )).scalars().all()
+    last_added = (await db.execute(select(func.max(MovieItem.added_at)))).scalar()
+    return tmdb_ids, last_added
+
+
+async def similar_movies(db: AsyncSession, tmdb_id: int, limit: int = 10) -> List[MovieRow]:
+    """Vooraf berekende buren van een film (zie recommendations.py)"""
+    rows = await db.execute(
+        select(*MOVIE_COLUMNS)
+        .select_from(MovieSimilarity)
+        .join(MovieItem, MovieItem.tmdb_id == MovieSimilarity.similar_tmdb_id)
+        .where(MovieSimilarity.tmdb_id == tmdb_id)
+        .order_by(MovieSimilarity.rank)
+        .limit(limit)
+    )
+    return [MovieRow(*row) for row in rows]
+
+
+async def recommended_for_user(db: AsyncSession, user_id: int, limit: int = 10, seeds: int = 10) -> List[MovieRow]:
+    """"Omdat je ... keek": buren van de laatst gekeken films, zonder films die de gebruiker al heeft"""
+    recent_watched = (
+        select(MovieItem.tmdb_id)
+        .join(UserMovie, UserMovie.movie_id == MovieItem.id)
+        .where(UserMovie.user_id == user_id, UserMovie.status == "watched")
+        .order_by(UserMovie.added_at.desc())
+        .limit(seeds)
+        .scalar_subquery()
+    )
+    own_movies = (
+        select(MovieItem.tmdb_id)
+        .join(UserMovie, UserMovie.movie_id == MovieItem.id)
+        .where(UserMovie.user_id == user_id)
+    )
+    best_score = func.max(MovieSimilarity.score)
+    rows = await db.execute(
+        select(*MOVIE_COLUMNS)
+        .select_from(MovieSimilarity)
+        .join(MovieItem, MovieItem.tmdb_id == MovieSimilarity.similar_tmdb_id)
+        .where(
+            MovieSimilarity.tmdb_id.in_(recent_watched),
+            MovieSimilarity.similar_tmdb_id.notin_(own_movies)
+        )
+        .group_by(*MOVIE_COLUMNS)
+        .order_by(best_score.desc())
+        .limit(limit)
+    )
+    return [MovieRow(*row) for row in rows]
@@ -0,0 +1,196 @@
+"""Item-item aanbevelingen op basis van watched/watchlist/reviews van onze gebruikers
+
+Draait in de job worker, of handmatig: python recommendations.py [--full]
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func, select, union
+from sqlalchemy.orm import Session
+
+from models import MovieItem, UserMovie, Review, MovieSimilarity, RecommenderState, SessionLocal, init_db
+
+
+# Configuration
+RECO_TOP_K = int(os.getenv("RECO_TOP_K", "20"))
+RECO_MIN_SUPPORT = int(os.getenv("RECO_MIN_SUPPORT", "1"))  # min. aantal gedeelde gebruikers
+RECO_FULL_INTERVAL = int(os.getenv("RECO_FULL_INTERVAL", str(60 * 60 * 24)))
+RECO_CHUNK_SIZE = int(os.getenv("RECO_CHUNK_SIZE", "500"))
+
+# Gewicht per soort interactie; reviews tellen mee naar rating (1-10)
+STATUS_WEIGHTS = {"watched": 1.0, "watchlist": 0.5, "custom": 0.5}
+
+
+def load_interactions(db: Session):
+    """Alle interacties als (user_id, tmdb_id, gewicht), plus de nieuwste tijdstempel
+
+    De tijdstempel is wanneer wij de rij schreven, niet added_at: een import
+    zet added_at terug naar de kijkdatum uit de export.
+    """
+    rows = db.query(UserMovie.user_id, MovieItem.tmdb_id, UserMovie.status).join(
+        MovieItem, MovieItem.id == UserMovie.movie_id
+    ).all()
+    users = [row[0] for row in rows]
+    movies = [row[1] for row in rows]
+    weights = [STATUS_WEIGHTS.get(row[2], 0.5) for row in rows]
+
+    for user_id, tmdb_id, rating in db.query(Review.user_id, Review.tmdb_id, Review.rating):
+        users.append(user_id)
+        movies.append(tmdb_id)
+        weights.append(rating / 5.0)
+
+    latest = max(
+        db.query(func.max(UserMovie.updated_at)).scalar() or datetime.min,
+        db.query(func.max(Review.updated_at)).scalar() or datetime.min,
+    )
+    return (
+        np.asarray(users, dtype=np.int64),
+        np.asarray(movies, dtype=np.int64),
+        np.asarray(weights, dtype=np.float32),
+        latest,
+    )
+
+
+def build_matrix(users: np.ndarray, movies: np.ndarray, weights: np.ndarray):
+    """Sparse gebruiker x film matrix; dubbele interacties houden het hoogste gewicht"""
+    user_ids, user_idx = np.unique(users, return_inverse=True)
+    movie_ids, movie_idx = np.unique(movies, return_inverse=True)
+
+    # Hoogste gewicht per (gebruiker, film): sorteer op gewicht en houd de laatste
+    order = np.lexsort((weights, movie_idx, user_idx))
+    user_idx, movie_idx, weights = user_idx[order], movie_idx[order], weights[order]
+    last = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        last[:-1] = (user_idx[1:] != user_idx[:-1]) | (movie_idx[1:] != movie_idx[:-1])
+
+    matrix = sparse.csr_matrix(
+        (weights[last], (user_idx[last], movie_idx[last])),
+        shape=(len(user_ids), len(movie_ids)),
+        dtype=np.float32,
+    )
+    return matrix, movie_ids
+
+
+def top_k_similar(matrix, movie_ids: np.ndarray, target_columns: np.ndarray, k: int = RECO_TOP_K):
+    """Cosine similarity tussen de doelkolommen en alle films, top-K per doelfilm
+
+    Geeft een lijst van (tmdb_id, similar_tmdb_id, score, rank).
+    """
+    csc = matrix.tocsc()
+    norms = np.sqrt(np.asarray(csc.multiply(csc).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = csc @ sparse.diags(1.0 / norms)
+    binary = (csc > 0).astype(np.float32)
+
+    results = []
+    for start in range(0, len(target_columns), RECO_CHUNK_SIZE):
+        columns = target_columns[start:start + RECO_CHUNK_SIZE]
+        scores = (normalized[:, columns].T @ normalized).toarray()
+        support = (binary[:, columns].T @ binary).toarray()
+        scores[support < RECO_MIN_SUPPORT] = 0
+        scores[np.arange(len(columns)), columns] = 0  # niet zichzelf aanbevelen
+
+        count = min(k, scores.shape[1])
+        if count == 0:
+            continue
+        top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        for row, column in enumerate(columns):
+            candidates = top[row][np.argsort(-scores[row, top[row]])]
+            rank = 0
+            for candidate in candidates:
+                score = float(scores[row, candidate])
+                if score <= 0:
+                    break
+                rank += 1
+                results.append((int(movie_ids[column]), int(movie_ids[candidate]), score, rank))
+    return results
+
+
+def _get_state(db: Session) -> RecommenderState:
+    state = db.query(RecommenderState).first()
+    if state is None:
+        state = RecommenderState()
+        db.add(state)
+        db.flush()
+    return state
+
+
+def _changed_movies(db: Session, since: datetime):
+    """Films van gebruikers met nieuwe interacties sinds de watermark"""
+    changed_users = union(
+        select(UserMovie.user_id.label("user_id")).where(UserMovie.updated_at > since),
+        select(Review.user_id.label("user_id")).where(Review.updated_at > since),
+    ).subquery()
+    changed_user_ids = select(changed_users.c.user_id)
+
+    tmdb_ids = {
+        row[0] for row in db.query(MovieItem.tmdb_id).join(
+            UserMovie, UserMovie.movie_id == MovieItem.id
+        ).filter(UserMovie.user_id.in_(changed_user_ids))
+    }
+    tmdb_ids.update(
+        row[0] for row in db.query(Review.tmdb_id).filter(Review.user_id.in_(changed_user_ids))
+    )
+    return tmdb_ids
+
+
+def update_similarities(db: Session, full: bool = False) -> dict:
+    """Herbereken buren: volledig, of alleen voor films geraakt door nieuwe interacties
+
+    Verwijderde interacties hebben geen tijdstempel; die worden opgepakt bij
+    de periodieke volledige herberekening (RECO_FULL_INTERVAL).
+    """
+    state = _get_state(db)
+    now = datetime.utcnow()
+    if state.full_computed_at is None or state.full_computed_at < now - timedelta(seconds=RECO_FULL_INTERVAL):
+        full = True
+
+    users, movies, weights, latest = load_interactions(db)
+    if len(users) == 0:
+        return {"movies": 0, "pairs": 0, "full": full}
+
+    matrix, movie_ids = build_matrix(users, movies, weights)
+
+    if full:
+        target_columns = np.arange(len(movie_ids))
+    else:
+        if state.last_interaction_at is not None and latest <= state.last_interaction_at:
+            return {"movies": 0, "pairs": 0, "full": False}
+        changed = _changed_movies(db, state.last_interaction_at or datetime.min)
+        target_columns = np.flatnonzero(np.isin(movie_ids, list(changed)))
+
+    pairs = top_k_similar(matrix, movie_ids, target_columns)
+
+    if full:
+        db.query(MovieSimilarity).delete(synchronize_session=False)
+    else:
+        targets = [int(movie_ids[column]) for column in target_columns]
+        for start in range(0, len(targets), RECO_CHUNK_SIZE):
+            db.query(MovieSimilarity).filter(
+                MovieSimilarity.tmdb_id.in_(targets[start:start + RECO_CHUNK_SIZE])
+            ).delete(synchronize_session=False)
+
+    db.bulk_insert_mappings(MovieSimilarity, [
+        {"tmdb_id": tmdb_id, "similar_tmdb_id": similar, "score": score, "rank": rank}
+        for tmdb_id, similar, score, rank in pairs
+    ])
+
+    state.last_interaction_at = latest
+    if full:
+        state.full_computed_at = now
+    db.commit()
+
+    print(f"Aanbevelingen bijgewerkt: {len(target_columns)} films, {len(pairs)} paren ({'volledig' if full else 'incrementeel'})")
+    return {"movies": int(len(target_columns)), "pairs": len(pairs), "full": full}
+
+
+if __name__ == "__main__":
+    init_db()
+    db = SessionLocal()
+    try:
+        update_similarities(db, full="--full" in sys.argv)
+    finally:
+        db.close()
@@ -0,0 +1,166 @@
+"""Catalogus vullen vanuit de dagelijkse TMDB ID export
+
+TMDB publiceert elke dag movie_ids_MM_DD_YYYY.json.gz: één JSON object per
+regel met id, original_title, popularity, adult en video. Het bestand wordt
+gestreamd en on the fly uitgepakt; alleen de huidige batch staat in het
+geheugen. Na elke batch worden de films en het checkpoint (aantal gelezen
+regels) in dezelfde transactie gecommit, zodat een afgebroken run verder
+gaat waar hij gebleven was.
+
+Gebruik:
+    python seed.py movie_ids_10_19_2026.json.gz --min-popularity 1
+    python seed.py movie_ids_10_19_2026.json.gz --enqueue   # via de job worker
+
+Genres, taal en runtime haalt de movie_metadata job later op: direct voor
+films in een lijst of review, voor de rest METADATA_CATALOG_BATCH_SIZE per
+run, populairste eerst. Pas met genres staat een film in discover en de
+sitemap.
+"""
+import argparse
+import gzip
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from models import Job, MovieItem, SessionLocal, init_db
+
+
+# Configuration
+SEED_BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "10000"))  # regels per commit
+SEED_MIN_POPULARITY = float(os.getenv("SEED_MIN_POPULARITY", "1.0"))
+SEED_QUERY_CHUNK = 900  # SQLite limiet op parameters per query
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _write_batch(db: Session, batch: dict, counts: dict):
+    """Nieuwe films bulk toevoegen, van bestaande alleen de populariteit bijwerken"""
+    tmdb_ids = list(batch)
+    existing = {}
+    for i in range(0, len(tmdb_ids), SEED_QUERY_CHUNK):
+        existing.update(db.query(MovieItem.tmdb_id, MovieItem.id).filter(
+            MovieItem.tmdb_id.in_(tmdb_ids[i:i + SEED_QUERY_CHUNK])
+        ))
+
+    now = datetime.utcnow()
+    new_movies = [
+        {"tmdb_id": tmdb_id, "title": title, "popularity": popularity, "added_at": now}
+        for tmdb_id, (title, popularity) in batch.items() if tmdb_id not in existing
+    ]
+    if new_movies:
+        db.bulk_insert_mappings(MovieItem, new_movies)
+    if existing:
+        db.bulk_update_mappings(MovieItem, [
+            {"id": movie_id, "popularity": batch[tmdb_id][1]} for tmdb_id, movie_id in existing.items()
+        ])
+    counts["added"] += len(new_movies)
+    counts["updated"] += len(existing)
+
+
+def seed_catalog(db: Session, path: str, min_popularity: float = SEED_MIN_POPULARITY,
+                 start: int = 0, counts: dict = None, checkpoint=None) -> dict:
+    """Lees de export vanaf regel `start` en upsert films boven `min_popularity`
+
+    `checkpoint(db, regels, tellers)` wordt per batch vlak voor de commit
+    aangeroepen, in dezelfde transactie als de films.
+    """
+    counts = counts or {"lines": 0, "added": 0, "updated": 0, "skipped": 0, "errors": 0}
+    batch = {}
+    line_number = 0
+
+    def flush():
+        _write_batch(db, batch, counts)
+        counts["lines"] = line_number
+        if checkpoint:
+            checkpoint(db, line_number, counts)
+        db.commit()
+        batch.clear()
+
+    with _open(path) as export:
+        for line_number, line in enumerate(export, start=1):
+            if line_number <= start:
+                continue  # al verwerkt in een vorige run
+            try:
+                movie = json.loads(line)
+                if movie.get("adult") or movie.get("video") or (movie.get("popularity") or 0) < min_popularity:
+                    counts["skipped"] += 1
+                else:
+                    batch[int(movie["id"])] = (movie.get("original_title") or "", float(movie["popularity"]))
+            except (ValueError, KeyError, TypeError):
+                counts["errors"] += 1
+            if line_number % SEED_BATCH_SIZE == 0:
+                flush()
+    if line_number > start:
+        flush()
+    return counts
+
+
+def _seed_job(db: Session, path: str, min_popularity: float) -> Job:
+    """Onafgemaakte seed job voor hetzelfde bestand hervatten, anders een nieuwe"""
+    stat = os.stat(path)
+    payload = {"path": os.path.abspath(path), "min_popularity": min_popularity, "size": stat.st_size}
+    for job in db.query(Job).filter(Job.kind == "seed_catalog", Job.status != "done").order_by(Job.id.desc()):
+        if json.loads(job.payload) == payload:
+            return job
+    job = Job(kind="seed_catalog", payload=json.dumps(payload), status="queued")
+    db.add(job)
+    db.flush()
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vul movie_items vanuit een TMDB ID export")
+    parser.add_argument("path", help="movie_ids_MM_DD_YYYY.json.gz (of uitgepakt .json)")
+    parser.add_argument("--min-popularity", type=float, default=SEED_MIN_POPULARITY)
+    parser.add_argument("--enqueue", action="store_true", help="Niet zelf draaien maar aan de job worker geven")
+    args = parser.parse_args()
+
+    from jobs import run_job, JOB_LOCK_TIMEOUT
+
+    init_db()
+    db = SessionLocal()
+    try:
+        job = _seed_job(db, args.path, args.min_popularity)
+        if args.enqueue:
+            if job.status == "failed":
+                job.status = "queued"
+                job.attempts = 0
+            db.commit()
+            print(f"Seed job {job.id} in de wachtrij (vanaf regel {job.progress or 0})")
+            return
+        if job.status == "running" and job.heartbeat_at and job.heartbeat_at > datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT):
+            print(f"Seed job {job.id} draait al op {job.locked_by}")
+            return
+        print(f"Seed job {job.id}: {args.path} vanaf regel {job.progress or 0}")
+        job.status = "running"
+        job.locked_by = f"{socket.gethostname()}:{os.getpid()}"
+        job.heartbeat_at = datetime.utcnow()
+        job.attempts = (job.attempts or 0) + 1
+        db.commit()
+
+        started = time.perf_counter()
+        try:
+            run_job(db, job)
+        except KeyboardInterrupt:
+            # Het checkpoint staat al in de database; opnieuw starten gaat daar verder
+            db.rollback()
+            job.status = "failed"
+            job.last_error = "Onderbroken"
+            job.locked_by = None
+            db.commit()
+        db.refresh(job)
+        print(f"{job.status} in {time.perf_counter() - started:.1f}s: {job.result or job.last_error}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Statistieken per gebruiker, berekend op een kolom-snapshot met NumPy
+
+De snapshot wordt per gebruiker in de gedeelde cache bewaard en bij elke
+wijziging in lijsten of reviews weggegooid (zie cache.invalidate_stats).
+"""
+import os
+
+import numpy as np
+from sqlalchemy import select, func, extract
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import shared_cache, stats_cache_key
+from models import MovieItem, UserMovie, Review
+
+
+# Configuration
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "3600"))
+STATS_TOP_N = 10
+
+
+def _watched_filter(user_id: int):
+    return (
+        select()
+        .select_from(UserMovie)
+        .join(MovieItem, MovieItem.id == UserMovie.movie_id)
+        .where(UserMovie.user_id == user_id, UserMovie.status == "watched")
+    )
+
+
+async def _load_watched(db: AsyncSession, user_id: int):
+    """Kolommen van de gekeken films; tellen per maand en taal gebeurt al in SQL"""
+    watched = _watched_filter(user_id)
+
+    year = extract("year", UserMovie.added_at)
+    month = extract("month", UserMovie.added_at)
+    month_rows = (await db.execute(
+        watched.add_columns(year, month, func.count())
+        .where(UserMovie.added_at.isnot(None))
+        .group_by(year, month)
+    )).all()
+
+    language_rows = (await db.execute(
+        watched.add_columns(
+            MovieItem.original_language,
+            func.count(),
+            func.coalesce(func.sum(MovieItem.runtime), 0),
+            func.count(func.nullif(MovieItem.runtime, 0)),
+        ).group_by(MovieItem.original_language)
+    )).all()
+
+    genre_ids = (await db.execute(watched.add_columns(MovieItem.genre_ids))).scalars().all()
+
+    years, months, month_counts = zip(*month_rows) if month_rows else ((), (), ())
+    languages, language_counts, runtimes, runtime_known = zip(*language_rows) if language_rows else ((), (), (), ())
+    return {
+        # Maanden sinds 1970, zodat numpy ze als datetime64[M] kan groeperen
+        "months": ((np.array(years, dtype=np.int64) - 1970) * 12 + np.array(months, dtype=np.int64) - 1).astype("datetime64[M]"),
+        "month_counts": np.array(month_counts, dtype=np.int64),
+        "languages": np.array([language or "" for language in languages], dtype=object),
+        "language_counts": np.array(language_counts, dtype=np.int64),
+        "runtimes": np.array(runtimes, dtype=np.int64),
+        "runtime_known": np.array(runtime_known, dtype=np.int64),
+        "genre_ids": genre_ids,
+    }
+
+
+async def _load_ratings(db: AsyncSession, user_id: int):
+    # Gemiddelde van de andere gebruikers, alleen voor films die deze gebruiker reviewde
+    community = (
+        select(Review.tmdb_id, func.avg(Review.rating).label("avg_rating"))
+        .where(
+            Review.user_id != user_id,
+            Review.tmdb_id.in_(select(Review.tmdb_id).where(Review.user_id == user_id))
+        )
+        .group_by(Review.tmdb_id)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(Review.rating, MovieItem.vote_average, community.c.avg_rating)
+        .outerjoin(MovieItem, MovieItem.tmdb_id == Review.tmdb_id)
+        .outerjoin(community, community.c.tmdb_id == Review.tmdb_id)
+        .where(Review.user_id == user_id)
+    )).all()
+    # Per kolom omzetten: numpy is traag op Row objecten.
+    # None wordt NaN, zodat _mean ontbrekende waarden overslaat.
+    columns = list(zip(*rows)) or [(), (), ()]
+    return np.array(columns, dtype=np.float64).T.reshape(-1, 3)
+
+
+def _mean(values: np.ndarray):
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 1) if len(values) else None
+
+
+def compute_stats(watched: dict, ratings: np.ndarray) -> dict:
+    """Alle aggregaties in één keer over de kolommen"""
+    order = np.argsort(watched["months"])
+    month_keys, month_counts = watched["months"][order], watched["month_counts"][order]
+    years = month_keys.astype("datetime64[Y]").astype(np.int64) + 1970
+    year_keys, year_index = np.unique(years, return_inverse=True)
+    year_counts = np.bincount(year_index, weights=month_counts, minlength=len(year_keys)).astype(np.int64)
+
+    known = watched["languages"] != ""
+    language_keys = watched["languages"][known].astype(str)
+    language_counts = watched["language_counts"][known]
+    top_languages = np.argsort(-language_counts, kind="stable")[:STATS_TOP_N]
+
+    genre_text = ",".join(value for value in watched["genre_ids"] if value)
+    genres = np.array(genre_text.split(","), dtype=np.int64) if genre_text else np.array([], dtype=np.int64)
+    genre_keys, genre_counts = np.unique(genres, return_counts=True)
+    top_genres = np.argsort(-genre_counts, kind="stable")[:STATS_TOP_N]
+
+    user_ratings = ratings[:, 0]
+    buckets = np.clip(np.rint(user_ratings), 1, 10).astype(np.int64)
+    distribution = np.bincount(buckets, minlength=11)[1:]
+
+    return {
+        "total_watched": int(watched["language_counts"].sum()),
+        "total_runtime": int(watched["runtimes"].sum()),
+        "runtime_unknown": int((watched["language_counts"] - watched["runtime_known"]).sum()),
+        "per_year": [[int(year), int(count)] for year, count in zip(year_keys, year_counts)],
+        "per_month": [[str(month), int(count)] for month, count in zip(month_keys, month_counts)],
+        "top_genres": [[int(genre_keys[i]), int(genre_counts[i])] for i in top_genres],
+        "top_languages": [[str(language_keys[i]), int(language_counts[i])] for i in top_languages],
+        "total_reviews": int(len(user_ratings)),
+        "rating_distribution": [int(count) for count in distribution],
+        "avg_rating": _mean(user_ratings),
+        "avg_tmdb": _mean(ratings[:, 1]),
+        "avg_community": _mean(ratings[:, 2]),
+    }
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> dict:
+    """Statistieken uit de cache, of opnieuw berekend uit een verse snapshot
+
+    Geef een sessie op de primary mee: wat hier berekend wordt, wordt gecached.
+    """
+    stats = shared_cache.get(stats_cache_key(user_id))
+    if stats is None:
+        watched = await _load_watched(db, user_id)
+        ratings = await _load_ratings(db, user_id)
+        stats = compute_stats(watched, ratings)
+        shared_cache.set(stats_cache_key(user_id), stats, ttl=STATS_CACHE_TTL)
+    return stats
@@ -0,0 +1,76 @@
+"""Gedeelde fixtures: een eigen SQLite database en de memory cache
+
+De omgeving moet gezet zijn vóór de app modules geïmporteerd worden; die
+lezen hun configuratie bij het importeren.
+"""
+import os
+import sys
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["CACHE_URL"] = "memory://"
+os.environ["ADMIN_USERNAMES"] = "admin"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from cache import shared_cache  # noqa: E402
+from models import Base, SessionLocal, User, engine, init_db  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    """Elke test begint met lege tabellen en een lege cache"""
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    shared_cache.clear()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(username: str, **fields) -> User:
+        user = User(username=username, email=f"{username}@example.com", hashed_password="x", **fields)
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def fake_tmdb(monkeypatch):
+    """TMDB zonder netwerk; films in `fake_tmdb.movies` (titel -> TMDB film) worden gevonden"""
+    import importer
+    import tmdb
+
+    movies = {}
+    calls = []
+
+    def fake_request(endpoint, params=None, *args, **kwargs):
+        calls.append(endpoint)
+        if endpoint == "/search/movie":
+            # Zonder jaar in de rij zoekt de importer op alleen de titel
+            movie = movies.get(params["query"])
+            return {"results": [movie] if movie else []}
+        for movie in movies.values():
+            if endpoint == f"/movie/{movie['id']}":
+                return movie
+        return None
+
+    monkeypatch.setattr(tmdb, "tmdb_request", fake_request)
+    monkeypatch.setattr(importer, "tmdb_request", fake_request)
+    fake_request.movies = movies
+    fake_request.calls = calls
+    return fake_request
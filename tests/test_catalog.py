@@ -0,0 +1,68 @@
+"""Catalogus: metadata voor geseede films en de sitemap"""
+import asyncio
+
+import pytest
+
+import jobs
+import queries
+from models import AsyncSessionLocal, Job, MovieItem, UserMovie, async_engine
+
+
+@pytest.fixture
+def details(fake_tmdb):
+    """TMDB details voor elke film, met genres"""
+    fake_tmdb.movies.update({
+        f"Film {tmdb_id}": {"id": tmdb_id, "title": f"Film {tmdb_id}", "genres": [{"id": 18}], "runtime": 100}
+        for tmdb_id in range(1, 11)
+    })
+    return fake_tmdb
+
+
+def seed(db, count: int):
+    """Zoals seed.py: alleen tmdb_id, titel en populariteit"""
+    db.bulk_insert_mappings(MovieItem, [
+        {"tmdb_id": tmdb_id, "title": f"Film {tmdb_id}", "popularity": float(tmdb_id)} for tmdb_id in range(1, count + 1)
+    ])
+    db.commit()
+
+
+def test_metadata_backfills_used_movies_first_then_popular_catalog(db, make_user, details, monkeypatch):
+    monkeypatch.setattr(jobs, "METADATA_CATALOG_BATCH_SIZE", 2)
+    seed(db, 10)
+    user = make_user("alice")
+    db.add(UserMovie(user_id=user.id, movie_id=db.query(MovieItem.id).filter(MovieItem.tmdb_id == 1).scalar(), status="watched"))
+    db.commit()
+
+    result = jobs._run_movie_metadata(db, Job(kind="movie_metadata"))
+
+    assert result["updated"] == 3
+    fetched = {tmdb_id for (tmdb_id,) in db.query(MovieItem.tmdb_id).filter(MovieItem.metadata_fetched_at.isnot(None))}
+    assert fetched == {1, 10, 9}
+    assert db.query(MovieItem.genre_ids).filter(MovieItem.tmdb_id == 10).scalar() == "18"
+
+
+def test_catalog_backfill_can_be_disabled(db, details, monkeypatch):
+    monkeypatch.setattr(jobs, "METADATA_CATALOG_BATCH_SIZE", 0)
+    seed(db, 3)
+
+    assert jobs._run_movie_metadata(db, Job(kind="movie_metadata"))["checked"] == 0
+
+
+def sitemap_entries(**kwargs):
+    async def run():
+        async with AsyncSessionLocal() as session:
+            entries = await queries.sitemap_entries(session, **kwargs)
+        await async_engine.dispose()
+        return entries
+    return asyncio.run(run())
+
+
+def test_sitemap_lists_only_movies_with_details_most_popular_first(db):
+    seed(db, 5)
+    db.query(MovieItem).filter(MovieItem.tmdb_id.in_([2, 4, 5])).update({"genre_ids": "18"}, synchronize_session=False)
+    db.commit()
+
+    tmdb_ids, last_added = sitemap_entries(limit=2)
+
+    assert tmdb_ids == [5, 4]
+    assert last_added is not None
@@ -0,0 +1,206 @@
+"""Feed: fan-out-on-write, fan-out-on-read voor populaire accounts, volgen en trimmen"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import feed
+from auth import create_access_token
+from models import Activity, AsyncSessionLocal, FeedEntry, MovieItem, User, async_engine
+
+
+def read(user_id: int, **kwargs) -> list:
+    async def run():
+        async with AsyncSessionLocal() as session:
+            rows = await feed.read_feed(session, user_id, **kwargs)
+        # Elke asyncio.run heeft een eigen loop; connecties niet meenemen naar de volgende
+        await async_engine.dispose()
+        return rows
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def users(make_user):
+    alice, bob, carol = make_user("alice"), make_user("bob"), make_user("carol")
+    return alice, bob, carol
+
+
+def watched(db, user: User, tmdb_id: int) -> Activity:
+    activity = feed.record_activity(db, user, "watched", tmdb_id=tmdb_id, title=f"Film {tmdb_id}")
+    db.commit()
+    return activity
+
+
+def test_activity_fans_out_to_followers(db, users):
+    alice, bob, carol = users
+    feed.follow(db, bob.id, alice)
+    db.commit()
+
+    activity = watched(db, alice, 1)
+
+    assert [row.id for row in read(bob.id)] == [activity.id]
+    assert read(carol.id) == []
+    assert read(bob.id)[0].username == "alice"
+
+
+def test_read_feed_pages_newest_first(db, users):
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    ids = [watched(db, alice, tmdb_id).id for tmdb_id in range(5)]
+
+    first = read(bob.id, limit=3)
+    second = read(bob.id, before=first[-1].id, limit=3)
+
+    assert [row.id for row in first] == ids[:1:-1]
+    assert [row.id for row in second] == ids[1::-1]
+
+
+def test_follow_backfills_and_unfollow_clears(db, users, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_BACKFILL", 2)
+    alice, bob, _ = users
+    ids = [watched(db, alice, tmdb_id).id for tmdb_id in range(3)]
+
+    assert feed.follow(db, bob.id, alice)
+    assert not feed.follow(db, bob.id, alice)
+    assert not feed.follow(db, bob.id, bob)
+    db.commit()
+
+    assert [row.id for row in read(bob.id)] == ids[:0:-1]
+    assert db.get(User, alice.id).follower_count == 1
+
+    assert feed.unfollow(db, bob.id, alice)
+    db.commit()
+
+    assert read(bob.id) == []
+    db.refresh(alice)
+    assert alice.follower_count == 0
+
+
+def test_double_follow_submit_is_not_an_error(db, users, monkeypatch):
+    alice, bob, _ = users
+    assert feed.follow(db, bob.id, alice)
+    db.commit()
+
+    # Het tweede request deed zijn check voordat het eerste committe
+    monkeypatch.setattr(feed, "is_following", lambda db, follower_id, followee_id: False)
+
+    assert not feed.follow(db, bob.id, alice)
+    db.commit()
+    db.refresh(alice)
+    assert alice.follower_count == 1
+
+
+def test_popular_accounts_are_read_on_demand(db, users, monkeypatch):
+    alice, bob, carol = users
+    feed.follow(db, bob.id, alice)
+    early = watched(db, alice, 1)
+    feed.follow(db, carol.id, alice)
+    db.commit()
+    # alice heeft nu twee volgers en gaat over de limiet
+    monkeypatch.setattr(feed, "FEED_FANOUT_LIMIT", 1)
+
+    late = watched(db, alice, 2)
+
+    assert db.query(FeedEntry).filter(FeedEntry.activity_id == late.id).count() == 0
+    # De oudere activiteit staat ook nog in de tijdlijn, maar komt maar één keer terug
+    assert [row.id for row in read(bob.id)] == [late.id, early.id]
+    assert [row.id for row in read(bob.id, before=late.id)] == [early.id]
+
+
+def test_trim_keeps_newest_entries(db, users, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_MAX_ENTRIES", 3)
+    alice, bob, carol = users
+    feed.follow(db, bob.id, alice)
+    feed.follow(db, carol.id, alice)
+    ids = [watched(db, alice, tmdb_id).id for tmdb_id in range(5)]
+    db.query(FeedEntry).filter(FeedEntry.user_id == carol.id, FeedEntry.activity_id != ids[-1]).delete()
+    db.commit()
+
+    result = feed.trim_feeds(db)
+
+    assert result == {"feeds": 1, "trimmed": 2}
+    assert [row.id for row in read(bob.id)] == ids[:1:-1]
+    assert [row.id for row in read(carol.id)] == [ids[-1]]
+
+
+def test_changed_review_updates_activity(db, users):
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    db.add(MovieItem(tmdb_id=7, title="Zeven", poster_path="/7.jpg"))
+    db.commit()
+
+    feed.record_review(db, alice, 7, 6.0, "Matig")
+    feed.record_review(db, alice, 7, 8.0, "Toch goed")
+    db.commit()
+
+    rows = read(bob.id)
+    assert [(row.title, row.rating, row.review_text) for row in rows] == [("Zeven", 8.0, "Toch goed")]
+
+
+def test_import_feeds_budget_and_summary(db, users, monkeypatch):
+    monkeypatch.setattr(feed, "FEED_IMPORT_MAX", 2)
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    counts = {"imported": 5}
+    movies = [({"id": tmdb_id, "title": f"Film {tmdb_id}"}, None, None) for tmdb_id in range(5)]
+
+    feed.record_import(db, alice.id, movies[:3], counts)
+    feed.record_import(db, alice.id, movies[3:], counts)
+    feed.record_import_summary(db, alice.id, counts)
+    db.commit()
+
+    rows = read(bob.id)
+    assert [row.kind for row in rows] == ["import", "watched", "watched"]
+    assert rows[0].count == 3
+
+
+def test_remove_activities_clears_timelines(db, users):
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    watched(db, alice, 1)
+    kept = watched(db, alice, 2)
+
+    assert feed.remove_activities(db, alice.id, "watched", [1]) == 1
+    db.commit()
+
+    assert [row.id for row in read(bob.id)] == [kept.id]
+    assert db.query(FeedEntry).count() == 1
+
+
+@pytest.fixture
+def client(users, monkeypatch):
+    import main
+    import tmdb
+
+    # TMDB ligt eruit
+    monkeypatch.setattr(tmdb, "tmdb_request", lambda *args, **kwargs: None)
+    client = TestClient(main.app)
+    client.cookies.set("access_token", create_access_token({"sub": "alice"}))
+    return client
+
+
+def test_review_without_tmdb_still_reaches_feed(db, users, client):
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    db.commit()
+
+    response = client.post("/movie/42/review", data={"rating": "8", "review_text": "Top"}, headers={"Accept": "application/json"})
+
+    assert response.status_code == 200
+    assert response.json()["created"]
+    rows = read(bob.id)
+    assert [(row.kind, row.tmdb_id, row.title) for row in rows] == [("review", 42, None)]
+
+
+def test_removing_watched_film_removes_activity(db, users, client):
+    alice, bob, _ = users
+    feed.follow(db, bob.id, alice)
+    db.add(MovieItem(tmdb_id=7, title="Zeven"))
+    db.commit()
+
+    client.post("/movie/7/add-to-list", data={"status": "watched"}, follow_redirects=False)
+    assert [row.tmdb_id for row in read(bob.id)] == [7]
+
+    client.post("/movie/7/remove-from-list", follow_redirects=False)
+    assert read(bob.id) == []
+    assert db.query(Activity).count() == 0
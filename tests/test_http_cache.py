@@ -0,0 +1,112 @@
+"""HTTPCacheMiddleware: Cache-Control per route-klasse, ETags en conditional GETs"""
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import middleware
+from middleware import CACHE_POLICIES, HTTPCacheMiddleware, route_class
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(HTTPCacheMiddleware)
+
+    @app.get("/movie/{movie_id}", response_class=HTMLResponse)
+    async def movie(movie_id: int):
+        return f"<h1>Film {movie_id}</h1>"
+
+    @app.post("/movie/{movie_id}/review")
+    async def review(movie_id: int):
+        return {"ok": True}
+
+    @app.get("/export")
+    async def export():
+        async def rows():
+            yield b"a\n"
+            yield b"b\n"
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path, authenticated, expected", [
+    ("/robots.txt", True, "robots"),
+    ("/sitemap.xml", False, "sitemap"),
+    ("/", False, "anonymous"),
+    ("/movie/1", False, "anonymous"),
+    ("/movie/1", True, "authenticated"),
+    ("/profile", False, "default"),
+])
+def test_route_class(path, authenticated, expected):
+    assert route_class(path, authenticated) == expected
+
+
+def test_anonymous_page_is_public_and_varies_on_cookie(client):
+    response = client.get("/movie/1")
+
+    assert response.headers["cache-control"] == CACHE_POLICIES["anonymous"]
+    assert "Cookie" in response.headers["vary"]
+    assert response.headers["etag"]
+
+
+def test_logged_in_page_is_private(client):
+    client.cookies.set("access_token", "token")
+
+    response = client.get("/movie/1")
+
+    assert response.headers["cache-control"] == CACHE_POLICIES["authenticated"]
+
+
+def test_matching_etag_gives_304_without_body(client):
+    etag = client.get("/movie/1").headers["etag"]
+
+    response = client.get("/movie/1", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_weak_etag_from_compression_is_echoed_on_304(client):
+    etag = client.get("/movie/1").headers["etag"]
+
+    response = client.get("/movie/1", headers={"If-None-Match": f"W/{etag}"})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == f"W/{etag}"
+
+
+def test_changed_body_gets_new_etag(client):
+    etag = client.get("/movie/1").headers["etag"]
+
+    response = client.get("/movie/2", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_posts_and_streams_are_left_alone(client):
+    assert "etag" not in client.post("/movie/1/review").headers
+
+    response = client.get("/export")
+
+    assert response.text == "a\nb\n"
+    assert "etag" not in response.headers
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0.0, gzip", "gzip"),
+    ("br; q=0.000, gzip;q=0.5", "gzip"),
+    ("br;q=0.001", "br"),
+    ("gzip;q=0, br;q=0", None),
+    ("identity", None),
+])
+def test_choose_encoder_respects_q_values(accept_encoding, expected):
+    encoder = middleware.choose_encoder(accept_encoding)
+
+    assert (encoder.name if encoder else None) == expected
@@ -0,0 +1,195 @@
+"""CSV import: vingerafdrukken, sync tegen een eerdere export en de bulk writes"""
+from datetime import datetime
+
+import pytest
+
+import importer
+from models import Activity, ImportedRow, ImportSync, MovieItem, Review, UserMovie
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user("alice")
+
+
+@pytest.fixture
+def catalog(fake_tmdb):
+    for tmdb_id, title in enumerate(["Alien", "Heat", "Vertigo", "Jaws"], start=1):
+        fake_tmdb.movies[title] = {"id": tmdb_id, "title": title, "poster_path": f"/{tmdb_id}.jpg"}
+    return fake_tmdb
+
+
+def letterboxd(name: str, rating: str = "", watched: str = "", **extra) -> dict:
+    """Rij uit diary.csv; zonder rating en kijkdatum een rij uit watched.csv"""
+    row = {"Date": "2024-12-01", "Name": name, "Letterboxd URI": f"https://boxd.it/{name}"}
+    if rating or watched:
+        row.update({"Rating": rating, "Watched Date": watched})
+    row.update(extra)
+    return row
+
+
+def ratings(name: str, rating: str) -> dict:
+    """Rij uit ratings.csv"""
+    return {"Date": "2024-12-01", "Name": name, "Letterboxd URI": f"https://boxd.it/{name}", "Rating": rating}
+
+
+def sync(db, user_id: int, rows: list, target: str = "watched"):
+    """Zoals /import/csv met sync en remove_missing: alleen nieuwe rijen naar de importer"""
+    kind = importer.export_kind("letterboxd", rows[0].keys())
+    new_rows, removed = importer.plan_sync(db, user_id, target, "letterboxd", kind, rows)
+    db.commit()
+    return importer.process_import_background(
+        new_rows, "letterboxd", target, user_id,
+        sync=True, removed_hashes=removed, file_hash=f"hash-{len(rows)}", file_rows=len(rows), kind=kind,
+    )
+
+
+def test_fingerprint_ignores_log_date_but_not_rating():
+    row = letterboxd("Alien", rating="4", watched="2024-01-01", Date="2024-01-02")
+
+    assert importer.row_fingerprint("letterboxd", row) == importer.row_fingerprint("letterboxd", dict(row, Date="2024-03-01"))
+    assert importer.row_fingerprint("letterboxd", row) != importer.row_fingerprint("letterboxd", dict(row, Rating="5"))
+    assert importer.row_fingerprint("letterboxd", row) != importer.row_fingerprint("letterboxd", dict(row, Review="Eng"))
+
+
+@pytest.mark.parametrize("import_type, columns, expected", [
+    ("letterboxd", ["Date", "Name", "Year", "Letterboxd URI"], "films"),
+    ("letterboxd", ["Date", "Name", "Year", "Letterboxd URI", "Rating"], "ratings"),
+    ("letterboxd", ["Date", "Name", "Year", "Letterboxd URI", "Rating", "Rewatch", "Tags", "Watched Date"], "diary"),
+    ("letterboxd", ["Date", "Name", "Year", "Letterboxd URI", "Rating", "Rewatch", "Review", "Tags", "Watched Date"], "reviews"),
+    ("imdb", ["Const", "Your Rating", "Date Rated", "Title"], "ratings"),
+    ("imdb", ["Position", "Const", "Created", "Title"], "list"),
+])
+def test_export_kind(import_type, columns, expected):
+    assert importer.export_kind(import_type, columns) == expected
+
+
+def test_fingerprint_includes_imdb_rating():
+    row = {"Const": "tt0078748", "Title": "Alien", "Year": "1979", "Your Rating": "8"}
+
+    assert importer.row_fingerprint("imdb", row) != importer.row_fingerprint("imdb", dict(row, **{"Your Rating": "9"}))
+
+
+@pytest.mark.parametrize("import_type, row, expected", [
+    ("letterboxd", {"Rating": "3.5"}, 7),
+    ("letterboxd", {"Rating": "0.5"}, 1),
+    ("letterboxd", {"Rating": ""}, None),
+    ("imdb", {"Your Rating": "8"}, 8),
+    ("imdb", {"Your Rating": "12"}, 10),
+])
+def test_parse_rating(import_type, row, expected):
+    assert importer.parse_rating(import_type, row) == expected
+
+
+def test_import_writes_movies_reviews_and_fingerprints(db, user, catalog):
+    rows = [
+        letterboxd("Alien", rating="4.5", watched="2024-01-01", Review="Eng"),
+        letterboxd("Heat", watched="2024-02-01"),
+        letterboxd("Onbekend"),
+    ]
+
+    counts = sync(db, user.id, rows)
+
+    assert counts["imported"] == 2
+    assert counts["skipped"] == 1
+    watched = dict(db.query(MovieItem.title, UserMovie.added_at).join(UserMovie.movie).filter(UserMovie.user_id == user.id))
+    assert watched == {"Alien": datetime(2024, 1, 1), "Heat": datetime(2024, 2, 1)}
+    review = db.query(Review).filter(Review.user_id == user.id).one()
+    assert (review.tmdb_id, review.rating, review.review_text) == (1, 9, "Eng")
+    # Ook de niet gevonden rij krijgt een vingerafdruk, zodat de volgende sync hem niet opnieuw zoekt
+    assert db.query(ImportedRow).filter(ImportedRow.user_id == user.id).count() == 3
+    assert db.query(ImportSync).filter(ImportSync.user_id == user.id).one().file_hash == "hash-3"
+
+
+def test_repeated_diary_entries_become_one_list_entry(db, user, catalog):
+    rows = [letterboxd("Alien", watched="2024-01-01"), letterboxd("Alien", rating="4", watched="2024-06-01")]
+
+    counts = sync(db, user.id, rows)
+
+    assert counts["imported"] == 1
+    entry = db.query(UserMovie).filter(UserMovie.user_id == user.id).one()
+    assert entry.added_at == datetime(2024, 6, 1)
+
+
+def test_unchanged_export_needs_no_tmdb_calls(db, user, catalog):
+    rows = [letterboxd("Alien", rating="4"), letterboxd("Heat")]
+    sync(db, user.id, rows)
+    catalog.calls.clear()
+
+    counts = sync(db, user.id, rows)
+
+    assert catalog.calls == []
+    assert counts["imported"] == 0
+    assert db.query(UserMovie).filter(UserMovie.user_id == user.id).count() == 2
+
+
+def test_changed_rating_updates_review_and_keeps_movie(db, user, catalog):
+    sync(db, user.id, [letterboxd("Alien", rating="2"), letterboxd("Heat")])
+
+    counts = sync(db, user.id, [letterboxd("Alien", rating="5"), letterboxd("Heat")])
+
+    assert counts.get("removed") == 0
+    assert db.query(Review.rating).filter(Review.user_id == user.id, Review.tmdb_id == 1).scalar() == 10
+    assert db.query(UserMovie).filter(UserMovie.user_id == user.id).count() == 2
+
+
+def test_sync_removes_films_dropped_from_export(db, user, catalog):
+    sync(db, user.id, [letterboxd("Alien"), letterboxd("Heat"), letterboxd("Vertigo")])
+
+    counts = sync(db, user.id, [letterboxd("Alien"), letterboxd("Vertigo")])
+
+    assert counts["removed"] == 1
+    titles = {title for (title,) in db.query(MovieItem.title).join(UserMovie.movie).filter(UserMovie.user_id == user.id)}
+    assert titles == {"Alien", "Vertigo"}
+    # De activiteit van de verwijderde film verdwijnt ook uit de feed
+    assert {tmdb_id for (tmdb_id,) in db.query(Activity.tmdb_id).filter(Activity.kind == "watched")} == {1, 3}
+
+
+def test_existing_list_entries_are_skipped(db, user, catalog):
+    sync(db, user.id, [letterboxd("Alien")])
+
+    # Dezelfde film met een andere kijkdatum is een nieuwe rij, maar geen nieuwe lijstregel
+    counts = sync(db, user.id, [letterboxd("Alien"), letterboxd("Alien", watched="2024-05-01")])
+
+    assert counts["imported"] == 0
+    assert counts["skipped"] == 1
+    assert db.query(UserMovie).filter(UserMovie.user_id == user.id).count() == 1
+
+
+def test_tmdb_outage_does_not_record_sync(db, user, catalog, monkeypatch):
+    monkeypatch.setattr(importer, "tmdb_request", lambda *args, **kwargs: None)
+
+    counts = sync(db, user.id, [letterboxd("Alien")])
+
+    assert counts["skipped"] == 1
+    # Zonder antwoord van TMDB wordt de rij bij de volgende sync opnieuw geprobeerd
+    assert db.query(ImportedRow).count() == 0
+    assert db.query(ImportSync).count() == 0
+
+
+def test_sync_of_other_export_kind_keeps_films(db, user, catalog):
+    sync(db, user.id, [letterboxd("Alien"), letterboxd("Heat"), letterboxd("Vertigo")])
+
+    # ratings.csv bevat alleen de beoordeelde films; de rest staat nog in watched.csv
+    counts = sync(db, user.id, [ratings("Heat", "4")])
+
+    assert counts.get("removed", 0) == 0
+    assert db.query(UserMovie).filter(UserMovie.user_id == user.id).count() == 3
+    assert db.query(ImportSync).filter(ImportSync.user_id == user.id).count() == 2
+
+    # Een rating die uit ratings.csv verdwijnt laat de film staan zolang watched.csv hem heeft
+    counts = sync(db, user.id, [ratings("Alien", "3")])
+
+    assert counts["removed"] == 0
+    assert db.query(UserMovie).filter(UserMovie.user_id == user.id).count() == 3
+
+
+def test_each_export_kind_removes_only_its_own_films(db, user, catalog):
+    sync(db, user.id, [letterboxd("Alien"), letterboxd("Heat")])
+    sync(db, user.id, [ratings("Jaws", "4")])
+
+    counts = sync(db, user.id, [letterboxd("Alien")])
+
+    assert counts["removed"] == 1
+    titles = {title for (title,) in db.query(MovieItem.title).join(UserMovie.movie).filter(UserMovie.user_id == user.id)}
+    assert titles == {"Alien", "Jaws"}
@@ -0,0 +1,182 @@
+"""Job queue: claimen, limiet per gebruiker, backoff, vastgelopen jobs en fencing"""
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from models import Job, SessionLocal
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Eigen job types voor de tests, naast de echte JOB_HANDLERS"""
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "ok", lambda db, job: {"done": True})
+
+    def boom(db, job):
+        raise RuntimeError("TMDB onbereikbaar")
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "boom", boom)
+    return jobs.JOB_HANDLERS
+
+
+def test_claim_marks_job_running(db):
+    job = jobs.enqueue_job(db, "ok", {"a": 1})
+
+    claimed = jobs.claim_next_job(db, "worker-1")
+
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+    assert claimed.locked_by == "worker-1"
+    assert claimed.attempts == 1
+    assert jobs.claim_next_job(db, "worker-2") is None
+
+
+def test_claim_respects_per_user_limit(db, make_user):
+    alice, bob = make_user("alice"), make_user("bob")
+    first = jobs.enqueue_job(db, "ok", {}, user_id=alice.id)
+    jobs.enqueue_job(db, "ok", {}, user_id=alice.id)
+    other = jobs.enqueue_job(db, "ok", {}, user_id=bob.id)
+
+    assert jobs.claim_next_job(db, "worker-1").id == first.id
+    # De tweede job van alice wacht tot de eerste klaar is
+    assert jobs.claim_next_job(db, "worker-2").id == other.id
+    assert jobs.claim_next_job(db, "worker-3") is None
+
+
+def test_claim_skips_jobs_scheduled_later(db):
+    job = jobs.enqueue_job(db, "ok", {})
+    job.run_after = datetime.utcnow() + timedelta(minutes=5)
+    db.commit()
+
+    assert jobs.claim_next_job(db, "worker-1") is None
+
+
+def test_run_job_stores_result(db, handlers):
+    jobs.enqueue_job(db, "ok", {})
+    job = jobs.claim_next_job(db, "worker-1")
+
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.status == "done"
+    assert job.locked_by is None
+    assert json.loads(job.result) == {"done": True}
+
+
+def test_failed_job_is_retried_with_backoff(db, handlers):
+    jobs.enqueue_job(db, "boom", {})
+    job = jobs.claim_next_job(db, "worker-1")
+
+    before = datetime.utcnow()
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.status == "queued"
+    assert job.locked_by is None
+    assert "TMDB onbereikbaar" in job.last_error
+    assert job.run_after >= before + timedelta(seconds=jobs.JOB_RETRY_BASE_DELAY)
+
+    # Tweede poging: de wachttijd verdubbelt
+    job.run_after = datetime.utcnow()
+    db.commit()
+    job = jobs.claim_next_job(db, "worker-1")
+    before = datetime.utcnow()
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.attempts == 2
+    assert job.run_after >= before + timedelta(seconds=2 * jobs.JOB_RETRY_BASE_DELAY)
+
+
+def test_job_fails_after_max_attempts(db, handlers):
+    jobs.enqueue_job(db, "boom", {})
+    job = jobs.claim_next_job(db, "worker-1")
+    job.attempts = job.max_attempts
+    db.commit()
+
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.status == "failed"
+
+
+def test_stale_job_is_released_and_claimed_again(db):
+    jobs.enqueue_job(db, "ok", {})
+    job = jobs.claim_next_job(db, "crashed-worker")
+    job.heartbeat_at = datetime.utcnow() - timedelta(seconds=jobs.JOB_LOCK_TIMEOUT + 1)
+    db.commit()
+
+    claimed = jobs.claim_next_job(db, "worker-2")
+
+    assert claimed.id == job.id
+    assert claimed.locked_by == "worker-2"
+    assert claimed.attempts == 2
+
+
+def _take_over(job_id: int, worker_id: str):
+    """Een andere worker claimt de job, zoals na een verlopen heartbeat"""
+    other = SessionLocal()
+    other.query(Job).filter(Job.id == job_id).update({"locked_by": worker_id})
+    other.commit()
+    other.close()
+
+
+def test_taken_over_job_is_not_finished_by_old_worker(db, monkeypatch):
+    def slow(db, job):
+        _take_over(job.id, "worker-2")
+        return {"done": True}
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "slow", slow)
+    jobs.enqueue_job(db, "slow", {})
+    job = jobs.claim_next_job(db, "worker-1")
+
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.status == "running"
+    assert job.locked_by == "worker-2"
+    assert job.result is None
+
+
+def test_checkpoint_of_taken_over_job_raises_job_lost(db, monkeypatch):
+    def import_batches(db, job):
+        jobs._checkpoint(db, job, "worker-1", progress=20)
+        db.commit()
+        _take_over(job.id, "worker-2")
+        jobs._checkpoint(db, job, "worker-1", progress=40)
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "batches", import_batches)
+    jobs.enqueue_job(db, "batches", {})
+    job = jobs.claim_next_job(db, "worker-1")
+
+    jobs.run_job(db, job)
+
+    db.refresh(job)
+    assert job.progress == 20
+    assert job.status == "running"
+    assert job.locked_by == "worker-2"
+    assert job.last_error is None
+
+
+def test_heartbeat_thread_keeps_job_alive(db, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_INTERVAL", 0.01)
+    jobs.enqueue_job(db, "ok", {})
+    job = jobs.claim_next_job(db, "worker-1")
+    claimed_at = job.heartbeat_at
+
+    with jobs._Heartbeat(job.id, "worker-1"):
+        time.sleep(0.1)
+
+    db.refresh(job)
+    assert job.heartbeat_at > claimed_at
+
+
+def test_periodic_jobs_are_enqueued_once(db):
+    last_run = {}
+    jobs._schedule_periodic(db, last_run)
+    jobs._schedule_periodic(db, {})
+
+    kinds = [kind for (kind,) in db.query(Job.kind)]
+    assert sorted(kinds) == sorted(kind for kind, (interval, _) in jobs.PERIODIC_JOBS.items() if interval > 0)
@@ -0,0 +1,95 @@
+"""Profiling: alleen beheerders, X-Profile alleen met een echte waarde, geen andere requests in een profiel"""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import profiling
+from auth import create_access_token
+
+
+def cookie(username: str) -> bytes:
+    return f"access_token={create_access_token({'sub': username})}".encode()
+
+
+def scope(path: str = "/", headers: list = ()) -> dict:
+    return {
+        "type": "http", "method": "GET", "path": path, "query_string": b"",
+        "headers": list(headers), "root_path": "",
+    }
+
+
+@pytest.fixture
+def client():
+    import main
+
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("username, status_code", [(None, 401), ("alice", 403), ("admin", 200)])
+def test_profiles_page_is_admin_only(client, username, status_code):
+    if username:
+        client.cookies.set("access_token", create_access_token({"sub": username}))
+
+    assert client.get("/admin/profiles").status_code == status_code
+
+
+@pytest.mark.parametrize("username, value, expected", [
+    ("admin", b"1", "header"),
+    ("admin", b"true", "header"),
+    ("admin", b"0", None),
+    ("admin", b"", None),
+    ("alice", b"1", None),
+])
+def test_profile_header_trigger(username, value, expected):
+    headers = [(b"cookie", cookie(username)), (b"x-profile", value)]
+
+    assert profiling._trigger(scope("/movie/1", headers)) == expected
+
+
+def test_profile_pages_are_never_profiled():
+    headers = [(b"cookie", cookie("admin")), (b"x-profile", b"1")]
+
+    assert profiling._trigger(scope("/admin/profiles/abc", headers)) is None
+
+
+def busy_profiled():
+    started = time.perf_counter()
+    while time.perf_counter() - started < 0.03:
+        pass
+
+
+def busy_other():
+    started = time.perf_counter()
+    while time.perf_counter() - started < 0.03:
+        pass
+
+
+def test_concurrent_requests_stay_out_of_the_profile(monkeypatch):
+    async def app(scope, receive, send):
+        for _ in range(4):
+            busy_profiled() if scope["path"] == "/profiled" else busy_other()
+            await asyncio.sleep(0)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def run():
+        middleware = profiling.ProfilingMiddleware(app)
+        await asyncio.gather(
+            middleware(scope("/profiled"), None, send),
+            middleware(scope("/other"), None, send),
+        )
+
+    monkeypatch.setattr(profiling, "_trigger", lambda scope: "sample" if scope["path"] == "/profiled" else None)
+    asyncio.run(run())
+
+    profile = profiling.get_profile(profiling.recent_profiles()[0]["id"])
+    stacks = profile["stacks"]
+    assert profile["path"] == "/profiled"
+    assert any("busy_profiled" in stack for stack in stacks)
+    # Het andere request mag alleen als "(event loop)" meetellen
+    assert all(stack.startswith(profiling.EVENT_LOOP) for stack in stacks if "busy_other" in stack)
@@ -0,0 +1,37 @@
+"""Aanbevelingen: incrementele updates volgen wanneer wij interacties schreven"""
+from datetime import datetime
+
+import recommendations
+from models import MovieItem, MovieSimilarity, UserMovie
+
+
+def movies(db, *tmdb_ids) -> dict:
+    db.add_all([MovieItem(tmdb_id=tmdb_id, title=f"Film {tmdb_id}") for tmdb_id in tmdb_ids])
+    db.commit()
+    return dict(db.query(MovieItem.tmdb_id, MovieItem.id))
+
+
+def similar(db, tmdb_id: int) -> set:
+    return {row[0] for row in db.query(MovieSimilarity.similar_tmdb_id).filter(MovieSimilarity.tmdb_id == tmdb_id)}
+
+
+def test_import_with_old_watched_dates_triggers_incremental_update(db, make_user):
+    ids = movies(db, 1, 2, 3)
+    alice, bob = make_user("alice"), make_user("bob")
+    db.add_all([UserMovie(user_id=alice.id, movie_id=ids[tmdb_id], status="watched") for tmdb_id in (1, 2)])
+    db.commit()
+    recommendations.update_similarities(db, full=True)
+    assert similar(db, 1) == {2}
+
+    # Zoals de importer: added_at is de kijkdatum uit de export, ver voor de watermark
+    db.bulk_insert_mappings(UserMovie, [
+        {"user_id": bob.id, "movie_id": ids[tmdb_id], "status": "watched", "added_at": datetime(2015, 1, 1)}
+        for tmdb_id in (1, 3)
+    ])
+    db.commit()
+
+    result = recommendations.update_similarities(db)
+
+    assert result["full"] is False
+    assert result["movies"] > 0
+    assert similar(db, 1) == {2, 3}
@@ -0,0 +1,98 @@
+"""TMDB client: alleen een 404 is definitief, andere fouten worden later opnieuw geprobeerd; de cache warm houden"""
+import json
+import time
+
+import pytest
+import requests
+
+import jobs
+import tmdb
+from cache import shared_cache
+from models import Job, MovieItem, UserMovie
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, data: dict = None):
+        self.status_code = status_code
+        self.data = data
+        self.text = str(data)
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def tmdb_status(monkeypatch):
+    """Laat TMDB op elk request met de gegeven status antwoorden"""
+    responses = {"status": 200, "data": {}}
+    monkeypatch.setattr(
+        requests, "get",
+        lambda url, params=None, timeout=None: FakeResponse(responses["status"], responses["data"])
+    )
+    return responses
+
+
+def test_not_found_is_definitive(tmdb_status):
+    tmdb_status["status"] = 404
+
+    assert tmdb.tmdb_request("/movie/1", missing=tmdb.NOT_FOUND) is tmdb.NOT_FOUND
+    assert not shared_cache.get("tmdb:failures")
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 400])
+def test_other_client_errors_count_as_failure(tmdb_status, status_code):
+    tmdb_status["status"] = status_code
+
+    assert tmdb.tmdb_request("/movie/1", missing=tmdb.NOT_FOUND) is None
+    assert shared_cache.get("tmdb:failures") == 1
+
+
+def test_client_error_returns_stale_data(tmdb_status):
+    tmdb_status["status"] = 401
+    key = tmdb._cache_key("/movie/1", {})
+    shared_cache.set(key, {"data": {"id": 1, "title": "Oud"}, "fresh_until": time.time() - 1})
+
+    assert tmdb.tmdb_request("/movie/1", missing=tmdb.NOT_FOUND) == {"id": 1, "title": "Oud"}
+
+
+@pytest.fixture
+def pending_movie(db, make_user):
+    user = make_user("alice")
+    movie_item = MovieItem(tmdb_id=1, title="Alien")
+    db.add(movie_item)
+    db.flush()
+    db.add(UserMovie(user_id=user.id, movie_id=movie_item.id, status="watched"))
+    db.commit()
+    return movie_item
+
+
+def test_metadata_job_retries_after_rejected_api_key(db, tmdb_status, pending_movie):
+    tmdb_status["status"] = 401
+
+    result = jobs._run_movie_metadata(db, Job(kind="movie_metadata"))
+
+    db.refresh(pending_movie)
+    assert result["updated"] == 0 and result["missing"] == 0
+    assert pending_movie.metadata_fetched_at is None
+
+
+def test_metadata_job_marks_missing_movie(db, tmdb_status, pending_movie):
+    tmdb_status["status"] = 404
+
+    result = jobs._run_movie_metadata(db, Job(kind="movie_metadata"))
+
+    db.refresh(pending_movie)
+    assert result["missing"] == 1
+    assert pending_movie.metadata_fetched_at is not None
+
+
+@pytest.mark.parametrize("fresh_for, refreshed", [(60, True), (tmdb.TMDB_CACHE_TTL, False)])
+def test_warm_cache_refreshes_entries_close_to_expiry(tmdb_status, fresh_for, refreshed):
+    tmdb_status["data"] = {"results": ["nieuw"]}
+    key = tmdb._cache_key("/movie/popular", {})
+    shared_cache.set(key, {"data": {"results": ["oud"]}, "fresh_until": time.time() + fresh_for})
+
+    jobs._run_warm_cache(None, Job(kind="warm_cache", payload=json.dumps({"endpoints": ["/movie/popular"]})))
+
+    assert shared_cache.get(key)["data"]["results"] == (["nieuw"] if refreshed else ["oud"])
@@ -0,0 +1,237 @@
+import asyncio
+import math
+import os
+import time
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+from cache import shared_cache
+
+load_dotenv()
+
+# TMDB API Configuration
+TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
+TMDB_CACHE_TTL = int(os.getenv("TMDB_CACHE_TTL", "3600"))
+TMDB_STALE_TTL = int(os.getenv("TMDB_STALE_TTL", str(60 * 60 * 24)))
+
+# Rate limiting (gedeeld over alle workers via de shared cache)
+TMDB_RATE_LIMIT = int(os.getenv("TMDB_RATE_LIMIT", "40"))  # requests per window
+TMDB_RATE_WINDOW = int(os.getenv("TMDB_RATE_WINDOW", "1"))  # seconden
+TMDB_BACKGROUND_SHARE = float(os.getenv("TMDB_BACKGROUND_SHARE", "0.5"))
+TMDB_INTERACTIVE_MAX_WAIT = float(os.getenv("TMDB_INTERACTIVE_MAX_WAIT", "0.5"))
+TMDB_BACKGROUND_MAX_WAIT = float(os.getenv("TMDB_BACKGROUND_MAX_WAIT", "60"))
+
+# Timeouts en circuit breaker
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "3"))
+TMDB_BACKGROUND_TIMEOUT = float(os.getenv("TMDB_BACKGROUND_TIMEOUT", "10"))
+TMDB_BREAKER_THRESHOLD = int(os.getenv("TMDB_BREAKER_THRESHOLD", "5"))
+TMDB_BREAKER_COOLDOWN = int(os.getenv("TMDB_BREAKER_COOLDOWN", "30"))
+
+# Prioriteiten: pagina requests gaan voor op imports
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_BLOCKED_KEY = "tmdb:blocked_until"
+_FAILURES_KEY = "tmdb:failures"
+_CIRCUIT_KEY = "tmdb:circuit_open_until"
+_PROBE_KEY = "tmdb:circuit_probe"
+
+NOT_FOUND = object()  # zie tmdb_request(missing=...)
+
+
+def _cache_key(endpoint: str, params: dict) -> str:
+    # v2: waarde is {"data", "fresh_until"}; oude keys bevatten de kale response
+    return "tmdb:v2:" + endpoint + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+
+def _parse_retry_after(value) -> float:
+    """Retry-After kan een aantal seconden of een HTTP datum zijn"""
+    if not value:
+        return float(TMDB_RATE_WINDOW)
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return float(TMDB_RATE_WINDOW)
+
+
+def _acquire(priority: str) -> bool:
+    """Neem een token uit de gedeelde bucket, wacht hooguit de max wachttijd van de prioriteit
+
+    Achtergrondtaken mogen maar een deel van elke window gebruiken, zodat
+    pagina requests altijd ruimte overhouden.
+    """
+    if priority == BACKGROUND:
+        limit = max(1, int(TMDB_RATE_LIMIT * TMDB_BACKGROUND_SHARE))
+        deadline = time.time() + TMDB_BACKGROUND_MAX_WAIT
+    else:
+        limit = TMDB_RATE_LIMIT
+        deadline = time.time() + TMDB_INTERACTIVE_MAX_WAIT
+
+    while True:
+        now = time.time()
+        blocked_until = shared_cache.get(_BLOCKED_KEY) or 0
+        if blocked_until > now:
+            wait = blocked_until - now
+        else:
+            window = int(now // TMDB_RATE_WINDOW)
+            key = f"tmdb:rate:{window}"
+            if priority == BACKGROUND and (shared_cache.get(key) or 0) >= limit:
+                count = limit + 1
+            else:
+                count = shared_cache.incr(key, ttl=TMDB_RATE_WINDOW * 2)
+            if count <= limit:
+                return True
+            wait = (window + 1) * TMDB_RATE_WINDOW - now
+
+        if now + wait > deadline:
+            return False
+        time.sleep(wait)
+
+
+def _circuit_allows() -> bool:
+    """Gesloten circuit: alles mag. Open: niets. Na de cooldown: één proefrequest"""
+    open_until = shared_cache.get(_CIRCUIT_KEY)
+    if open_until is None:
+        return True
+    if open_until > time.time():
+        return False
+    return shared_cache.incr(_PROBE_KEY, ttl=TMDB_BREAKER_COOLDOWN) == 1
+
+
+def _record_success():
+    if shared_cache.get(_FAILURES_KEY) or shared_cache.get(_CIRCUIT_KEY) is not None:
+        shared_cache.delete(_FAILURES_KEY)
+        shared_cache.delete(_CIRCUIT_KEY)
+        shared_cache.delete(_PROBE_KEY)
+
+
+def _record_failure():
+    failures = shared_cache.incr(_FAILURES_KEY, ttl=TMDB_BREAKER_COOLDOWN * 2)
+    if failures >= TMDB_BREAKER_THRESHOLD or shared_cache.get(_CIRCUIT_KEY) is not None:
+        print(f"TMDB circuit breaker open voor {TMDB_BREAKER_COOLDOWN}s na {failures} fouten")
+        shared_cache.set(_CIRCUIT_KEY, time.time() + TMDB_BREAKER_COOLDOWN, ttl=TMDB_BREAKER_COOLDOWN * 10)
+        shared_cache.delete(_PROBE_KEY)
+
+
+def _wait_for_circuit(priority: str) -> bool:
+    """Pagina requests falen direct bij een open circuit, achtergrondtaken wachten"""
+    if _circuit_allows():
+        return True
+    if priority != BACKGROUND:
+        return False
+    deadline = time.time() + TMDB_BACKGROUND_MAX_WAIT
+    while time.time() < deadline:
+        open_until = shared_cache.get(_CIRCUIT_KEY) or 0
+        time.sleep(min(max(open_until - time.time(), 0.1), deadline - time.time(), 5))
+        if _circuit_allows():
+            return True
+    return False
+
+
+def tmdb_request(endpoint: str, params: dict = None, priority: str = INTERACTIVE, missing=None,
+                 refresh_within: float = 0):
+    """Helper functie voor TMDB API calls
+
+    Responses worden gedeeld gecached. Als TMDB traag is, een 429 geeft of
+    de circuit breaker open staat, wordt de laatst bekende (stale) data
+    teruggegeven, of None als die er niet is. Een 404 geeft `missing`; geef
+    NOT_FOUND mee om dat van een tijdelijke fout te onderscheiden. Andere
+    4xx (bijv. een ingetrokken API key) tellen als fout voor de circuit
+    breaker.
+
+    Met refresh_within (seconden) wordt een cache entry die binnen die tijd
+    verloopt nu al ververst; voor het warm houden van de cache.
+    """
+    if params is None:
+        params = {}
+
+    cache_key = _cache_key(endpoint, params)
+    cached = shared_cache.get(cache_key)
+    if cached is not None and cached["fresh_until"] > time.time() + refresh_within:
+        return cached["data"]
+    stale = cached["data"] if cached is not None else None
+
+    params["api_key"] = TMDB_API_KEY
+    timeout = TMDB_BACKGROUND_TIMEOUT if priority == BACKGROUND else TMDB_TIMEOUT
+    attempts = 3 if priority == BACKGROUND else 1
+
+    import requests  # lazy: kost ~50 ms bij het starten van elke worker
+
+    for _ in range(attempts):
+        if not _wait_for_circuit(priority):
+            return stale
+        if not _acquire(priority):
+            print(f"TMDB rate limit bereikt, {endpoint} overgeslagen")
+            return stale
+
+        try:
+            response = requests.get(f"{TMDB_BASE_URL}{endpoint}", params=params, timeout=timeout)
+        except requests.RequestException as e:
+            print(f"TMDB API Exception: {e}")
+            _record_failure()
+            continue
+
+        if response.status_code == 200:
+            data = response.json()
+            _record_success()
+            shared_cache.set(
+                cache_key,
+                {"data": data, "fresh_until": time.time() + TMDB_CACHE_TTL},
+                ttl=TMDB_STALE_TTL,
+            )
+            return data
+
+        print(f"TMDB API Error: {response.status_code} - {response.text}")
+        if response.status_code == 429:
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            shared_cache.set(_BLOCKED_KEY, time.time() + retry_after, ttl=math.ceil(retry_after) + 1)
+            _record_failure()
+        elif response.status_code >= 500:
+            _record_failure()
+        elif response.status_code == 404:
+            # Alleen een 404 is definitief
+            return missing
+        else:
+            # 401/403 en dergelijke: API key of configuratie, niet de film; opnieuw proberen helpt nu niet
+            _record_failure()
+            return stale
+
+    return stale
+
+
+async def tmdb_request_async(endpoint: str, params: dict = None, priority: str = INTERACTIVE, missing=None):
+    """tmdb_request voor async routes
+
+    Een verse cache hit komt direct terug; anders draait tmdb_request in een
+    thread, zodat wachten op de rate limiter, het circuit of TMDB zelf de
+    event loop (en daarmee alle andere requests van de worker) niet blokkeert.
+    """
+    cached = shared_cache.get(_cache_key(endpoint, params or {}))
+    if cached is not None and cached["fresh_until"] > time.time():
+        return cached["data"]
+    return await asyncio.to_thread(tmdb_request, endpoint, params, priority, missing)
+
+
+def movie_fields(movie: dict) -> dict:
+    """MovieItem kolommen uit een TMDB film (details of zoekresultaat)"""
+    if "genres" in movie:
+        genre_ids = [genre["id"] for genre in movie["genres"]]
+    else:
+        genre_ids = movie.get("genre_ids") or []
+    return {
+        "title": movie["title"],
+        "poster_path": movie.get("poster_path"),
+        "release_date": movie.get("release_date") or None,
+        "runtime": movie.get("runtime"),  # ontbreekt in zoekresultaten
+        "original_language": movie.get("original_language"),
+        "genre_ids": ",".join(str(genre_id) for genre_id in genre_ids),
+        "vote_average": movie.get("vote_average"),
+        "popularity": movie.get("popularity"),
+    }
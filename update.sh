@@ -1,12 +1,20 @@
 #!/bin/bash
 git pull origin main
-sudo docker rm -f moviespace
+sudo docker rm -f moviespace moviespace-worker
 sudo docker build -t moviespace-image .
 sudo docker run -d \
   --name moviespace \
   -p 127.0.0.1:8081:8080 \
   --env-file .env \
+  -e DATABASE_URL=sqlite:////app/data/moviespace.db \
   --restart always \
   -v $(pwd)/data:/app/data \
   moviespace-image
+sudo docker run -d \
+  --name moviespace-worker \
+  --env-file .env \
+  -e DATABASE_URL=sqlite:////app/data/moviespace.db \
+  --restart always \
+  -v $(pwd)/data:/app/data \
+  moviespace-image sh -c "python migrate.py && exec python jobs.py"
 echo "🚀 MovieSpace is succesvol geüpdatet!"